@@ -1,15 +1,15 @@
-import os
-from flask import Flask, Blueprint, request, jsonify, send_from_directory, safe_join
+import hmac
+from flask import (Flask, Blueprint, Response, abort, request, jsonify, stream_with_context)
 from flask import g
 from flask_restful import Api
 from flask_sqlalchemy import SQLAlchemy
 from flask_graphql import GraphQLView
-from sqlalchemy import create_engine
 from sqlalchemy_utils import database_exists, create_database
 from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
 from api.controllers.errors import custom_errors
 from api.controllers import auth
+from api import exports
 from api.models import User, Survey, Question, Answer, RangeOptions, Shift
 from config import Config, get_environment_config_str
 from graphene_file_upload.flask import FileUploadGraphQLView
@@ -17,7 +17,8 @@ from api.controllers.auth.decorators import login_required
 
 from api.data.surveys import initialize_survey_from_json
 
-from api.models import db
+from api.models import db, engine_options, pool_metrics, use_statement_timeout
+from api.models.pool import StatementTimeoutMiddleware
 
 def create_app():
     app = Flask(__name__)
@@ -51,8 +52,15 @@ def create_app():
     #     app.logger.debug("Created database {0}".format(app.config['DATABASE_NAME']))
 
     # app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'] + "/" + app.config['DATABASE_NAME']
+    # db.engine is the only engine, see api/models/pool.py
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     db.init_app(app)
 
+    @app.before_request
+    def set_statement_timeout():
+        # graphql operations set their own, see StatementTimeoutMiddleware
+        use_statement_timeout('request')
+
     @ app.before_first_request
     def initialize_database():
         """ Create db tables"""
@@ -78,21 +86,34 @@ def create_app():
     def graphql_endpoint():
         from api.schema import schema
         view = FileUploadGraphQLView.as_view(
-            "graphql", schema=schema, graphiql=True)
+            "graphql", schema=schema, graphiql=True,
+            middleware=[StatementTimeoutMiddleware()])
         return view
 
     # Serves static files
     @app.route('/exports/<string:fname>')
     def export_file(fname):
-        import shutil
-        print("EXPORT FILE ENDPOINT")
-        def delete_file():
-            print("downloaded. deleting file...")
-            os.remove(safe_join('/opt/data/exports', fname))
-        resp = send_from_directory('/opt/data/exports', fname)
-        # delete file after response object is made
-        delete_file()
-        return resp
+        """streams an export started by ExportJobs, see api/exports.py"""
+        manifest = exports.claim_export(fname)
+        if manifest is None:
+            abort(404)
+        print("streaming export", fname)
+        use_statement_timeout('export')
+        return Response(stream_with_context(exports.stream_export(manifest)),
+                        mimetype='application/zip',
+                        headers={'Content-Disposition': f'attachment; filename={fname}'})
+
+    @app.route('/metrics/db_pool')
+    def db_pool_metrics():
+        """this process's database pool utilization and checkout wait times.
+        Only for whoever has METRICS_TOKEN, sent as a bearer token."""
+        token = app.config['METRICS_TOKEN']
+        if not token:
+            abort(404)
+        given = request.headers.get('authorization', '').encode()
+        if not hmac.compare_digest(given, f'Bearer {token}'.encode()):
+            abort(401)
+        return jsonify(pool_metrics())
 
     app.add_url_rule(
         '/graphql',
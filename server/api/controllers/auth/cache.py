@@ -0,0 +1,89 @@
+# api/controllers/auth/cache.py
+# Caches for login_required, so authenticating a request usually doesn't need the database.
+#
+# verified_tokens maps the hash of each token we've verified to its user id, for a short
+# time and never past the token's expiry, so it isn't decoded again on every request.
+# known_users holds the ids of users we've seen in the database. It's per process, so
+# UnenrollAndDelete forgets the user in the process that deleted them straight away,
+# and every other process forgets them within AUTH_USER_CACHE_SECONDS.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from config import get_environment_config
+
+c = get_environment_config()
+
+
+class TTLCache(object):
+    """A thread-safe map with a bounded size, whose entries expire.
+
+    Args:
+        maxsize (int): most entries to keep. The least recently used are dropped first.
+        ttl (float): seconds an entry is kept for, unless it's set with a shorter ttl
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def remove_values(self, value):
+        """Removes every entry with this value"""
+        with self._lock:
+            for key in [k for k, (v, _) in self._entries.items() if v == value]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+verified_tokens = TTLCache(c.AUTH_TOKEN_CACHE_SIZE, c.AUTH_TOKEN_CACHE_SECONDS)
+known_users = TTLCache(c.AUTH_USER_CACHE_SIZE, c.AUTH_USER_CACHE_SECONDS)
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def forget_user(user_id):
+    """Stops authenticating a user from the caches, for when they're deleted"""
+    known_users.pop(user_id)
+    verified_tokens.remove_values(user_id)
+
+
+def clear_auth_caches():
+    verified_tokens.clear()
+    known_users.clear()
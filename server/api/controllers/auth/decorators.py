@@ -6,7 +6,9 @@ from flask import current_app
 from flask_restful import reqparse, abort, Resource
 from flask import Blueprint, request, jsonify, g
 from functools import wraps
+import time
 
+from api.controllers.auth.cache import known_users, token_key, verified_tokens
 from api.controllers.auth.utils import decode_jwt
 from api.controllers.errors import InvalidTokenError
 from api.models import User, db
@@ -15,6 +17,9 @@ from api.models import User, db
 def login_required(f):
     '''
     This decorator checks the header to ensure a valid token is set
+
+    Tokens we've verified recently and users we know exist are cached, see
+    api/controllers/auth/cache.py, so it usually doesn't query the database.
     '''
     @wraps(f)
     def func(*args, **kwargs):
@@ -22,17 +27,21 @@ def login_required(f):
             current_app.logger.error("No authorization header found.")
             raise InvalidTokenError()
         token = request.headers.get('authorization')
-        user_id = decode_jwt(token).get("payload")
+        key = token_key(token)
+        user_id = verified_tokens.get(key)
         if user_id is None:
-            current_app.logger.error("Token parsed to none")
-            raise InvalidTokenError()
-        # g.user = User.get(user_id)
-        g.user = db.session.query(User).get(user_id)
-        if g.user is None:
-            current_app.logger.error(
-                "Token corresponds to a user that doesn't exist: {}".format(user_id))
-            raise InvalidTokenError("Bad or expired authorization token")
-        else:
-            g.user = str(g.user)
+            decoded = decode_jwt(token)
+            user_id = decoded.get("payload")
+            if user_id is None:
+                current_app.logger.error("Token parsed to none")
+                raise InvalidTokenError()
+            verified_tokens.set(key, user_id, ttl=decoded["expires"] - time.time())
+        if not known_users.get(user_id):
+            if db.session.query(User.id).filter_by(id=user_id).first() is None:
+                current_app.logger.error(
+                    "Token corresponds to a user that doesn't exist: {}".format(user_id))
+                raise InvalidTokenError("Bad or expired authorization token")
+            known_users.set(user_id, True)
+        g.user = user_id
         return f(*args, **kwargs)
     return func
\ No newline at end of file
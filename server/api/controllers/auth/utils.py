@@ -53,10 +53,10 @@ def create_jwt(phone):
 
 
 def decode_jwt(token):
-    """decodes a token and returns ID associated (subject) if valid"""
+    """decodes a token and returns ID associated (subject) and its expiry (a unix time) if valid"""
     try:
         payload = jwt.decode(token.encode(), current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return {"isError": False, "payload": payload["sub"]}
+        return {"isError": False, "payload": payload["sub"], "expires": payload["exp"]}
     except jwt.ExpiredSignatureError as e:
         current_app.logger.error("Token expired.")
         raise ExpiredTokenError()
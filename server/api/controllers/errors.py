@@ -51,3 +51,7 @@ class ShiftInvalidError(Exception):
 
 class JobInvalidError(Exception):
     pass
+
+class DeadlineExceededError(ConnectionError):
+    """Raised when a call to an external service (e.g. OSRM) runs past its deadline"""
+    pass
@@ -0,0 +1,157 @@
+"""
+Streamed exports of a user's jobs, as a zip of a CSV and their screenshots.
+
+`ExportJobs` only checks which of the jobs it's asked for belong to the user, and
+saves their ids in a small manifest under EXPORTS_DIR, named by a random token.
+Downloading /exports/<token>.zip builds the zip while it's sent: jobs are read
+from a server-side cursor, screenshots straight from IMAGES_DIR, and the zip is
+written to the response in chunks, so an export never touches the disk and its
+memory use doesn't grow with its size. Each link can be downloaded once.
+"""
+import csv
+import io
+import json
+import os
+import re
+import secrets
+import zipfile
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import inspect
+
+from api.models import db, Job as JobModel, Screenshot as ScreenshotModel
+
+EXPORTS_DIR = '/opt/data/exports'
+IMAGES_DIR = '/opt/data/images'
+# bytes of zip to collect before sending them
+CHUNK_SIZE = 64 * 1024
+# rows fetched from the server-side cursors at a time
+YIELD_PER = 500
+# columns of a job that aren't exported
+EXCLUDED_COLUMNS = ['snapped_polyline', 'snapped_bbox', 'user_id']
+TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+def create_export(user_id, job_ids):
+    """Saves the manifest of an export of some of a user's jobs.
+
+    Args:
+        user_id (str): user exporting their jobs
+        job_ids (list): ids of the jobs to export. Ids of other users' jobs are dropped.
+
+    Returns:
+        str: the export's file name, to download from /exports/<file name>
+    """
+    ids = [str(id) for id, in (db.session.query(JobModel.id)
+                               .filter(JobModel.user_id == user_id,
+                                       JobModel.id.in_(job_ids)))]
+    token = secrets.token_hex(16)
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    with open(os.path.join(EXPORTS_DIR, f'{token}.json'), 'w') as f:
+        json.dump({'user_id': user_id, 'job_ids': ids,
+                   'date_created': datetime.now().isoformat()}, f)
+    return f'{token}.zip'
+
+
+def claim_export(fname):
+    """Reads and deletes the manifest of an export, so it's only downloaded once.
+
+    Returns:
+        dict: the manifest, or None if there isn't one for this file name
+    """
+    token, ext = os.path.splitext(fname)
+    if ext != '.zip' or not TOKEN_PATTERN.match(token):
+        return None
+    path = os.path.join(EXPORTS_DIR, f'{token}.json')
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        os.remove(path)
+    except FileNotFoundError:
+        return None
+    return manifest
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """An unseekable file that keeps what's written to it until it's drained"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.size += len(b)
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+def _csv_value(column, value):
+    from api.graphql.object import resolve_geom
+    if 'location' in column.name:
+        return resolve_geom(value) if value is not None else ''
+    return str(value)
+
+
+def stream_export(manifest, chunk_size=None):
+    """Generates the bytes of an export's zip, a chunk at a time.
+
+    Args:
+        manifest (dict): the export's manifest, from `claim_export`
+        chunk_size (int, optional): bytes to collect before each chunk. Defaults to CHUNK_SIZE.
+
+    Yields:
+        bytes: the next chunk of the zip
+    """
+    chunk_size = CHUNK_SIZE if chunk_size is None else chunk_size
+    user_id, job_ids = manifest['user_id'], manifest['job_ids']
+    columns = [c for c in inspect(JobModel).columns if c.name not in EXCLUDED_COLUMNS]
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        with zf.open('jobs.csv', 'w') as entry:
+            text = io.TextIOWrapper(entry, encoding='utf-8', newline='')
+            out = csv.writer(text)
+            out.writerow([c.name for c in columns])
+            rows = (db.session.query(*columns)
+                    .filter(JobModel.user_id == user_id, JobModel.id.in_(job_ids))
+                    .yield_per(YIELD_PER))
+            for row in rows:
+                out.writerow([_csv_value(c, v) for c, v in zip(columns, row)])
+                if buffer.size >= chunk_size:
+                    text.flush()
+                    yield buffer.drain()
+            text.flush()
+            # leave closing the entry to the zip file
+            text.detach()
+
+        screenshots = (db.session.query(ScreenshotModel.job_id, ScreenshotModel.img_filename)
+                       .filter(ScreenshotModel.user_id == user_id,
+                               ScreenshotModel.job_id.in_(job_ids))
+                       .yield_per(YIELD_PER))
+        for job_id, img_filename in screenshots:
+            # screenshots are only ever read from the images directory
+            name = os.path.basename(img_filename or '')
+            path = os.path.join(IMAGES_DIR, name)
+            if not name or not os.path.isfile(path):
+                current_app.logger.error(f'screenshot {img_filename} is missing, not exporting it')
+                continue
+            # images are already compressed
+            info = zipfile.ZipInfo(f'{job_id}/{name}', date_time=datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            info.external_attr = 0o644 << 16
+            with open(path, 'rb') as image, zf.open(info, 'w') as entry:
+                while True:
+                    data = image.read(chunk_size)
+                    if not data:
+                        break
+                    entry.write(data)
+                    if buffer.size >= chunk_size:
+                        yield buffer.drain()
+    yield buffer.drain()
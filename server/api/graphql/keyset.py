@@ -0,0 +1,148 @@
+"""
+Keyset ("seek") pagination for connections ordered by start time.
+
+Relay's default cursors are offsets, so the page after cursor N is found by
+skipping N rows, and deep pages get slower the further a user scrolls. Here a
+cursor holds the (start_time, id) of its row instead, and the next page is
+`WHERE (start_time, id) > (cursor) ORDER BY start_time, id LIMIT first + 1`,
+which the (user_id, start_time) indexes answer at the same cost on every page.
+
+Records without a start time sort after every other, as if it were infinity,
+which is where Postgres and its indexes put NULLs in either direction, and
+cursors compare them the same way.
+
+The total count is only queried if a connection's `totalCount` is selected.
+"""
+import json
+import uuid
+from datetime import datetime
+from graphene.relay import PageInfo
+from graphql import GraphQLError
+from graphql_relay.utils import base64, unbase64
+from sqlalchemy import and_, or_, tuple_
+
+PREFIX = 'keyset:'
+
+
+def encode_cursor(start_time, id):
+    return base64(PREFIX + json.dumps(
+        [start_time.isoformat() if start_time is not None else None, str(id)]))
+
+
+def decode_cursor(cursor):
+    """The (start_time, id) a cursor points to
+
+    Raises:
+        GraphQLError: if the cursor isn't a keyset cursor
+    """
+    try:
+        value = unbase64(cursor)
+        if not value.startswith(PREFIX):
+            raise ValueError(value)
+        start_time, id = json.loads(value[len(PREFIX):])
+        return (datetime.fromisoformat(start_time) if start_time is not None else None,
+                uuid.UUID(id))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise GraphQLError(f"Invalid cursor: {cursor}")
+
+
+def is_keyset_cursor(cursor):
+    try:
+        return unbase64(cursor).startswith(PREFIX)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return False
+
+
+def keyset_order(model, sort):
+    """Whether a sort can be paginated by keyset, and in which direction.
+
+    Sorting by start time, either way, can be. So can the default sort, by
+    primary key, which is replaced by start time ascending.
+
+    Args:
+        model (db.Model): model of the connection
+        sort: the connection's `sort` argument
+
+    Returns:
+        bool: True if descending, False if ascending, or None if the sort can't be
+        paginated by keyset
+    """
+    items = sort if isinstance(sort, (list, tuple)) else [sort]
+    names = [str(getattr(s, 'value', s)) for s in items if s is not None]
+    if names == [str(model.start_time.desc())]:
+        return True
+    if names in ([], [str(model.start_time.asc())],
+                 [str(c.asc()) for c in model.__mapper__.primary_key]):
+        return False
+    return None
+
+
+def _beyond(model, cursor, greater):
+    """Filters for rows whose (start_time, id) is greater, or less, than a cursor's,
+    with a NULL start time greater than any other"""
+    start_time, id = cursor
+    key = tuple_(model.start_time, model.id)
+    if greater:
+        if start_time is None:
+            return and_(model.start_time.is_(None), model.id > id)
+        return or_(model.start_time.is_(None), key > tuple_(start_time, id))
+    if start_time is None:
+        return or_(model.start_time.isnot(None),
+                   and_(model.start_time.is_(None), model.id < id))
+    return and_(model.start_time.isnot(None), key < tuple_(start_time, id))
+
+
+def paginate(connection_type, query, model, descending, args):
+    """Resolves a page of a connection by keyset.
+
+    Args:
+        connection_type (Connection): type of the connection
+        query (Query): unordered query for every node in the connection
+        model (db.Model): model of the nodes, with start_time and id columns
+        descending (bool): whether to order by start time descending
+        args (dict): the connection's relay arguments, first, last, before and after
+
+    Returns:
+        Connection: the page, with a `count_query` to resolve totalCount with
+    """
+    count_query = query
+    if args.get('after'):
+        query = query.filter(_beyond(model, decode_cursor(args['after']), not descending))
+    if args.get('before'):
+        query = query.filter(_beyond(model, decode_cursor(args['before']), descending))
+
+    up = [model.start_time.asc().nullslast(), model.id.asc()]
+    down = [model.start_time.desc().nullsfirst(), model.id.desc()]
+    forwards, backwards = (down, up) if descending else (up, down)
+    # the start time is selected alongside each node for its cursor, even if the
+    # node's own columns are limited to what the query selects
+    query = query.add_columns(model.start_time)
+    first, last = args.get('first'), args.get('last')
+    has_next_page = has_previous_page = False
+    if first is None and last is not None:
+        rows = query.order_by(*backwards).limit(last + 1).all()
+        has_previous_page = len(rows) > last
+        rows = rows[:last][::-1]
+    else:
+        query = query.order_by(*forwards)
+        rows = query.limit(first + 1).all() if first is not None else query.all()
+        if first is not None:
+            has_next_page = len(rows) > first
+            rows = rows[:first]
+        if last is not None:
+            has_previous_page = len(rows) > last
+            rows = rows[-last:] if last else []
+
+    edges = [connection_type.Edge(node=node, cursor=encode_cursor(start_time, node.id))
+             for node, start_time in rows]
+    connection = connection_type(
+        edges=edges,
+        page_info=PageInfo(
+            start_cursor=edges[0].cursor if edges else None,
+            end_cursor=edges[-1].cursor if edges else None,
+            has_previous_page=has_previous_page,
+            has_next_page=has_next_page))
+    connection.iterable = [node for node, _ in rows]
+    connection.length = None
+    connection.count_query = count_query
+    return connection
@@ -0,0 +1,109 @@
+"""
+Batched loading of one-to-many relationships for our GraphQL types.
+
+Resolving a relationship on every node of a list, like `jobs` on each shift in
+`allShifts`, lazy-loads it one parent at a time. Instead, resolvers ask the
+request's loader for their parent's key and get a Promise back. graphene
+resolves a whole level of the query before it resolves those promises, so each
+loader sees every key on that level at once, and loads all of their rows with
+one `WHERE <foreign key> IN (...)` query.
+
+Loaders live on `flask.g`, so each request gets its own. They don't cache
+rows between batches, so a mutation followed by a query in the same request
+never sees stale relationships.
+"""
+from collections import defaultdict
+from flask import g
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from api.models import (
+    Answer as AnswerModel,
+    Job as JobModel,
+    Location as LocationModel,
+    Screenshot as ScreenshotModel,
+    Shift as ShiftModel,
+    read_archived_locations,
+)
+
+
+class ForeignKeyLoader(DataLoader):
+    """Loads the rows of a model for a batch of foreign keys, with one query.
+
+    Args:
+        model (db.Model): model to load rows of
+        column (Column): foreign key column on `model` to look keys up by
+        criteria (list, optional): other filters on the rows
+        order_by (list, optional): order of the rows for each key
+    """
+
+    def __init__(self, model, column, criteria=(), order_by=()):
+        super().__init__(cache=False)
+        self.model = model
+        self.column = column
+        self.criteria = criteria
+        self.order_by = order_by
+
+    def batch_load_fn(self, keys):
+        rows = (self.model.query
+                .filter(self.column.in_(set(keys)), *self.criteria)
+                .order_by(*self.order_by)
+                .all())
+        by_key = defaultdict(list)
+        for row in rows:
+            by_key[getattr(row, self.column.key)].append(row)
+        return Promise.resolve([by_key.get(k, []) for k in keys])
+
+
+class ShiftLocationsLoader(ForeignKeyLoader):
+    """Loads the locations of a batch of shifts, reading archived shifts' from their archives"""
+
+    def __init__(self):
+        super().__init__(LocationModel, LocationModel.shift_id,
+                         order_by=[LocationModel.timestamp])
+
+    def batch_load_fn(self, keys):
+        def with_archived(locations):
+            archived = read_archived_locations([k for k, l in zip(keys, locations) if not l])
+            return [l or [LocationModel(shift_id=k, **a) for a in archived.get(k, [])]
+                    for k, l in zip(keys, locations)]
+        return super().batch_load_fn(keys).then(with_archived)
+
+
+def _loader(name, factory):
+    """The loader called `name` for this request, made with `factory` the first time"""
+    if '_loaders' not in g:
+        g._loaders = {}
+    if name not in g._loaders:
+        g._loaders[name] = factory()
+    return g._loaders[name]
+
+
+def shift_locations():
+    return _loader('shift_locations', ShiftLocationsLoader)
+
+
+def shift_jobs():
+    return _loader('shift_jobs', lambda: ForeignKeyLoader(
+        JobModel, JobModel.shift_id, order_by=[JobModel.start_time]))
+
+
+def shift_screenshots():
+    return _loader('shift_screenshots', lambda: ForeignKeyLoader(
+        ScreenshotModel, ScreenshotModel.shift_id))
+
+
+def job_screenshots():
+    return _loader('job_screenshots', lambda: ForeignKeyLoader(
+        ScreenshotModel, ScreenshotModel.job_id))
+
+
+def user_shifts():
+    return _loader('user_shifts', lambda: ForeignKeyLoader(
+        ShiftModel, ShiftModel.user_id, order_by=[ShiftModel.start_time]))
+
+
+def question_answers(user_id):
+    """Answers to each question by `user_id` only, see `QuestionNode.resolve_answers`"""
+    return _loader(('question_answers', user_id), lambda: ForeignKeyLoader(
+        AnswerModel, AnswerModel.question_id, criteria=[AnswerModel.user_id == user_id]))
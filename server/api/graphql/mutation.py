@@ -8,8 +8,6 @@ import json
 import base64
 import binascii
 import graphene
-from shutil import copy
-from sqlalchemy import inspect, and_
 from graphene import (
     Mutation,
     Float,
@@ -19,6 +17,7 @@ from graphene import (
     Boolean,
     List,
     ID,
+    Int,
     ObjectType,
     Enum
 )
@@ -44,7 +43,6 @@ from api.graphql.object import (
     JobNode,
     SurveyNode,
     AnswerNode,
-    resolve_geom
 )
 from api.models import (
     User as UserModel,
@@ -58,10 +56,16 @@ from api.models import (
     Geometry_WKT,
     EmployerNames,
     db,
-    Session
 )
+from api.controllers.auth.cache import forget_user
+from api.exports import create_export
+from api.models.location import claim_location_batch, insert_locations
+from api.models.location_archive import rehydrate_shift_locations
 from api.utils import generate_filename
-from api.routing.mapmatch import get_route_geometry
+from api.routing.mapmatch import get_route_geometry, get_route_geometries
+from api.routing.utils import clean_trajectory, load_locations, load_trajectory, simplify_trajectory
+from api.routing.osrmapi import Deadline
+from api.worker import enqueue_shift_processing, work
 from api.screenshots.parser import predict_app, image_to_df, parse_image
 from flask import current_app
 from api.controllers.errors import ShiftInvalidError, JobInvalidError
@@ -115,9 +119,10 @@ class CreateShift(Mutation):
         shift = ShiftModel(
             start_time=start_time, end_time=end_time, user_id=g.user, active=active
         )
-        for l in locations:
-            shift.locations.append(Location(l.timestamp, l.lng, l.lat))
         db.session.add(shift)
+        db.session.flush()
+        if locations:
+            insert_locations(shift.id, parse_location_inputs(locations))
         db.session.commit()
         return CreateShift(shift=shift)
 
@@ -147,14 +152,13 @@ class EndShift(Mutation):
             raise ShiftInvalidError(
                 "Shift not tracked - it was under 5 minutes.")
         else:
-            # calculate final mileage for this shift and create jobs
-            if (len(shift.locations) > 10):
-                shift = updateShiftMileageAndGeometry(shift, info)
-                createJobsFromLocations(shift, shift.locations, info)
-
             shift.end_time = end_time
             shift.active = False
             db.session.add(shift)
+            # final mileage for this shift and its jobs are calculated by a worker.
+            # See api/worker.py
+            if (shift.location_count > 10):
+                enqueue_shift_processing(shift)
             # Also end any stray active shifts. This mostly happens in development and testing
             stray_active_shifts = [s for s in db.session.query(
                 ShiftModel).filter_by(user_id=g.user, active=True)]
@@ -164,6 +168,8 @@ class EndShift(Mutation):
                 db.session.add(s)
             db.session.commit()
 
+            if c.TASK_QUEUE_EAGER:
+                work(burst=True)
             return EndShift(shift=shift)
 
 
@@ -238,21 +244,10 @@ class ExtractJobsFromShift(Mutation):
         shift_id = from_global_id(shift_id)[1]
         shift = (db.session.query(ShiftModel).filter_by(
             id=shift_id, user_id=g.user).first())
-        jobs = extractJobsFromLocations(shift, shift.locations)
-
-        # don't add any that overlap with existing jobs
-        added = []
-        overlaps = [list(JobModel.query.filter(and_(
-            JobModel.shift_id == shift.id,
-            JobModel.start_time <= j.end_time,
-            JobModel.end_time >= j.start_time))) for j in jobs]
-        for n, j in enumerate(jobs):
-            if not overlaps[n]:
-                db.session.add(j)
-                added.append(j)
-            else:
-                print("overlap:", [(j.start_time, j.end_time)
-                                   for j in overlaps[n]])
+        # a cold shift's locations are archived, see api/models/location_archive.py
+        rehydrate_shift_locations(shift.id)
+        jobs = extractJobsFromLocations(shift, Deadline(c.OSRM_DEADLINE))
+        added = addJobsWithoutOverlaps(shift, jobs)
         db.session.commit()
         return ExtractJobsFromShift(added)
 
@@ -277,12 +272,14 @@ class DeleteShift(Mutation):
             return DeleteShift(ok=True, message="Shift Deleted")
 
 
-def updateShiftMileageAndGeometry(shift, info):
+def updateShiftMileageAndGeometry(shift, info, deadline=None):
     """adds mileage and geometry to a shift object using one call to our mapmatch api"""
-    locs = sorted(shift.locations, key=lambda l: l.timestamp)
-    match_obj = get_route_geometry(locs)
+    locs = load_locations(shift.id)
+    if len(locs) < 2:
+        return shift
+    match_obj = get_route_geometry(clean_trajectory(locs), deadline)
     if not match_obj.result:
-        current_app.logger.error(f'Failed to match a route to shift...')
+        current_app.logger.error('Failed to match a route to shift...')
         current_app.logger.error(match_obj)
         return shift
 
@@ -297,28 +294,100 @@ def updateShiftMileageAndGeometry(shift, info):
     matched = {'geometries': geometries, 'bounding_box': bounding_box}
     current_app.logger.info('adding matched geometry to shift:')
     shift.snapped_geometry = matched
+    shift.snapped_trace = match_obj.result.trace
     shift.road_snapped_miles = distance
-    current_app.logger.info(f'matched route added to shift...')
+    shift.matched_until = locs.timestamp.iloc[-1].to_pydatetime()
+    current_app.logger.info('matched route added to shift...')
     return shift
 
 
-def extractJobsFromLocations(shift, locations):
-    """ Create job objects from a list of locations and a shift 
+def extendShiftMileageAndGeometry(shift, info, deadline=None):
+    """extends a shift's mileage and geometry with locations recorded since it was last matched.
+
+    Only the locations after `shift.matched_until`, plus a small overlap window of
+    already-matched locations, are loaded and sent to our mapmatch api, so the cost
+    of each update stays the same however long the shift runs. Falls back to
+    `updateShiftMileageAndGeometry` if the shift hasn't been matched yet.
+    """
+    from api.routing.mapmatch import get_incremental_route_geometry
+    if shift.matched_until is None or not shift.snapped_geometry:
+        return updateShiftMileageAndGeometry(shift, info, deadline)
+
+    tail = (LocationModel.query
+            .filter(LocationModel.shift_id == shift.id,
+                    LocationModel.timestamp > shift.matched_until)
+            .order_by(LocationModel.timestamp)
+            .all())
+    if len(tail) == 0:
+        return shift
+    overlap = (LocationModel.query
+               .filter(LocationModel.shift_id == shift.id,
+                       LocationModel.timestamp <= shift.matched_until)
+               .order_by(LocationModel.timestamp.desc())
+               .limit(c.INCREMENTAL_MATCH_OVERLAP)
+               .all())[::-1]
+
+    traj_df = clean_trajectory(overlap + tail)
+    anchor_index = int((traj_df.datetime <= shift.matched_until).sum()) - 1
+    if anchor_index < 0:
+        # every overlap point was filtered out, so we have nothing to stitch onto
+        return updateShiftMileageAndGeometry(shift, info, deadline)
+
+    bb = shift.snapped_geometry['bounding_box']
+    match_obj = get_incremental_route_geometry(
+        traj_df, anchor_index,
+        prefix_geometry=shift.snapped_geometry['geometries'],
+        prefix_distance=shift.road_snapped_miles or 0.,
+        prefix_bbox=[bb['minLng'], bb['minLat'], bb['maxLng'], bb['maxLat']],
+        prefix_trace=shift.snapped_trace,
+        deadline=deadline)
+    if not match_obj.result:
+        current_app.logger.error('Failed to extend route on shift...')
+        current_app.logger.error(match_obj)
+        return shift
+
+    bb = match_obj.result.bbox
+    bounding_box = {'minLat': bb[1],
+                    'minLng': bb[0],
+                    'maxLat': bb[3],
+                    'maxLng': bb[2]}
+    shift.snapped_geometry = {'geometries': match_obj.result.geometry,
+                              'bounding_box': bounding_box}
+    shift.snapped_trace = match_obj.result.trace
+    shift.road_snapped_miles = match_obj.result.distance
+    shift.matched_until = tail[-1].timestamp
+    current_app.logger.info('extended matched route on shift...')
+    return shift
+
+
+def extractJobsFromLocations(shift, deadline=None):
+    """ Create job objects from the locations recorded during a shift
+
+    Each trip's mileage and geometry are sliced out of the shift's own match when it
+    covers the trip confidently. The other trips are map-matched concurrently,
+    sharing `deadline`.
     """
     from api.routing.mapmatch import get_trips_from_locations, get_match_for_trajectory
 
-    if shift.end_time is not None:
-        locs = [l for l in locations if l.timestamp >=
-                shift.start_time and l.timestamp <= shift.end_time]
-    else:
-        locs = [l for l in locations if l.timestamp >= shift.start_time]
+    traj_df = load_trajectory(shift.id, shift.start_time, shift.end_time, simplify=False)
+    if len(traj_df) < 2:
+        return []
 
-    trips = get_trips_from_locations(locs)
+    trips = get_trips_from_locations(traj_df)
     jobs = []
 
     if len(trips) == 0:
         return jobs
-    for traj_df in trips['trajectories']:
+    shift_geometry = shift.snapped_geometry
+    sliced = [get_mileage_and_geometry_from_shift_match(
+        shift, t.iloc[0].datetime, t.iloc[-1].datetime, shift_geometry)
+        for t in trips['trajectories']]
+    to_match = [t for t, s in zip(trips['trajectories'], sliced) if s is None]
+    print("sliced {} of {} trips from the shift's match".format(
+        len(sliced) - len(to_match), len(sliced)))
+    match_objs = iter(get_route_geometries(
+        [simplify_trajectory(t) for t in to_match], deadline))
+    for traj_df, res in zip(trips['trajectories'], sliced):
         job = JobModel(
             start_location={
                 'lat': traj_df.iloc[0].lat, 'lng': traj_df.iloc[0].lng},
@@ -328,22 +397,26 @@ def extractJobsFromLocations(shift, locations):
             shift_id=shift.id,
         )
 
-        match_obj = get_route_geometry(traj_df)
-        try:
-            bb = match_obj.result.bbox
-            geometries = match_obj.result.geometry
-
-            bounding_box = {'minLat': bb[1],
-                            'minLng': bb[0],
-                            'maxLat': bb[3],
-                            'maxLng': bb[2]}
-            matched = {'geometries': geometries, 'bounding_box': bounding_box}
-            job.snapped_geometry = matched
-            job.mileage = match_obj.result.distance
-        except Exception as e:
-            print("Exception:", e)
-            job.snapped_geometry = None
-            job.mileage = 0.0
+        if res is not None:
+            job.snapped_geometry = res['geometry']
+            job.mileage = res['distance']
+        else:
+            match_obj = next(match_objs)
+            try:
+                bb = match_obj.result.bbox
+                geometries = match_obj.result.geometry
+
+                bounding_box = {'minLat': bb[1],
+                                'minLng': bb[0],
+                                'maxLat': bb[3],
+                                'maxLng': bb[2]}
+                matched = {'geometries': geometries, 'bounding_box': bounding_box}
+                job.snapped_geometry = matched
+                job.mileage = match_obj.result.distance
+            except Exception as e:
+                print("Exception:", e)
+                job.snapped_geometry = None
+                job.mileage = 0.0
 
         job.end_time = traj_df.iloc[-1].datetime
         job.start_time = traj_df.iloc[0].datetime
@@ -351,11 +424,37 @@ def extractJobsFromLocations(shift, locations):
     return jobs
 
 
-def createJobsFromLocations(shift, locations, info):
-    jobs = extractJobsFromLocations(shift, locations)
+def addJobsWithoutOverlaps(shift, jobs):
+    """Adds the jobs that don't overlap any job the shift already has. The caller commits.
+
+    We can only have one job during a certain time period, so existing jobs take
+    precedence, and extracting a shift's jobs again adds nothing.
+
+    Returns:
+        list: the jobs that were added
+    """
+    existing = (db.session.query(JobModel.start_time, JobModel.end_time)
+                .filter(JobModel.shift_id == shift.id,
+                        JobModel.start_time.isnot(None),
+                        JobModel.end_time.isnot(None))
+                .all())
+    added = []
     for j in jobs:
+        overlaps = [(start, end) for start, end in existing
+                    if start <= j.end_time and end >= j.start_time]
+        if overlaps:
+            print("overlap:", overlaps)
+            continue
         db.session.add(j)
-    db.session.commit()
+        added.append(j)
+    return added
+
+
+def createJobsFromLocations(shift, info, deadline=None):
+    """Extracts a shift's jobs and adds the ones it doesn't have yet. The caller commits,
+    so a task that's retried after it ran doesn't add them twice."""
+    jobs = extractJobsFromLocations(shift, deadline)
+    addJobsWithoutOverlaps(shift, jobs)
 
 
 class AddLocationsToShift(Mutation):
@@ -364,44 +463,65 @@ class AddLocationsToShift(Mutation):
     location = Field(lambda: Location,
                      description="latest location added to shift")
     ok = Field(lambda: Boolean)
+    new_count = Field(lambda: Int, description="number of locations that were added")
+    duplicate_count = Field(
+        lambda: Int, description="number of locations skipped because they were already uploaded")
 
     class Arguments:
         shift_id = ID(
             required=True, description="ID of the shift to add locations to")
         # locationinput should be lat,lng,timestamp
         locations = List(LocationInput)
+        batch_id = String(
+            required=False,
+            description="client-generated ID for this upload. Retrying a batch with the same ID adds nothing.")
 
     @login_required
-    def mutate(self, info, shift_id, locations):
-        from api.routing.mapmatch import clean_trajectory
+    def mutate(self, info, shift_id, locations, batch_id=None):
         shift_id = from_global_id(shift_id)[1]
         # ensure the user owns this shift
         shift = ShiftModel.query.filter_by(id=shift_id, user_id=g.user).first()
+        if not shift:
+            return AddLocationsToShift(location=None, ok=False)
 
-        for l in locations:
-            # turn it into seconds
-            time = datetime.fromtimestamp(float(l.timestamp) / 1000)
-            # if time is before the start time of this shift, drop it (don't add)
-            shift.locations.append(
-                LocationModel(
-                    time,
-                    l.lng,
-                    l.lat,
-                    shift_id,
-                )
-            )
+        rows = parse_location_inputs(locations)
+        if batch_id is not None and not claim_location_batch(shift.id, batch_id):
+            current_app.logger.info(f'skipping already uploaded batch {batch_id}')
+            db.session.rollback()
+            return AddLocationsToShift(location=None, ok=True,
+                                       new_count=0, duplicate_count=len(rows))
+        if not rows:
+            db.session.commit()
+            return AddLocationsToShift(location=None, ok=True, new_count=0, duplicate_count=0)
+        n_before = shift.location_count or 0
+        res = insert_locations(shift.id, rows)
+        n_locations = res.location_count
         # Every 5 locations added, update the distance on the shift by cleaning locations and map
         # matching.
-        n_locations = len(shift.locations)
-        if n_locations % 5 == 0 and n_locations > 2:
+        if n_locations // 5 > n_before // 5 and n_locations > 2:
             current_app.logger.info(
                 "Updating mileage & calculated route on shift...")
-            shift = updateShiftMileageAndGeometry(shift, info)
+            shift = extendShiftMileageAndGeometry(
+                shift, info, Deadline(c.OSRM_LOCATION_UPDATE_DEADLINE))
         db.session.add(shift)
         db.session.commit()
 
         # return last location
-        return AddLocationsToShift(location=shift.locations[-1], ok=True)
+        latest = max(rows, key=lambda r: r['timestamp'])
+        location = (LocationModel.query
+                    .filter_by(shift_id=shift.id, timestamp=latest['timestamp'])
+                    .first())
+        return AddLocationsToShift(location=location, ok=True,
+                                   new_count=res.new, duplicate_count=res.duplicates)
+
+
+def parse_location_inputs(locations):
+    """Converts LocationInputs, with timestamps in milliseconds, to dicts for `insert_locations`"""
+    return [{'timestamp': datetime.fromtimestamp(float(l.timestamp) / 1000),
+             'lng': l.lng,
+             'lat': l.lat,
+             'accuracy': l.accuracy}
+            for l in locations or []]
 
 
 class DeleteImage(Mutation):
@@ -557,20 +677,23 @@ class CreateJob(Mutation):
         return CreateJob(job=job, ok=True)
 
 
-def get_mileage_and_geometry_for_locations(locations):
+def get_mileage_and_geometry_for_locations(locations, deadline=None):
     """Computes the total mileage and a snapped-to-road geometry for a list of Location objects.
     Uses the OSRM API as configured in mapmatch.py and osrmapi.py.
 
     Args:
-        locations ([Location]): Locations to compute  geometry and distance from
+        locations ([Location] | TrajDataFrame): Locations to compute  geometry and distance from,
+            or a trajectory from `load_trajectory`
+        deadline (Deadline, optional): time budget for calls to OSRM
 
     Returns:
         [dict]: A dict with two keys: 'geometry', and 'distance', which 
         holds a geometry line string snapped to an OpenStreetMap road network, and 
         that line's total mileage, respectively.
     """
-    locs = sorted(locations, key=lambda l: l.timestamp)
-    match_obj = get_route_geometry(locs)
+    if isinstance(locations, list):
+        locations = sorted(locations, key=lambda l: l.timestamp)
+    match_obj = get_route_geometry(locations, deadline)
 
     if (not match_obj.result or match_obj.status == 'error'):
         current_app.logger.error("Failed to match a route to job...")
@@ -588,14 +711,55 @@ def get_mileage_and_geometry_for_locations(locations):
     return {'geometry': matched, 'distance': distance}
 
 
-def get_job_mileage_and_geometry(job, shift=None):
+def get_mileage_and_geometry_from_shift_match(shift, start_time, end_time, shift_geometry=None):
+    """Slices the mileage and snapped-to-road geometry between two times out of a shift's
+    own map match, using the trace kept with it.
+
+    Args:
+        shift (Shift): Shift to slice the match of
+        start_time (datetime): start of the slice
+        end_time (datetime): end of the slice
+        shift_geometry (dict, optional): the shift's decoded `snapped_geometry`, if we
+            already have it
+
+    Returns:
+        [dict]: A dict with 'geometry' and 'distance' keys, as from
+        `get_mileage_and_geometry_for_locations`, or None if the shift's match doesn't
+        cover the whole time range confidently.
+    """
+    from api.routing.trace import slice_trace
+    from api.routing.utils import bounding_box, meters_to_miles
+    if shift is None or not shift.snapped_trace:
+        return None
+    shift_geometry = shift_geometry or shift.snapped_geometry
+    if not shift_geometry:
+        return None
+    res = slice_trace(shift.snapped_trace, shift_geometry['geometries'],
+                      start_time, end_time)
+    if res is None:
+        return None
+    geometries, meters = res
+    bb = bounding_box(geometries)
+    matched = {'geometries': geometries,
+               'bounding_box': {'minLat': bb[1],
+                                'minLng': bb[0],
+                                'maxLat': bb[3],
+                                'maxLng': bb[2]}}
+    return {'geometry': matched, 'distance': meters_to_miles(meters)}
+
+
+def get_job_mileage_and_geometry(job, shift=None, deadline=None):
     """Compute the mileage and geometry for a given Job object using locations from
     it's associated Shift.
 
+    If the shift's own match covers the job confidently, the job's part of it is
+    sliced out instead of matching the job's locations again.
+
     Args:
         job (Job): Job to compute mileage and geometry for 
         shift (Shift, optional): Shift this job belongs to. Defaults to None. 
         Locations are retrieved from this shift.
+        deadline (Deadline, optional): time budget for calls to OSRM
 
     Returns:
         Job: the given Job object with snapped_geometry and distance fields replaced with newly
@@ -604,18 +768,20 @@ def get_job_mileage_and_geometry(job, shift=None):
     # don't need this - the shift id here is UUID
     # shift_id = from_global_id(job.shift_id)[1]
     print("getting mileage and geometry for job:", job, job.shift_id)
-    if shift is None:
-        shift = ShiftModel.query.get(job.shift_id)
-    # shift = db.session.get(job.shift_id)
+    shift_id = shift.id if shift is not None else job.shift_id
     # get only locations between job start and end from this shift
     end_time = job.end_time if job.end_time is not None else datetime.utcnow()
-    job_locations = [l for l in shift.locations if (
-        l.timestamp is not None
-        and l.timestamp >= job.start_time
-        and l.timestamp <= end_time)]
+    res = get_mileage_and_geometry_from_shift_match(
+        shift if shift is not None else job.shift, job.start_time, end_time)
+    if res is not None:
+        current_app.logger.info('adding geometry sliced from shift to job:')
+        job.snapped_geometry = res['geometry']
+        job.mileage = res['distance']
+        return job
+    job_locations = load_trajectory(shift_id, job.start_time, end_time)
     if len(job_locations) > 2:
         current_app.logger.info('adding matched geometry to job:')
-        res = get_mileage_and_geometry_for_locations(job_locations)
+        res = get_mileage_and_geometry_for_locations(job_locations, deadline)
         job.snapped_geometry = res['geometry']
         job.mileage = res['distance']
     return job
@@ -641,7 +807,8 @@ class EndJob(Mutation):
             db.session.delete(job)
             db.session.commit()
             raise JobInvalidError("Job not saved - it was under 5 minutes")
-        job = get_job_mileage_and_geometry(info, job)
+        job = get_job_mileage_and_geometry(
+            job, deadline=Deadline(c.OSRM_DEADLINE))
         if (job.mileage is None or job.mileage < 1):
             db.session.delete(job)
             db.session.commit()
@@ -743,11 +910,11 @@ def most_common_employer_or_none(jobs):
 
 
 def get_all_locations_from_jobs(jobs, start_time, end_time):
-    """Return a list of Location objects collected from each job in jobs.
+    """Return a trajectory of the locations collected from each job in jobs.
 
-    Pulls Location objects from each Job's associated Shift
+    Pulls locations from each Job's associated Shift, in one query.
 
-    Location list is sorted by timestamp.
+    The trajectory is sorted by timestamp.
 
     Args:
         jobs ([Job]): List of Job objects to pull locations from
@@ -755,20 +922,12 @@ def get_all_locations_from_jobs(jobs, start_time, end_time):
         end_time (DateTime): Includes only locations that were recorded before this time. 
 
     Returns:
-        [Location]: List of Location objects. 
+        TrajDataFrame: trajectory of the jobs' locations, as from `load_trajectory`
     """
-    import itertools
     import pandas as pd
     start_time, end_time = pd.to_datetime(start_time), pd.to_datetime(end_time)
     unique_shift_ids = set([job.shift_id for job in jobs])
-    shifts = [ShiftModel.query.get(shift_id) for shift_id in unique_shift_ids]
-    all_locations = list(itertools.chain(*[s.locations for s in shifts]))
-    sorted_locs = sorted(all_locations, key=lambda l: l.timestamp)
-    job_locations = [l for l in sorted_locs if (
-        l.timestamp is not None
-        and l.timestamp >= start_time
-        and l.timestamp <= end_time)]
-    return job_locations
+    return load_trajectory(list(unique_shift_ids), start_time, end_time)
 
 
 class DeleteJob(Mutation):
@@ -855,7 +1014,8 @@ class MergeJobs(Mutation):
                                                     newJob.start_time,
                                                     newJob.end_time)
 
-        res = get_mileage_and_geometry_for_locations(job_locations)
+        res = get_mileage_and_geometry_for_locations(
+            job_locations, Deadline(c.OSRM_DEADLINE))
 
         newJob.snapped_geometry = res['geometry']
         newJob.mileage = res['distance']
@@ -1000,6 +1160,7 @@ class UnenrollAndDelete(Mutation):
         user = UserModel.query.filter_by(id=user_id).first()
         db.session.delete(user)
         db.session.commit()
+        forget_user(user_id)
         return UnenrollAndDelete(True)
 
 
@@ -1014,55 +1175,12 @@ class ExportJobs(Mutation):
 
     @login_required
     def mutate(self, info, ids):
-        import csv
-        import zipfile
-        import shutil
-        user_id = g.user
+        """Starts an export of the user's jobs with these ids.
 
+        The export is built while it's downloaded from `file_url`, see api/exports.py.
+        """
         parsed_ids = [from_global_id(id)[1] for id in ids]
-        # job in Ids we're given, with user_id matching for authorization
-        records = (JobModel.query
-                   .filter_by(user_id=user_id)
-                   .filter(JobModel.id.in_(parsed_ids)))
-
-        columns = [column for column in inspect(JobModel).columns
-                   if column.name not in ['snapped_geometry', 'user_id']]
-
-        # collect screenshots
-        screenshots = ScreenshotModel.query.filter(
-            ScreenshotModel.job_id.in_(parsed_ids))
-
-        # copy screenshots to export dir, one subdirectory for each job
-        nowstr = datetime.now().strftime("%d-%m-%Y_%H-%M-%S")
-        export_dir = f'/opt/data/exports/{user_id}_{nowstr}'
-        os.makedirs(export_dir, exist_ok=True)
-        for s in screenshots:
-            print(str(s.job_id))
-            screenshot_export_dir = os.path.join(export_dir, str(s.job_id))
-            os.makedirs(screenshot_export_dir, exist_ok=True)
-            copy(s.img_filename, screenshot_export_dir)
-        outpath = os.path.join(export_dir, 'jobs.csv')
-        outfile = open(outpath, 'w')
-        outcsv = csv.writer(outfile)
-        # header row
-        outcsv.writerow([c.name for c in columns])
-        for curr in records:
-            row = []
-            for column in columns:
-                a = getattr(curr, column.name)
-                if 'location' in column.name:
-                    print("a:", a)
-                    row.append(resolve_geom(a))
-                else:
-                    row.append(str(a))
-            outcsv.writerow(row)
-        outfile.close()
-        # create zip file
-        zip_path = f"{export_dir}"
-        shutil.make_archive(zip_path, 'zip', export_dir)
-        # delete original dir, leaving only zip file
-        shutil.rmtree(export_dir)
-        zip_fname = os.path.basename(f"{zip_path}.zip")
+        zip_fname = create_export(g.user, parsed_ids)
         url = url_for('export_file', fname=zip_fname)
         return ExportJobs(ok=True,
                           message="Export Successful",
@@ -30,6 +30,8 @@ from functools import lru_cache
 from flask import g
 from graphene_sqlalchemy_filter import FilterSet, FilterableConnectionField
 from api.controllers.auth.decorators import login_required
+from api.graphql import keyset, loaders
+from api.graphql.selection import selected_fields, load_options
 
 graphene.Enum.from_enum = lru_cache(maxsize=None)(graphene.Enum.from_enum)
 
@@ -97,10 +99,41 @@ class FilterableAuthConnectionField(FilterableConnectionField):
         if (hasattr(model, 'user_id')):
             print("filtering", model, "by userid...")
             query = query.filter_by(user_id=str(g.user))
-        return query
+        # only load the columns and relationships this query selects
+        return query.options(*load_options(model, selected_fields(info), info.fragments))
+
+    @classmethod
+    def resolve_connection(cls, connection_type, model, info, args, resolved):
+        """Pages through shifts and jobs by keyset when they're sorted by start time.
+
+        Other models and sorts, and cursors from before keyset cursors, are paged by
+        offset as usual.
+        """
+        descending = keyset.keyset_order(model, args.get('sort')) \
+            if model in (ShiftModel, JobModel) else None
+        cursors = [args[a] for a in ('after', 'before') if args.get(a)]
+        if (resolved is not None or descending is None or
+                not all(keyset.is_keyset_cursor(c) for c in cursors)):
+            return super(FilterableAuthConnectionField, cls).resolve_connection(
+                connection_type, model, info, args, resolved)
+        query = cls.get_query(model, info, **dict(args, sort=None))
+        return keyset.paginate(connection_type, query, model, descending, args)
     ############################
 
 
+class CountableConnection(Connection):
+    """A connection with the total number of nodes in it, counted only if it's selected"""
+    class Meta:
+        abstract = True
+
+    total_count = graphene.Int()
+
+    def resolve_total_count(self, info):
+        if self.length is None:
+            self.length = self.count_query.order_by(None).count()
+        return self.length
+
+
 def resolve_geom(geom):
     shp = to_shape(geom)
     return {"lat": shp.y,
@@ -112,22 +145,52 @@ class User(SQLAlchemyObjectType):
         model = UserModel
         # interfaces = (relay.Node,)
 
+    def resolve_shifts(self, info, **kwargs):
+        return loaders.user_shifts().load(self.id)
+
+
+class ShiftStatus(graphene.Enum):
+    ACTIVE = 'ACTIVE'
+    QUEUED = 'QUEUED'
+    MATCHING = 'MATCHING'
+    EXTRACTING_JOBS = 'EXTRACTING_JOBS'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
 
 class ShiftNode(SQLAlchemyObjectType):
     class Meta:
         model = ShiftModel
         # interfaces = (graphene.Node, relay.Node)
         interfaces = (graphene.Node,)
+        # only used to slice job geometries out of the shift's match, and by workers
+        exclude_fields = ('snapped_trace', 'tasks')
+        connection_class = CountableConnection
         # connection_field_factory = FilterableAuthConnectionField.factory
         # interfaces = (relay.Node,)
 
+    snapped_geometry = graphene.JSONString(
+        description="Matched route as {geometries: [[lng, lat], ...], bounding_box}")
+    snapped_polyline = ORMField(
+        description="Matched route, polyline-encoded at 6 decimal places")
+    status = Field(lambda: ShiftStatus,
+                   description="Progress of the shift's processing after it ends")
+
+    def resolve_status(self, info):
+        return self.processing_status
+
     # resolve locations for this shift
     locations = graphene.List(lambda: Location)
 
     def resolve_locations(self, info):
-        query = Location.get_query(info=info)
-        query = query.filter(LocationModel.shift_id == self.id)
-        return query.all()
+        return loaders.shift_locations().load(self.id)
+
+    # relationships are loaded for every shift in a query at once, see loaders.py
+    def resolve_jobs(self, info, **kwargs):
+        return loaders.shift_jobs().load(self.id)
+
+    def resolve_screenshots(self, info, **kwargs):
+        return loaders.shift_screenshots().load(self.id)
 
 
 class JobNode(SQLAlchemyObjectType):
@@ -135,9 +198,17 @@ class JobNode(SQLAlchemyObjectType):
         model = JobModel
         interfaces = (graphene.Node,)
         connection_field_factory = FilterableAuthConnectionField.factory
+        connection_class = CountableConnection
 
     start_location = Field(Geometry_WKT)
     end_location = Field(Geometry_WKT)
+    snapped_geometry = graphene.JSONString(
+        description="Matched route as {geometries: [[lng, lat], ...], bounding_box}")
+    snapped_polyline = ORMField(
+        description="Matched route, polyline-encoded at 6 decimal places")
+
+    def resolve_screenshots(self, info, **kwargs):
+        return loaders.job_screenshots().load(self.id)
 
     # we don't need this because of our Geometry_WKT serializer.
     # although if we wanted parse-able
@@ -170,7 +241,7 @@ class QuestionNode (SQLAlchemyObjectType):
         print(self.select_options)
         return self.select_options
 
-    def resolve_answers(self, info):
+    def resolve_answers(self, info, **kwargs):
         """Custom resolver for question answers
 
         Resolves any answers query including questions to only include answers from the 
@@ -181,14 +252,11 @@ class QuestionNode (SQLAlchemyObjectType):
             info (graphene info): Graphene info object for query 
 
         Returns:
-            query: A query, filtered to include answers only with the user_id from 
-            this request's context, and the Id of this question node.
+            Promise: answers with the user_id from this request's context to this
+            question, loaded together with every other question's in the query.
 
         """
-        query = AnswerNode.get_query(info=info)
-        query = query.filter(AnswerModel.user_id == g.user,
-                             AnswerModel.question_id == self.id)
-        return query
+        return loaders.question_answers(g.user).load(self.id)
 
 class RangeOptionsNode (SQLAlchemyObjectType):
     class Meta:
@@ -267,6 +335,7 @@ class AnswerInput(graphene.InputObjectType):
 
 
 class WeeklySummary(graphene.ObjectType):
+    week_start = graphene.Date(description="Monday the week starts on")
     earnings = graphene.Float()
     expenses = graphene.Float()
     miles = graphene.Float()
@@ -275,4 +344,6 @@ class WeeklySummary(graphene.ObjectType):
     mean_pay = graphene.Float()
     total_pay = graphene.Float()
     total_tips = graphene.Float()
-    mean_tips = graphene.Float()
\ No newline at end of file
+    mean_tips = graphene.Float()
+    series = graphene.List(lambda: WeeklySummary,
+                           description="Summary of each week asked for, oldest first")
\ No newline at end of file
@@ -8,9 +8,6 @@ from dateutil import parser, relativedelta
 from datetime import datetime
 from graphql_relay.node.node import from_global_id
 from graphql import GraphQLError
-import itertools
-
-import numpy as np
 from flask import g
 
 # import numpy as np
@@ -19,6 +16,7 @@ from api.graphql.object import RangeOptionsNode, QuestionNode, AnswerNode, Surve
 from api.models import User as UserModel, Shift as ShiftModel, Job as JobModel, Location as LocationModel, Screenshot as ScreenshotModel, Geometry_WKT
 
 from api.graphql.stats import StatsQuery
+from api.graphql.stats.query import get_weekly_summaries
 # A good way of hacking together role authorization would be this, from here:
 # https://github.com/graphql-python/graphene-sqlalchemy/issues/137#issuecomment-582727580
 # Instead, we just use the SQLAlchemyConnectionField as an interface, and add a filter for user_id
@@ -29,7 +27,9 @@ class Query(StatsQuery, graphene.ObjectType):
 
     getTrips = graphene.Field(Trips)
     getActiveShift = graphene.Field(ShiftNode)
-    getWeeklySummary = graphene.Field(WeeklySummary)
+    getWeeklySummary = graphene.Field(
+        WeeklySummary, weeks=graphene.Int(
+            description="number of weeks up to this one to summarize in `series`"))
     getUserInfo = graphene.Field(User)
     getShiftScreenshots = graphene.Field(
         graphene.List(Screenshot), shiftId=graphene.ID())
@@ -80,42 +80,23 @@ class Query(StatsQuery, graphene.ObjectType):
         return ShiftModel.query.filter_by(active=True, user_id=userId).first()
 
     @login_required
-    def resolve_getWeeklySummary(self, info):
-        userId = str(g.user)
+    def resolve_getWeeklySummary(self, info, weeks=1):
         today = pendulum.now()
         dt_weekago = today.start_of('week')
         # dt_weekago = datetime.now() + relativedelta.relativedelta(weeks=-1)
-
-        shiftQuery = ShiftNode.get_query(info=info)
-        shifts = (shiftQuery
-                  .filter(ShiftModel.user_id == userId)
-                  .filter(
-                      ShiftModel.start_time > dt_weekago))
-        n_shifts = shifts.count()
-
-        jobs = list(itertools.chain(*[shift.jobs for shift in shifts]))
-        distances = [job.mileage for job in jobs]
-        distance_miles = sum(distances)
-
-        n_jobs = len(jobs)
-
-        total_pay = sum(
-            [job.total_pay for job in jobs if job.total_pay and job.total_pay != 0])
-        total_tips = sum([job.tip for job in jobs if job.tip and job.tip != 0])
-
-        mean_pay = np.mean(
-            [job.total_pay for job in jobs if job.total_pay and job.total_pay != 0])
-        mean_tip = np.mean(
-            [job.tip for job in jobs if job.tip and job.tip != 0])
-
-        print("returning weekly summary...", mean_tip or 0.)
-
-        return WeeklySummary(
-            miles=distance_miles,
-            num_shifts=n_shifts,
-            num_jobs=n_jobs,
-            # make sure we return 0 if mean pay or tip is NaN
-            mean_pay=mean_pay if not np.isnan(mean_pay) else 0.,
-            mean_tips=mean_tip if not np.isnan(mean_tip) else 0.,
-            total_pay=total_pay,
-            total_tips=total_tips)
+        first_week = dt_weekago.subtract(weeks=max(weeks, 1) - 1).date()
+
+        summaries = [dict(
+            week_start=s.week,
+            miles=s.mileage,
+            num_shifts=s.n_shifts,
+            num_jobs=s.n_jobs,
+            mean_pay=s.mean_pay,
+            mean_tips=s.mean_tip,
+            total_pay=s.pay,
+            total_tips=s.tip) for s in get_weekly_summaries(info, first_week, max(weeks, 1))]
+        print("returning weekly summary...", summaries[-1]['mean_tips'])
+
+        # this week, with every week asked for in `series`
+        return WeeklySummary(series=[WeeklySummary(**s) for s in summaries],
+                             **summaries[-1])
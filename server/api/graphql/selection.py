@@ -0,0 +1,141 @@
+"""
+Loader options for a query, read off the GraphQL selection set it resolves.
+
+A connection field like `allShifts` queries whole rows by default, including
+the matched geometry of every shift, even when the app only asks for times and
+pay. `load_options` turns the fields a query selects into SQLAlchemy options:
+`load_only` for the columns it needs, and `selectinload` for the relationships
+it selects that aren't already batched by a loader (see loaders.py), with the
+fields selected on them.
+
+Fields that aren't columns or relationships, like `snappedGeometry`, are
+mapped to the attributes they read in `FIELD_REQUIREMENTS`. If a query selects
+a field we don't know how to load, every column is loaded except the ones in
+`HEAVY_COLUMNS`.
+"""
+from graphene.utils.str_converters import to_snake_case
+from graphene_sqlalchemy.registry import get_global_registry
+from graphql.language import ast
+from sqlalchemy import inspect
+from sqlalchemy.orm import defer, load_only, selectinload
+
+from api.models import (
+    Consent as ConsentModel,
+    Job as JobModel,
+    Shift as ShiftModel,
+)
+
+# attributes read to resolve fields that aren't a column or relationship of their model
+FIELD_REQUIREMENTS = {
+    ShiftModel: {
+        'snapped_geometry': ['snapped_polyline', 'snapped_bbox'],
+        'status': ['active', 'tasks'],
+    },
+    JobModel: {
+        'snapped_geometry': ['snapped_polyline', 'snapped_bbox'],
+    },
+}
+
+# large columns that are only loaded when a query selects them
+HEAVY_COLUMNS = {
+    ShiftModel: ['snapped_polyline', 'snapped_bbox', 'snapped_trace'],
+    JobModel: ['snapped_polyline', 'snapped_bbox'],
+    ConsentModel: ['signature_encoded'],
+}
+
+CONNECTION_FIELDS = {'edges', 'pageInfo', 'totalCount', '__typename'}
+
+
+def _fields(selection_sets, fragments):
+    """Merges selection sets into a dict of field name: [selection sets of that field]"""
+    fields = {}
+    for selection_set in selection_sets:
+        if selection_set is None:
+            continue
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                fields.setdefault(selection.name.value, []).append(selection.selection_set)
+            elif isinstance(selection, ast.FragmentSpread):
+                fragment = fragments.get(selection.name.value)
+                if fragment is not None:
+                    for name, sets in _fields([fragment.selection_set], fragments).items():
+                        fields.setdefault(name, []).extend(sets)
+            elif isinstance(selection, ast.InlineFragment):
+                for name, sets in _fields([selection.selection_set], fragments).items():
+                    fields.setdefault(name, []).extend(sets)
+    return fields
+
+
+def _node_fields(fields, fragments):
+    """The fields selected on each node of a connection, or `fields` if it isn't one"""
+    if fields and set(fields) <= CONNECTION_FIELDS:
+        edges = _fields(fields.get('edges', []), fragments)
+        return _fields(edges.get('node', []), fragments)
+    return fields
+
+
+def selected_fields(info):
+    """Fields selected on the nodes a connection field resolves to.
+
+    Args:
+        info (graphene info): Graphene info object for the connection field
+
+    Returns:
+        dict: field name: [selection sets of that field]
+    """
+    fields = _fields([f.selection_set for f in info.field_asts], info.fragments)
+    return _node_fields(fields, info.fragments)
+
+
+def load_options(model, fields, fragments):
+    """Loader options that load what `fields` needs of `model`, and little else.
+
+    Args:
+        model (db.Model): model being queried
+        fields (dict): fields selected on it, as from `selected_fields`
+        fragments (dict): the query's fragment definitions, by name
+
+    Returns:
+        list: options for `model.query.options()`
+    """
+    mapper = inspect(model)
+    node_type = get_global_registry().get_type_for_model(model)
+    requirements = FIELD_REQUIREMENTS.get(model, {})
+    columns = {mapper.get_property_by_column(c).key for c in mapper.primary_key}
+    relationships = {}
+    all_known = True
+    for name, selection_sets in fields.items():
+        if name == '__typename':
+            continue
+        key = to_snake_case(name)
+        for attr in requirements.get(key, [key]):
+            if attr in mapper.column_attrs:
+                columns.add(attr)
+            elif attr in mapper.relationships:
+                # relationships with their own resolvers are batched by loaders, and
+                # only need the primary key
+                if hasattr(node_type, f'resolve_{attr}'):
+                    continue
+                if attr != key:
+                    # read by a computed field, so load whole rows
+                    relationships[attr] = None
+                elif relationships.get(attr, []) is not None:
+                    relationships.setdefault(attr, []).extend(selection_sets)
+                columns.update(mapper.get_property_by_column(c).key
+                               for c in mapper.relationships[attr].local_columns)
+            else:
+                all_known = False
+
+    if all_known:
+        options = [load_only(*[getattr(model, c) for c in sorted(columns)])]
+    else:
+        options = [defer(getattr(model, c)) for c in HEAVY_COLUMNS.get(model, [])
+                   if c not in columns]
+    for attr, selection_sets in sorted(relationships.items()):
+        loader = selectinload(getattr(model, attr))
+        if selection_sets is not None:
+            target = mapper.relationships[attr].mapper.class_
+            child_fields = _node_fields(_fields(selection_sets, fragments), fragments)
+            loader = loader.options(*load_options(target, child_fields, fragments))
+        options.append(loader)
+    return options
@@ -0,0 +1,154 @@
+"""
+This request's rows of the user_daily_stats rollup, shared by the stats resolvers.
+
+The app's dashboard asks for getNetPay, getWorkingTime and getDailyStats in one
+operation, over overlapping ranges. The first of them to run loads the user's
+rollup rows for every range the operation asks for, with one query, and each
+resolver then sums its own range from those rows in memory.
+
+The cache lives on `flask.g`, and only serves the operation it was loaded for, so
+it never outlives a request or sees rows from before a mutation. `hits` counts the
+resolvers whose range was already loaded, and `misses` the ones that had to
+query.
+"""
+import graphene
+import pendulum
+from datetime import timedelta
+from flask import g
+from graphql.language import ast
+
+from api.models import db, UserDailyStats
+
+COLUMNS = ['local_date', 'employer', 'pay', 'tip', 'mileage', 'job_seconds', 'n_jobs',
+           'n_paid_jobs', 'n_tipped_jobs', 'shift_seconds', 'n_shifts']
+
+
+class DailyStatsCache(object):
+    """A user's rollup rows between two dates, loaded once per request.
+
+    Args:
+        user_id (str): user to load rows of
+        operation (ast.OperationDefinition): GraphQL operation the rows are loaded for
+    """
+
+    def __init__(self, user_id, operation):
+        self.user_id = user_id
+        self.operation = operation
+        self.loaded = False
+        # dates the loaded rows are between. start is None if it's unbounded
+        self.start = None
+        self.end = None
+        self.rows = []
+        self.hits = 0
+        self.misses = 0
+
+    def covers(self, start, end):
+        return (self.loaded and end <= self.end and
+                (self.start is None or (start is not None and start >= self.start)))
+
+    def load(self, start, end):
+        filters = [UserDailyStats.user_id == self.user_id, UserDailyStats.local_date <= end]
+        if start is not None:
+            filters.append(UserDailyStats.local_date >= start)
+        self.rows = (db.session.query(*[getattr(UserDailyStats, c) for c in COLUMNS])
+                     .filter(*filters)
+                     .order_by(UserDailyStats.local_date)
+                     .all())
+        self.start, self.end, self.loaded = start, end, True
+
+    def rows_between(self, start, end, ranges=lambda: []):
+        """Rows from the start date to the end date, inclusive.
+
+        Args:
+            start (date): first date, or None for every date up to `end`
+            end (date): last date
+            ranges (function, optional): returns other (start, end) ranges to load
+                along with this one, if it isn't loaded yet
+
+        Returns:
+            list: rows with the attributes in COLUMNS, in date order
+        """
+        if self.covers(start, end):
+            self.hits += 1
+        else:
+            self.misses += 1
+            wanted = [(start, end)] + ranges()
+            if self.loaded:
+                wanted.append((self.start, self.end))
+            starts = [s for s, _ in wanted]
+            self.load(None if None in starts else min(starts), max(e for _, e in wanted))
+        return [r for r in self.rows
+                if (start is None or r.local_date >= start) and r.local_date <= end]
+
+
+def _arguments(info, field):
+    """A field's arguments in the operation, by name, with variables filled in"""
+    args = {}
+    for arg in field.arguments:
+        if isinstance(arg.value, ast.Variable):
+            args[arg.name.value] = info.variable_values.get(arg.value.name.value)
+        elif isinstance(arg.value, ast.IntValue):
+            args[arg.name.value] = int(arg.value.value)
+        else:
+            args[arg.name.value] = graphene.DateTime.parse_literal(arg.value)
+    return args
+
+
+def _top_level_fields(info, selection_set):
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.InlineFragment):
+            yield from _top_level_fields(info, selection.selection_set)
+        elif isinstance(selection, ast.FragmentSpread):
+            fragment = info.fragments.get(selection.name.value)
+            if fragment is not None:
+                yield from _top_level_fields(info, fragment.selection_set)
+
+
+def requested_ranges(info):
+    """The (start, end) dates of every stats field in this operation
+
+    Args:
+        info (graphene info): Graphene info object for any field of the operation
+
+    Returns:
+        list: (start date or None, end date) of each stats field
+    """
+    today = pendulum.now().date()
+    ranges = []
+    for field in _top_level_fields(info, info.operation.selection_set):
+        name = field.name.value
+        if name not in ('getNetPay', 'getWorkingTime', 'getDailyStats', 'getWeeklySummary'):
+            continue
+        args = _arguments(info, field)
+        if name == 'getWeeklySummary':
+            weeks = max(args.get('weeks') or 1, 1)
+            monday = today - timedelta(days=today.weekday())
+            ranges.append((monday - timedelta(weeks=weeks - 1), monday + timedelta(days=6)))
+        else:
+            start, end = args.get('startDate'), args.get('endDate')
+            ranges.append((start.date() if start else None, end.date() if end else today))
+    return ranges
+
+
+def get_daily_stats_cache(info):
+    """This request's cache of the current user's rows, for the operation `info` is from"""
+    cache = g.get('_daily_stats_cache')
+    if cache is None or cache.user_id != str(g.user) or cache.operation is not info.operation:
+        cache = g._daily_stats_cache = DailyStatsCache(str(g.user), info.operation)
+    return cache
+
+
+def daily_stats_between(info, start, end):
+    """This user's rollup rows from the start date to the end date, from the request's cache.
+
+    Args:
+        info (graphene info): Graphene info object for the resolver
+        start (date): first date, or None for every date up to `end`
+        end (date): last date
+
+    Returns:
+        list: rows with the attributes in COLUMNS, in date order
+    """
+    return get_daily_stats_cache(info).rows_between(start, end, lambda: requested_ranges(info))
@@ -1,116 +1,138 @@
-
 import graphene
 import pendulum
-import itertools
+from datetime import timedelta
 
-from flask import g
+from collections import defaultdict, namedtuple
 
-import numpy as np
 from api.controllers.auth.decorators import login_required
-from api.models import Job as JobModel, Shift as ShiftModel
-from api.graphql.object import JobNode, ShiftNode
 
-from .object import DailyStats, NetPay, DayStats, WorkingTime
+from .cache import daily_stats_between
+from .object import DailyStats, NetPay, WorkingTime
+from .utils import get_IRS_rate
 
 
-def get_jobs(info, start_date, end_date):
-    userId = str(g.user)
-    jobQuery = (JobNode.get_query(info=info)
-                .filter(JobModel.user_id == userId)
-                .filter(JobModel.end_time <= end_date)
-                )
-    if start_date:
-        jobQuery = jobQuery.filter(JobModel.start_time > start_date)
+# Everything here is summed from the user_daily_stats rollup (see
+# api/models/daily_stats.py), so a query's cost depends on the number of days in
+# its range, not the number of jobs. The rows are loaded once per request for every
+# stats field in the operation, and sliced for each resolver (see cache.py). Records
+# are in a range from start_date to end_date if they started on one of its dates.
 
-    return jobQuery.all()
+Totals = namedtuple('Totals', ['pay', 'tip', 'mileage', 'deduction',
+                               'job_seconds', 'shift_seconds'])
+WeekSummary = namedtuple('WeekSummary', ['week', 'n_shifts', 'n_jobs', 'mileage', 'pay',
+                                         'tip', 'mean_pay', 'mean_tip'])
 
 
-def get_shifts(info, start_date, end_date):
-    userId = str(g.user)
-    shiftQuery = (ShiftNode.get_query(info=info)
-                  .filter(ShiftModel.user_id == userId)
-                  .filter(ShiftModel.end_time <= end_date)
-                  )
-    if start_date:
-        shiftQuery = shiftQuery.filter(ShiftModel.start_time > start_date)
+def _rows(info, start_date, end_date):
+    return daily_stats_between(info, start_date.date() if start_date else None,
+                               end_date.date())
 
-    return shiftQuery.all()
 
+def _totals(rows):
+    return Totals(pay=sum(r.pay for r in rows),
+                  tip=sum(r.tip for r in rows),
+                  mileage=sum(r.mileage for r in rows),
+                  deduction=sum(r.mileage * get_IRS_rate(r.local_date.year) for r in rows),
+                  job_seconds=sum(r.job_seconds for r in rows),
+                  shift_seconds=sum(r.shift_seconds for r in rows))
 
-def _agg_mileage_by_day(records):
-    """Aggregate mileage by day
 
-    Args:
-        records ([{start_time: datetime, end_time: datetime, mileage: Float}]): Records of shifts or jobs + mileage
+def _by_date(rows, key=lambda d: d):
+    grouped = defaultdict(list)
+    for r in rows:
+        grouped[key(r.local_date)].append(r)
+    return grouped
+
+
+def get_totals(info, start_date, end_date):
+    """Totals for this user's jobs and shifts from start_date to end_date
 
     Returns:
-        [{day: datetime (date), hrs: Float (hours)}]: Daily record of aggregate hours, or [] if no records.
+        Totals: pay, tip, mileage, deduction, job_seconds and shift_seconds
     """
-    import pandas as pd
-    df = pd.DataFrame(records)
-    if len(df) == 0:
-        return []
-    df['hrs'] = [d.seconds / 3600 for d in (df.end_time - df.start_time)]
-    df['date'] = df['start_time'].dt.date
-    agged = df.groupby('date').agg(
-        {'mileage': sum, 'hrs': lambda h: min(sum(h), 24)}).reset_index()
-    shift_hours_by_day = agged[['date', 'hrs']].to_dict(orient='records')
-    return shift_hours_by_day
+    return _totals(_rows(info, start_date, end_date))
 
 
-def _get_shift_hours_daily(shifts):
-    """Returns a list of records detailing the date and number of hours "clocked in" to a shift.
+def get_daily_totals(info, first_day, n_days):
+    """Totals for this user's jobs and shifts on each of `n_days` days
 
     Args:
-        shifts (List(Shift)): List of shifts to calculate for
+        info (graphene info): Graphene info object for the resolver
+        first_day (date): the first day
+        n_days (int): number of days
 
     Returns:
-        # of hours clocked
-        [{date: Datetime, hrs: Float}]: Records for each day the user clocked in detailing total
+        list: Totals for each day, in order
     """
-    shift_dicts = [{'start_time': s.start_time, 'end_time': s.end_time,
-                    'mileage': s.road_snapped_miles} for s in shifts]
-    return _agg_mileage_by_day(shift_dicts)
+    last_day = first_day + timedelta(days=n_days - 1)
+    by_day = _by_date(daily_stats_between(info, first_day, last_day))
+    return [_totals(by_day[first_day + timedelta(days=n)]) for n in range(n_days)]
 
 
-def _get_job_hours_daily(jobs):
-    """Returns a list of records detailing the date and number of hours tracked for jobs
+def get_weekly_summaries(info, first_week, n_weeks):
+    """Counts, totals and averages of this user's shifts and jobs in each of `n_weeks` weeks.
+
+    Average pay and tip are over jobs with a non-zero pay or tip, and 0 if there
+    aren't any.
 
     Args:
-        shifts (List(Job)): List of jobs to calculate for
+        info (graphene info): Graphene info object for the resolver
+        first_week (date): the Monday the first week starts on
+        n_weeks (int): number of weeks
 
     Returns:
-        # of hours spent on a job.
-        [{date: Datetime, hrs: Float}]: Records for each day the user worked, detailing total
+        list: WeekSummary for each week, in order
     """
-    job_dicts = [{'start_time': j.start_time, 'end_time': j.end_time,
-                  'mileage': j.mileage} for j in jobs]
-    return _agg_mileage_by_day(job_dicts)
-
-
-def get_total_time(shifts_or_jobs):
-    return [(s.end_time - s.start_time).seconds / 3600 for s in shifts_or_jobs] if len(shifts_or_jobs) > 0 else [0]
+    weeks = [first_week + timedelta(weeks=n) for n in range(n_weeks)]
+    rows = daily_stats_between(info, first_week, weeks[-1] + timedelta(days=6))
+    by_week = _by_date(rows, key=lambda d: d - timedelta(days=d.weekday()))
+    summaries = []
+    for week in weeks:
+        days = by_week[week]
+        pay, tip = sum(r.pay for r in days), sum(r.tip for r in days)
+        n_paid, n_tipped = sum(r.n_paid_jobs for r in days), sum(r.n_tipped_jobs for r in days)
+        summaries.append(WeekSummary(week=week,
+                                     n_shifts=sum(r.n_shifts for r in days),
+                                     n_jobs=sum(r.n_jobs for r in days),
+                                     mileage=sum(r.mileage for r in days),
+                                     pay=pay,
+                                     tip=tip,
+                                     mean_pay=pay / n_paid if n_paid else 0.,
+                                     mean_tip=tip / n_tipped if n_tipped else 0.))
+    return summaries
+
+
+def get_hours_daily(rows, seconds, count):
+    """Returns a list of records with the date and hours worked on that date.
+
+    Each day's hours are capped at 24.
 
+    Args:
+        rows (list): rollup rows, as from `daily_stats_between`
+        seconds (str): 'job_seconds' or 'shift_seconds'
+        count (str): 'n_jobs' or 'n_shifts'
 
-def _get_stats_for_day(info, date):
-    from .utils import get_mileage_deduction
-    start_date = pendulum.instance(date).start_of('day')
-    end_date = pendulum.instance(date).end_of('day')
-    jobs = get_jobs(info, start_date, end_date)
-    shifts = get_shifts(info, start_date, end_date)
-    deduction = get_mileage_deduction(jobs)
-    tip = sum(filter(None, [j.tip for j in jobs]))
-    pay = sum(filter(None, [j.total_pay for j in jobs]))
-    miles = sum(filter(None, [j.mileage for j in jobs]))
-    total_shift_time = sum(get_total_time(shifts))
-    total_job_time = sum(get_total_time(jobs))
-
+    Returns:
+        [{date: date, hrs: Float}]: Daily record of total hours, only for dates with records
+    """
+    hours = []
+    for date, days in sorted(_by_date(rows).items()):
+        if sum(getattr(r, count) for r in days) > 0:
+            hours.append({'date': date,
+                          'hrs': min(sum(getattr(r, seconds) for r in days) / 3600, 24)})
+    return hours
+
+
+def _day_stats(date, totals):
+    pay, tip, deduction = totals.pay, totals.tip, totals.deduction
+    total_job_time = totals.job_seconds / 3600
+    total_shift_time = totals.shift_seconds / 3600
     return {
         "date": date,
         "base_pay": pay,
         "tip": tip,
         "expenses": deduction,
-        "mileage": miles,
+        "mileage": totals.mileage,
         "active_time": total_job_time,
         "clocked_in_time": total_shift_time,
         "hourly_pay_active": (pay + tip - deduction) / total_job_time if total_job_time > 0 else 0,
@@ -129,40 +151,30 @@ class StatsQuery(graphene.ObjectType):
 
     @login_required
     def resolve_getDailyStats(self, info, start_date=None, end_date=pendulum.now()):
-        import datetime
-        days = [start_date + datetime.timedelta(days=x)
+        days = [start_date + timedelta(days=x)
                 for x in range((end_date-start_date).days + 1)]
-        daily_stats = [_get_stats_for_day(info, day) for day in days]
+        totals = get_daily_totals(info, start_date.date(), len(days))
+        daily_stats = [_day_stats(day, t) for day, t in zip(days, totals)]
         return DailyStats(n_days=len(daily_stats), data=daily_stats)
 
     @login_required
     def resolve_getNetPay(self, info, start_date=None, end_date=pendulum.now()):
         """Returns net pay for a given time period, from start_date to end_date.
 
-        TODO: Test. To test, need to add pay and tip to jobs in fixtures, then test date range calculation.
-
         Args:
             info ([type]): [description]
             start_date (date, optional): DateTime specifying start date. Defaults to start of current week.
             end_date (date, optional): DateTime specifying end date. Defaults to now.
         """
-        from .utils import get_mileage_deduction
-        jobs = get_jobs(info, start_date, end_date)
-        shifts = get_shifts(info, start_date, end_date)
-        deduction = get_mileage_deduction(jobs)
-        tip = sum(filter(None, [j.tip for j in jobs]))
-        pay = sum(filter(None, [j.total_pay for j in jobs]))
-        total_shift_time = get_total_time(shifts)
-        total_job_time = get_total_time(jobs)
-
+        totals = get_totals(info, start_date, end_date)
         return NetPay(
             start_date=start_date,
             end_date=end_date,
-            mileage_deduction=deduction,
-            tip=tip,
-            pay=pay,
-            clocked_in_time=sum(total_shift_time),
-            job_time=sum(total_job_time)
+            mileage_deduction=totals.deduction,
+            tip=totals.tip,
+            pay=totals.pay,
+            clocked_in_time=totals.shift_seconds / 3600,
+            job_time=totals.job_seconds / 3600
         )
 
     @login_required
@@ -179,17 +191,13 @@ class StatsQuery(graphene.ObjectType):
             job_time: total time on tracked jobs
             shift_hours_daily: a list of dicts, in the form {date, hrs}, detailing the date and number of hours "clocked in", respectively.
         """
-        import pandas as pd
         print("Getting working time from ", start_date, end_date)
-        jobs = get_jobs(info, start_date, end_date)
-        shifts = get_shifts(info, start_date, end_date)
-        total_shift_time = get_total_time(shifts)
-        total_job_time = get_total_time(jobs)
-
+        rows = _rows(info, start_date, end_date)
+        totals = _totals(rows)
         return WorkingTime(
-            clocked_in_time=sum(total_shift_time),
-            job_time=sum(total_job_time),
-            shift_hours_daily=_get_shift_hours_daily(shifts),
-            job_hours_daily=_get_job_hours_daily(jobs),
+            clocked_in_time=totals.shift_seconds / 3600,
+            job_time=totals.job_seconds / 3600,
+            shift_hours_daily=get_hours_daily(rows, 'shift_seconds', 'n_shifts'),
+            job_hours_daily=get_hours_daily(rows, 'job_seconds', 'n_jobs'),
             start_date=start_date,
             end_date=end_date)
@@ -25,3 +25,4 @@ def get_mileage_deduction(jobs):
     deduction = sum(
         [(job.mileage or 0) * get_IRS_rate(job.start_time.year or 2021) for job in jobs])
     return deduction
+
@@ -1,14 +1,11 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 from geoalchemy2 import func, Geometry
 import graphene_sqlalchemy as gsqa
 import graphene
 import enum
+import json
+from graphql.language import ast
 
-from config import get_environment_config
-
-config = get_environment_config()
 db = SQLAlchemy()
 
 # using uuids like https://stackoverflow.com/questions/183042/how-can-i-use-uuids-in-sqlalchemy
@@ -33,27 +30,49 @@ class EmployerNames(enum.Enum):
     GRUBHUB = "GRUBHUB"
     UBEREATS = "UBEREATS"
 
-engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
-Session = sessionmaker(engine)
-# have to import scalar from engine, not db....
+from .geometry import from_geojson, from_wkt, to_geojson, to_wkt
+
 
 class Geometry_WKT(graphene.Scalar):
-    """Geometry WKT custom type."""
+    """Geometry WKT custom type.
+
+    Converted to and from WKT in process with shapely, so serializing a value
+    doesn't need a database round trip.
+    """
 
     name = "Geometry WKT"
 
     @staticmethod
     def serialize(geom):
-        return engine.scalar(geom.ST_AsText())
+        return to_wkt(geom)
+
+    @staticmethod
+    def parse_literal(node):
+        if isinstance(node, ast.StringValue):
+            return from_wkt(node.value)
+
+    @staticmethod
+    def parse_value(value):
+        return from_wkt(value)
+
+
+class Geometry_GeoJSON(graphene.Scalar):
+    """Geometry as a GeoJSON geometry object, converted in process with shapely."""
+
+    name = "GeometryGeoJSON"
+
+    @staticmethod
+    def serialize(geom):
+        return to_geojson(geom)
 
     @staticmethod
     def parse_literal(node):
-        if isinstance(node, gsqa.language.ast.StringValue):
-            return engine.scalar(func.ST_GeomFromText(node.value))
+        if isinstance(node, ast.StringValue):
+            return from_geojson(json.loads(node.value))
 
     @staticmethod
     def parse_value(value):
-        return engine.scalar(func.ST_GeomFromText(value))
+        return from_geojson(json.loads(value) if isinstance(value, str) else value)
 
 
 @gsqa.converter.convert_sqlalchemy_type.register(Geometry)
@@ -70,6 +89,10 @@ from .user import User
 from .job import Job
 from .consent import Consent
 from .screenshot import Screenshot
-from .location import Location
+from .location import Location, LocationBatch, create_location_partitions
 from .survey import RangeOptions, Question, Survey, Answer, QuestionTypeEnum
-
+from .task import Task, TaskKind, TaskStatus
+from .daily_stats import UserDailyStats, refresh_daily_stats, rebuild_daily_stats
+from .pool import engine_options, pool_metrics, use_statement_timeout
+from .location_archive import (LocationArchive, archive_cold_shifts, read_archived_locations,
+                               rehydrate_shift_locations)
@@ -18,4 +18,5 @@ class Consent(db.Model):
     interview=db.Column(Boolean, nullable=True)
     consented=db.Column(Boolean, default=False)
     signature_filename = db.Column(db.String)
-    signature_encoded = db.Column(db.String)
+    # a whole image, only loaded when it's used
+    signature_encoded = db.deferred(db.Column(db.String))
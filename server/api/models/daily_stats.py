@@ -0,0 +1,225 @@
+from . import db
+from datetime import date, timedelta
+from sqlalchemy import (BigInteger, Date, Float, Integer, String, and_, case, cast, event,
+                        func, inspect, literal, or_, select, true, tuple_, union_all)
+from sqlalchemy.dialects.postgresql import insert
+
+from .user import User
+from .shift import Shift
+from .job import Job
+
+
+class UserDailyStats(db.Model):
+    """A user's pay, miles and time for one day and employer, summed from their jobs and shifts.
+
+    Records are bucketed by the date they start on, in the timezone our timestamps are
+    stored in. Shifts don't have a single employer, so their time is kept in the row
+    with an empty employer. Rows are kept up to date by `refresh_daily_stats` whenever
+    a job or shift changes (see the session hooks below), and can be rebuilt from
+    scratch with `python run.py rebuild_daily_stats`.
+    """
+    __tablename__ = "user_daily_stats"
+
+    user_id = db.Column(db.String, db.ForeignKey(User.id, ondelete='CASCADE'),
+                        primary_key=True)
+    local_date = db.Column(Date, primary_key=True)
+    # name of an EmployerNames, or '' for jobs without an employer and for shifts
+    employer = db.Column(String, primary_key=True)
+
+    pay = db.Column(Float, nullable=False, default=0)
+    tip = db.Column(Float, nullable=False, default=0)
+    mileage = db.Column(Float, nullable=False, default=0)
+    job_seconds = db.Column(Float, nullable=False, default=0)
+    n_jobs = db.Column(Integer, nullable=False, default=0)
+    # jobs with a non-zero pay and tip, for averages
+    n_paid_jobs = db.Column(Integer, nullable=False, default=0)
+    n_tipped_jobs = db.Column(Integer, nullable=False, default=0)
+    shift_seconds = db.Column(Float, nullable=False, default=0)
+    n_shifts = db.Column(Integer, nullable=False, default=0)
+    date_modified = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"Stats for user {self.user_id} on {self.local_date} at '{self.employer}'"
+
+
+def duration_seconds(model):
+    """SQL expression for the seconds a record lasted, as timedelta.seconds counts them.
+
+    That's whole seconds, modulo a day, so records that last more than a day
+    count the same as they always have. Records that haven't ended count 0.
+    """
+    elapsed = func.floor(func.extract('epoch', model.end_time - model.start_time))
+    seconds = func.mod(func.mod(cast(elapsed, BigInteger), 86400) + 86400, 86400)
+    return func.coalesce(cast(seconds, Float), 0)
+
+
+def _nonzero(column):
+    return case((func.coalesce(column, 0) != 0, 1), else_=0)
+
+
+def _on_days(model, user_days):
+    """Filters for `model`'s records that start on any of the (user_id, date)s in user_days"""
+    return or_(*[and_(model.user_id == user_id,
+                      model.start_time >= day,
+                      model.start_time < day + timedelta(days=1))
+                 for user_id, day in user_days])
+
+
+def _daily_stats_select(job_filter, shift_filter):
+    """Selects rows of user_daily_stats, summed from the jobs and shifts matching the filters"""
+    jobs = (select(Job.user_id.label('user_id'),
+                   cast(Job.start_time, Date).label('local_date'),
+                   func.coalesce(cast(Job.employer, String), '').label('employer'),
+                   func.coalesce(Job.total_pay, 0).label('pay'),
+                   func.coalesce(Job.tip, 0).label('tip'),
+                   func.coalesce(Job.mileage, 0).label('mileage'),
+                   duration_seconds(Job).label('job_seconds'),
+                   literal(1).label('n_jobs'),
+                   _nonzero(Job.total_pay).label('n_paid_jobs'),
+                   _nonzero(Job.tip).label('n_tipped_jobs'),
+                   literal(0.).label('shift_seconds'),
+                   literal(0).label('n_shifts'))
+            .where(Job.user_id.isnot(None), Job.start_time.isnot(None), job_filter))
+    shifts = (select(Shift.user_id, cast(Shift.start_time, Date), literal(''),
+                     literal(0.), literal(0.), literal(0.), literal(0.),
+                     literal(0), literal(0), literal(0),
+                     duration_seconds(Shift), literal(1))
+              .where(Shift.user_id.isnot(None), Shift.start_time.isnot(None), shift_filter))
+    records = union_all(jobs, shifts).subquery('records')
+    sums = [func.sum(records.c[name]) for name in
+            ('pay', 'tip', 'mileage', 'job_seconds', 'n_jobs', 'n_paid_jobs',
+             'n_tipped_jobs', 'shift_seconds', 'n_shifts')]
+    return (select(records.c.user_id, records.c.local_date, records.c.employer, *sums)
+            .group_by(records.c.user_id, records.c.local_date, records.c.employer))
+
+
+_COLUMNS = ['user_id', 'local_date', 'employer', 'pay', 'tip', 'mileage', 'job_seconds',
+            'n_jobs', 'n_paid_jobs', 'n_tipped_jobs', 'shift_seconds', 'n_shifts']
+
+
+def _upsert_daily_stats(session, rows):
+    """Writes summed rows into user_daily_stats, replacing the sums of any that are there.
+
+    Transactions refreshing the same day concurrently each update its row, instead of
+    one of them failing on the primary key.
+    """
+    stmt = insert(UserDailyStats.__table__).from_select(_COLUMNS, rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'local_date', 'employer'],
+        set_=dict({name: stmt.excluded[name] for name in _COLUMNS[3:]},
+                  date_modified=func.now()))
+    return session.execute(stmt)
+
+
+def refresh_daily_stats(user_days, session=None):
+    """Re-sums the rows of user_daily_stats for some days, from their jobs and shifts.
+
+    Rows the days still have are updated in place, and rows they no longer have (an
+    employer whose only job moved to another day, say) are deleted.
+
+    Args:
+        user_days (iterable): (user_id, date) pairs to refresh
+        session (Session, optional): session to run in. Defaults to db.session.
+    """
+    session = session or db.session
+    user_days = sorted(set(user_days))
+    if not user_days:
+        return
+    rows = _daily_stats_select(_on_days(Job, user_days), _on_days(Shift, user_days))
+    _upsert_daily_stats(session, rows)
+    sums = rows.subquery('sums')
+    key = tuple_(UserDailyStats.user_id, UserDailyStats.local_date, UserDailyStats.employer)
+    session.execute(UserDailyStats.__table__.delete().where(and_(
+        or_(*[and_(UserDailyStats.user_id == user_id, UserDailyStats.local_date == day)
+              for user_id, day in user_days]),
+        key.notin_(select(sums.c.user_id, sums.c.local_date, sums.c.employer)))))
+
+
+def rebuild_daily_stats(user_id=None):
+    """Rebuilds user_daily_stats from scratch, for one user or everyone. The caller commits.
+
+    Returns:
+        int: the number of rows written
+    """
+    if user_id is None:
+        db.session.execute(UserDailyStats.__table__.delete())
+        rows = _daily_stats_select(true(), true())
+    else:
+        db.session.execute(UserDailyStats.__table__.delete()
+                           .where(UserDailyStats.user_id == user_id))
+        rows = _daily_stats_select(Job.user_id == user_id, Shift.user_id == user_id)
+    return _upsert_daily_stats(db.session, rows).rowcount
+
+
+# Keeping the rollup up to date: before each flush, note the days that any new,
+# deleted or changed job or shift started on, before and after the change, and when
+# the transaction commits, re-sum those days. Only changes to the attributes the
+# rollup is summed from count, so tracking a shift's locations doesn't refresh it.
+# Deleting a shift deletes its jobs in the database, so every day a shift spans is
+# refreshed.
+
+STALE_KEY = 'stale_daily_stats'
+# attributes of jobs and shifts that user_daily_stats is summed from
+STATS_ATTRS = ('user_id', 'start_time', 'end_time', 'total_pay', 'tip', 'mileage', 'employer')
+
+
+def _values(obj, attr):
+    """The current value of an attribute, and the one it replaced in this flush, if any"""
+    return [v for v in [getattr(obj, attr)] + list(inspect(obj).attrs[attr].history.deleted)
+            if v is not None]
+
+
+def _stale_days(obj):
+    user_ids = set(_values(obj, 'user_id'))
+    starts = [t.date() for t in _values(obj, 'start_time')]
+    if inspect(obj).pending and not starts:
+        # start_time defaults to now() in the database
+        starts = [date.today()]
+    days = set(starts)
+    if isinstance(obj, Shift) and starts:
+        ends = [t.date() for t in _values(obj, 'end_time')] or starts
+        first, last = min(starts), max(ends + starts)
+        days.update(first + timedelta(days=n) for n in range((last - first).days + 1))
+    return {(user_id, day) for user_id in user_ids for day in days}
+
+
+def _changes_stats(obj):
+    attrs = inspect(obj).attrs
+    return any(attrs[attr].history.has_changes() for attr in STATS_ATTRS if attr in attrs)
+
+
+def _load_replaced_value(target, value, oldvalue, initiator):
+    pass
+
+
+# active_history loads a time's old value before it's replaced, even if it was expired,
+# so that _stale_days can refresh the day it used to be on.
+for _model in (Job, Shift):
+    for _attr in (_model.user_id, _model.start_time, _model.end_time):
+        event.listen(_attr, 'set', _load_replaced_value, active_history=True)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _note_stale_daily_stats(session, flush_context, instances):
+    stale = session.info.setdefault(STALE_KEY, set())
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (Job, Shift)):
+            stale.update(_stale_days(obj))
+    for obj in session.dirty:
+        if isinstance(obj, (Job, Shift)) and _changes_stats(obj):
+            stale.update(_stale_days(obj))
+
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_stale_daily_stats(session):
+    if not session.info.get(STALE_KEY) and not (session.new or session.dirty or session.deleted):
+        return
+    session.flush()
+    stale = session.info.pop(STALE_KEY, set())
+    if stale:
+        refresh_daily_stats(stale, session)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_stale_daily_stats(session):
+    session.info.pop(STALE_KEY, None)
@@ -0,0 +1,74 @@
+import re
+import shapely.geometry
+import shapely.wkt
+from geoalchemy2.shape import from_shape, to_shape
+from sqlalchemy.dialects.postgresql import JSONB
+from api.routing import polyline
+from . import db
+
+
+class SnappedGeometryMixin(object):
+    """Road-snapped geometry for a model, stored compactly.
+
+    The geometry is stored polyline6-encoded in `snapped_polyline`, with its bounding
+    box in `snapped_bbox`. `snapped_geometry` gives it in the JSON shape we get back
+    from our map matching code, and can be assigned to in that shape:
+
+        {'geometries': [[lng, lat], ...],
+         'bounding_box': {'minLat', 'minLng', 'maxLat', 'maxLng'}}
+    """
+    snapped_polyline = db.Column(db.Text, nullable=True)
+    snapped_bbox = db.Column(JSONB, nullable=True)
+
+    @property
+    def snapped_geometry(self):
+        if self.snapped_polyline is None:
+            return None
+        return {'geometries': polyline.decode(self.snapped_polyline),
+                'bounding_box': self.snapped_bbox}
+
+    @snapped_geometry.setter
+    def snapped_geometry(self, value):
+        if value is None:
+            self.snapped_polyline = None
+            self.snapped_bbox = None
+        else:
+            self.snapped_polyline = polyline.encode(value['geometries'])
+            self.snapped_bbox = value['bounding_box']
+
+
+def _format_ordinate(x):
+    """Formats a coordinate like PostGIS's ST_AsText: the shortest representation that
+    round-trips, in positional notation, without trailing zeros"""
+    text = repr(float(x))
+    if 'e' in text or 'E' in text:
+        text = format(x, '.15f')
+    if '.' in text:
+        text = text.rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+
+def to_wkt(geom):
+    """Converts a geometry column value to WKT in process, without asking PostGIS.
+
+    Points come out just as ST_AsText would give them, like 'POINT(-71.1 42.3)'.
+    """
+    shape = to_shape(geom)
+    if shape.geom_type == 'Point' and not shape.is_empty:
+        return 'POINT({})'.format(' '.join(_format_ordinate(x) for x in shape.coords[0]))
+    return re.sub(r'^(\w+) \(', r'\1(', shapely.wkt.dumps(shape, trim=True))
+
+
+def to_geojson(geom):
+    """Converts a geometry column value to a GeoJSON geometry dict in process"""
+    return shapely.geometry.mapping(to_shape(geom))
+
+
+def from_wkt(text):
+    """Builds a geometry column value from WKT in process"""
+    return from_shape(shapely.wkt.loads(text))
+
+
+def from_geojson(obj):
+    """Builds a geometry column value from a GeoJSON geometry dict in process"""
+    return from_shape(shapely.geometry.shape(obj))
@@ -2,7 +2,7 @@ from . import db, EmployerNames
 from uuid import uuid4
 from sqlalchemy import DateTime, ForeignKey, Index
 from sqlalchemy.sql import func  # for datetimes
-from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
+from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.orm import backref
 from geoalchemy2 import Geometry
 from geoalchemy2.shape import from_shape
@@ -10,8 +10,9 @@ from shapely import geometry
 
 from .user import User
 from .shift import Shift
+from .geometry import SnappedGeometryMixin
 
-class Job(db.Model):
+class Job(SnappedGeometryMixin, db.Model):
     __tablename__ = "jobs"
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
@@ -33,7 +34,7 @@ class Job(db.Model):
     end_time = db.Column(DateTime)
 
     mileage = db.Column(db.Float, nullable=True)
-    snapped_geometry = db.Column(JSONB)
+    # snapped_geometry is stored polyline-encoded, see SnappedGeometryMixin
 
     # info from trip screenshots / manual entry
     estimated_mileage = db.Column(db.Float, nullable=True)
@@ -41,6 +42,13 @@ class Job(db.Model):
     tip = db.Column(db.Float, nullable=True)
     employer = db.Column(db.Enum(EmployerNames), nullable=True)
 
+    __table_args__ = (
+        # a user's jobs by time, for lists and stats
+        Index("ix_jobs_user_id_start_time_end_time", "user_id", "start_time", "end_time"),
+        # jobs that overlap a time range in a shift, when extracting jobs
+        Index("ix_jobs_shift_id_start_time_end_time", "shift_id", "start_time", "end_time"),
+    )
+
     def __init__(self, 
             shift_id, 
             user_id, 
@@ -1,8 +1,10 @@
 from . import db, EmployerNames
+from collections import namedtuple
+from datetime import date
 from uuid import uuid4
-from sqlalchemy import DateTime, ForeignKey, Index
+from sqlalchemy import DDL, DateTime, ForeignKey, Index, UniqueConstraint, event, text
 from sqlalchemy.sql import func  # for datetimes
-from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
+from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY, insert
 from sqlalchemy.orm import backref
 from geoalchemy2 import Geometry
 from geoalchemy2.shape import from_shape
@@ -10,16 +12,202 @@ from shapely import geometry
 
 from .shift import Shift
 
+# rows per INSERT statement when adding locations in bulk
+INSERT_BATCH_SIZE = 1000
+
+InsertResult = namedtuple(
+    'InsertResult',
+    ['new', 'duplicates', 'location_count', 'last_location_at']
+)
+InsertResult.__doc__ = '''
+The result of adding locations to a shift.
+
+new - number of locations that were inserted
+duplicates - number of locations skipped because the shift already had a location at their time
+location_count - the shift's location count afterwards
+last_location_at - the shift's latest location timestamp afterwards
+'''
+
 class Location(db.Model):
+    """A point recorded during a shift.
+
+    The table is partitioned by month of `timestamp` (see `create_location_partitions`),
+    so the partitions being written to stay small, and once a shift is cold its
+    points are moved out to a LocationArchive. Postgres requires the partition key
+    in every unique constraint, so it's part of the primary key.
+    """
     __tablename__ = "locations"
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     geom = db.Column(Geometry("POINT"))
     accuracy = db.Column(db.Float)
-    timestamp = db.Column(DateTime, nullable=False)
+    timestamp = db.Column(DateTime, primary_key=True, nullable=False)
     shift_id = db.Column(UUID(as_uuid=True), ForeignKey(
         Shift.id, ondelete='CASCADE'))
 
-    def __init__(self, timestamp, lng, lat, shift_id):
+    # a phone can't be in two places at once, so this is a retried upload
+    __table_args__ = (UniqueConstraint("shift_id", "timestamp",
+                                       name="uq_locations_shift_id_timestamp"),
+                      {'postgresql_partition_by': 'RANGE (timestamp)'})
+
+    def __init__(self, timestamp, lng, lat, shift_id, accuracy=None):
         self.timestamp = timestamp
         self.shift_id = shift_id
-        self.geom = from_shape(geometry.Point(lng, lat))
\ No newline at end of file
+        self.accuracy = accuracy
+        self.geom = _point(lng, lat)
+
+
+def _point(lng, lat):
+    """A location's geom, or None for an archived location that didn't have one"""
+    if lng is None or lat is None:
+        return None
+    return from_shape(geometry.Point(lng, lat))
+
+
+# rows outside every monthly partition go here, so an insert never fails for want
+# of a partition. create_location_partitions moves them out.
+DEFAULT_PARTITION = 'locations_default'
+event.listen(Location.__table__, 'after_create', DDL(
+    f'CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF locations DEFAULT'))
+
+
+def _add_months(month, n):
+    months = month.year * 12 + month.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'locations_{month.year}_{month.month:02d}'
+
+
+def create_location_partitions(months_ahead=2, session=None):
+    """Creates the monthly partitions of `locations` up to `months_ahead` months from now.
+
+    Partitions are also created for every month that has rows in the default
+    partition, and those rows are moved into them. The caller commits.
+
+    Args:
+        months_ahead (int, optional): number of months after this one to create
+            partitions for. Defaults to 2.
+        session (Session, optional): session to run in. Defaults to db.session.
+
+    Returns:
+        list: names of the partitions created
+    """
+    session = session or db.session
+    partitioned = session.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('locations')"
+    )).first()
+    if partitioned is None:
+        return []
+    this_month = date.today().replace(day=1)
+    months = {_add_months(this_month, n) for n in range(months_ahead + 1)}
+    months.update(m.date() for m, in session.execute(text(
+        f"SELECT DISTINCT date_trunc('month', timestamp) FROM {DEFAULT_PARTITION}")))
+    created = []
+    for month in sorted(months):
+        name = partition_name(month)
+        if session.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+            continue
+        bounds = {'start': month, 'end': _add_months(month, 1)}
+        # a partition can't be attached while the default partition has rows in its
+        # range, so they're moved into it first
+        session.execute(text(
+            f'CREATE TABLE {name} (LIKE locations INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+        session.execute(text(
+            f'''WITH moved AS (DELETE FROM {DEFAULT_PARTITION}
+                               WHERE timestamp >= :start AND timestamp < :end RETURNING *)
+                INSERT INTO {name} SELECT * FROM moved'''), bounds)
+        session.execute(text(
+            f"ALTER TABLE locations ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{bounds['start']}') TO ('{bounds['end']}')"))
+        created.append(name)
+    return created
+
+
+
+class LocationBatch(db.Model):
+    """A batch of locations uploaded to a shift, by its client-generated id, so a retried
+    upload can be skipped without looking at its locations."""
+    __tablename__ = "location_batches"
+    shift_id = db.Column(UUID(as_uuid=True), ForeignKey(
+        Shift.id, ondelete='CASCADE'), primary_key=True)
+    batch_id = db.Column(db.String, primary_key=True)
+    date_created = db.Column(DateTime, default=func.now())
+
+
+def claim_location_batch(shift_id, batch_id):
+    """Records that a batch is being uploaded to a shift, in the caller's transaction.
+
+    Returns:
+        bool: False if the batch was already uploaded
+    """
+    res = db.session.execute(
+        insert(LocationBatch.__table__)
+        .values(shift_id=shift_id, batch_id=batch_id, date_created=func.now())
+        .on_conflict_do_nothing()
+        .returning(LocationBatch.__table__.c.batch_id))
+    return res.first() is not None
+
+
+def insert_location_rows(shift_id, locations):
+    """Inserts locations into a shift with multi-row INSERTs, skipping any at a time the
+    shift already has a location for, without touching the shift's counters.
+
+    Args:
+        shift_id (UUID): shift to add the locations to
+        locations ([dict]): locations, as for `insert_locations`
+
+    Returns:
+        list: timestamps of the locations that were inserted
+    """
+    rows = [{'id': uuid4(),
+             'shift_id': shift_id,
+             'timestamp': l['timestamp'],
+             'accuracy': l.get('accuracy'),
+             'geom': _point(l['lng'], l['lat'])}
+            for l in locations]
+    table = Location.__table__
+    inserted = []
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        inserted.extend(t for t, in db.session.execute(
+            insert(table)
+            .values(rows[start:start + INSERT_BATCH_SIZE])
+            .on_conflict_do_nothing(index_elements=['shift_id', 'timestamp'])
+            .returning(table.c.timestamp)))
+    return inserted
+
+
+def insert_locations(shift_id, locations):
+    """Adds locations to a shift with multi-row INSERTs, without loading the shift's
+    `locations` relationship, and updates the shift's location counters in the same
+    transaction. The caller commits.
+
+    Locations at a time the shift already has a location for are skipped, with
+    ON CONFLICT DO NOTHING.
+
+    Args:
+        shift_id (UUID): shift to add the locations to
+        locations ([dict]): locations, as dicts with 'timestamp' (datetime), 'lng',
+            'lat' and 'accuracy' keys
+
+    Returns:
+        InsertResult: how many locations were new and how many were duplicates, and the
+        shift's counters afterwards
+    """
+    inserted = insert_location_rows(shift_id, locations)
+
+    # a single UPDATE, so concurrent uploads to the same shift can't lose counts
+    shifts = Shift.__table__
+    latest = max(inserted, default=None)
+    last_location_at = shifts.c.last_location_at
+    if latest is not None:
+        last_location_at = func.greatest(func.coalesce(shifts.c.last_location_at, latest), latest)
+    location_count, last_location_at = db.session.execute(
+        shifts.update()
+        .where(shifts.c.id == shift_id)
+        .values(location_count=shifts.c.location_count + len(inserted),
+                last_location_at=last_location_at)
+        .returning(shifts.c.location_count, shifts.c.last_location_at)
+    ).first()
+    return InsertResult(new=len(inserted), duplicates=len(locations) - len(inserted),
+                        location_count=location_count, last_location_at=last_location_at)
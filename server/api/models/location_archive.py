@@ -0,0 +1,160 @@
+from . import db
+import json
+import zlib
+from datetime import datetime, timedelta
+from sqlalchemy import DateTime, ForeignKey, LargeBinary, func, select
+from sqlalchemy.dialects.postgresql import UUID
+
+from .shift import Shift
+from .location import Location, insert_location_rows
+from .task import Task, TaskStatus
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class LocationArchive(db.Model):
+    """A cold shift's locations, moved out of the `locations` table and compressed.
+
+    Once a shift has ended and been matched, its points are only read to show the
+    shift, or to extract its jobs again. `archive_cold_shifts` moves them here,
+    `read_archived_locations` reads them without moving them back, and
+    `rehydrate_shift_locations` moves them back into `locations` when the shift is
+    processed again.
+    """
+    __tablename__ = "location_archives"
+
+    shift_id = db.Column(UUID(as_uuid=True), ForeignKey(
+        Shift.id, ondelete='CASCADE'), primary_key=True)
+    n_locations = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(DateTime, nullable=True)
+    last_timestamp = db.Column(DateTime, nullable=True)
+    # zlib-compressed JSON, see encode_locations
+    data = db.Column(LargeBinary, nullable=False)
+    date_created = db.Column(DateTime, default=func.now())
+
+    def __repr__(self):
+        return f"Archive of {self.n_locations} locations of shift {self.shift_id}"
+
+
+def encode_locations(locations):
+    """Compresses locations as columns of microseconds since the epoch, lng, lat and accuracy
+
+    Args:
+        locations ([dict]): locations as dicts with 'timestamp', 'lng', 'lat' and 'accuracy'.
+            lng and lat are None for locations without a point.
+
+    Returns:
+        bytes: the compressed locations
+    """
+    columns = [[(l['timestamp'] - EPOCH) // timedelta(microseconds=1) for l in locations],
+               [l['lng'] for l in locations],
+               [l['lat'] for l in locations],
+               [l['accuracy'] for l in locations]]
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode(), 9)
+
+
+def decode_locations(data):
+    """Decompresses locations from `encode_locations`, as dicts in the same order"""
+    times, lngs, lats, accuracies = json.loads(zlib.decompress(data))
+    return [{'timestamp': EPOCH + timedelta(microseconds=t), 'lng': lng, 'lat': lat,
+             'accuracy': accuracy}
+            for t, lng, lat, accuracy in zip(times, lngs, lats, accuracies)]
+
+
+def read_archived_locations(shift_ids):
+    """The archived locations of some shifts, without moving them back into `locations`
+
+    Args:
+        shift_ids (list): shifts to read the archives of
+
+    Returns:
+        dict: lists of location dicts, in timestamp order, by the id of each shift that
+        has an archive
+    """
+    if not shift_ids:
+        return {}
+    archives = (db.session.query(LocationArchive.shift_id, LocationArchive.data)
+                .filter(LocationArchive.shift_id.in_(list(shift_ids)))
+                .all())
+    return {shift_id: decode_locations(data) for shift_id, data in archives}
+
+
+def archive_shift_locations(shift_id):
+    """Moves a shift's locations out of `locations` into its archive. The caller commits.
+
+    Every row is archived, including any without a point, so none are lost when
+    they're deleted.
+
+    Returns:
+        int: the number of locations archived
+    """
+    rows = db.session.execute(
+        select(Location.timestamp, func.ST_X(Location.geom), func.ST_Y(Location.geom),
+               Location.accuracy)
+        .where(Location.shift_id == shift_id)
+        .order_by(Location.timestamp)).fetchall()
+    if not rows:
+        return 0
+    locations = [{'timestamp': t, 'lng': lng, 'lat': lat, 'accuracy': accuracy}
+                 for t, lng, lat, accuracy in rows]
+    db.session.add(LocationArchive(shift_id=shift_id,
+                                   n_locations=len(locations),
+                                   first_timestamp=locations[0]['timestamp'],
+                                   last_timestamp=locations[-1]['timestamp'],
+                                   data=encode_locations(locations)))
+    db.session.execute(Location.__table__.delete().where(Location.shift_id == shift_id))
+    return len(locations)
+
+
+def rehydrate_shift_locations(shift_id):
+    """Moves a shift's archived locations back into `locations`, if it has an archive.
+
+    The shift's location counters already count them. The caller commits.
+
+    Returns:
+        int: the number of locations moved back
+    """
+    archive = LocationArchive.query.get(shift_id)
+    if archive is None:
+        return 0
+    inserted = insert_location_rows(shift_id, decode_locations(archive.data))
+    db.session.delete(archive)
+    db.session.flush()
+    return len(inserted)
+
+
+def archive_cold_shifts(after_days, limit=None):
+    """Archives the locations of every shift that's been over for `after_days` days.
+
+    Only shifts that have been matched, and have no processing left to do, are
+    archived. Each shift is committed on its own.
+
+    Args:
+        after_days (float): days since a shift ended before it's archived
+        limit (int, optional): most shifts to archive. Defaults to every cold shift.
+
+    Returns:
+        tuple: (number of shifts archived, number of locations archived)
+    """
+    pending = (db.session.query(Task.id)
+               .filter(Task.shift_id == Shift.id,
+                       Task.status.in_([TaskStatus.QUEUED, TaskStatus.RUNNING]))
+               .exists())
+    archived = (db.session.query(LocationArchive.shift_id)
+                .filter(LocationArchive.shift_id == Shift.id)
+                .exists())
+    query = (db.session.query(Shift.id)
+             .filter(Shift.active == False,
+                     Shift.end_time < datetime.now() - timedelta(days=after_days),
+                     Shift.matched_until.isnot(None),
+                     ~pending, ~archived)
+             .order_by(Shift.end_time))
+    if limit is not None:
+        query = query.limit(limit)
+    n_shifts = n_locations = 0
+    for shift_id, in query.all():
+        n = archive_shift_locations(shift_id)
+        db.session.commit()
+        n_shifts += 1 if n else 0
+        n_locations += n
+    return n_shifts, n_locations
@@ -0,0 +1,157 @@
+"""
+Configuration and instrumentation of the app's one database engine, `db.engine`.
+
+The engine's pool is sized by DB_POOL_SIZE and DB_MAX_OVERFLOW, per process. With
+DB_PGBOUNCER set, we connect through PgBouncer in transaction pooling mode, which
+does the pooling, so we open a connection per checkout instead of keeping any.
+
+Each transaction of `db.session` gets a statement timeout for the kind of work
+it's part of: a GraphQL query or mutation, any other request, or a worker task.
+They're set with SET LOCAL, which only lasts for the transaction, so a timeout
+never leaks onto a connection that's reused for other work, even by PgBouncer.
+
+Checkouts from the pool are timed, and with the pool's utilization they're
+served as JSON from /metrics/db_pool, for sizing the pool against the number of
+uwsgi processes and threads. The numbers are per process.
+"""
+import os
+import threading
+import time
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, QueuePool
+
+from . import db
+
+# the kind of work transactions outside a request are part of, see use_statement_timeout
+_process_timeout_kind = None
+
+
+class PoolMetrics(object):
+    """Counts and times of checkouts from a pool, since the process started"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.
+        self.max_wait = 0.
+
+    def record(self, wait, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+
+    def as_dict(self):
+        with self._lock:
+            return {'checkouts': self.checkouts,
+                    'timeouts': self.timeouts,
+                    'total_wait_seconds': self.total_wait,
+                    'mean_wait_seconds': self.total_wait / self.checkouts if self.checkouts else 0.,
+                    'max_wait_seconds': self.max_wait}
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that times how long each checkout waits for a connection"""
+
+    metrics = PoolMetrics()
+    slow_checkout_seconds = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        wait = time.perf_counter() - start
+        self.metrics.record(wait)
+        if self.slow_checkout_seconds is not None and wait > self.slow_checkout_seconds:
+            message = f"Waited {wait:.2f}s for a database connection: {self.status()}"
+            if has_app_context():
+                current_app.logger.warning(message)
+            else:
+                print(message)
+        return connection
+
+
+def engine_options(config):
+    """Flask-SQLAlchemy's SQLALCHEMY_ENGINE_OPTIONS, from our DB_ settings
+
+    Args:
+        config (dict): the app's config
+
+    Returns:
+        dict: keyword arguments for create_engine
+    """
+    if config['DB_PGBOUNCER']:
+        return {'poolclass': NullPool}
+    InstrumentedQueuePool.slow_checkout_seconds = config['DB_POOL_SLOW_CHECKOUT_SECONDS']
+    return {'poolclass': InstrumentedQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+
+def pool_metrics():
+    """This process's pool metrics, as a dict"""
+    pool = db.engine.pool
+    metrics = {'pid': os.getpid(), 'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + pool._max_overflow
+        metrics.update({'size': pool.size(),
+                        'max_overflow': pool._max_overflow,
+                        'checked_out': pool.checkedout(),
+                        'checked_in': pool.checkedin(),
+                        'overflow': max(pool.overflow(), 0),
+                        'utilization': pool.checkedout() / capacity if capacity > 0 else 0.})
+    if isinstance(pool, InstrumentedQueuePool):
+        metrics.update(pool.metrics.as_dict())
+    return metrics
+
+
+def use_statement_timeout(kind):
+    """Sets the kind of work transactions begun from now on are part of.
+
+    In a request, that lasts until the request ends. Outside of one, it lasts for
+    the process.
+
+    Args:
+        kind (str): a key of DB_STATEMENT_TIMEOUTS, or None for no timeout
+    """
+    global _process_timeout_kind
+    if has_request_context():
+        g._statement_timeout_kind = kind
+    else:
+        _process_timeout_kind = kind
+
+
+def statement_timeout_kind():
+    if has_request_context():
+        return g.get('_statement_timeout_kind')
+    return _process_timeout_kind
+
+
+@event.listens_for(db.session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    kind = statement_timeout_kind()
+    if kind is None or not has_app_context():
+        return
+    milliseconds = current_app.config['DB_STATEMENT_TIMEOUTS'].get(kind)
+    if milliseconds:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {int(milliseconds)}')
+
+
+class StatementTimeoutMiddleware(object):
+    """GraphQL middleware that times out statements by operation, query or mutation"""
+
+    def resolve(self, next, root, info, **args):
+        if root is None:
+            use_statement_timeout(info.operation.operation)
+        return next(root, info, **args)
@@ -5,8 +5,9 @@ from sqlalchemy.sql import func  # for datetimes
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
 from sqlalchemy.orm import backref
 from .user import User
+from .geometry import SnappedGeometryMixin
 
-class Shift(db.Model):
+class Shift(SnappedGeometryMixin, db.Model):
     __tablename__ = "shifts"
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
     start_time = db.Column(DateTime, default=func.now())
@@ -24,9 +25,18 @@ class Shift(db.Model):
     # passive_deletes also means that when we delete a shift, the location and employer records
     # are deleted correctly, regardless of whether we use session.delete() or filter().delete()
 
-    # we store as JSONB because that's what we get back from the map match API, and because it's
-    # easier to pass around.
-    snapped_geometry = db.Column(JSONB)
+    # snapped_geometry is stored polyline-encoded, see SnappedGeometryMixin
+    # timestamp of the last location included in snapped_geometry / road_snapped_miles.
+    # Lets us match only the locations recorded after it while a shift is active.
+    matched_until = db.Column(DateTime, nullable=True)
+    # kept up to date by models.location.insert_locations, so uploads don't need to
+    # load every location to count them
+    location_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_location_at = db.Column(DateTime, nullable=True)
+    # which vertex of snapped_geometry each matched location was snapped to, so jobs can
+    # be sliced out of the shift's match. See api.routing.trace
+    # It has an entry per location, so it's only loaded when it's used.
+    snapped_trace = db.deferred(db.Column(JSONB, nullable=True))
     employers = db.Column(ARRAY(db.Enum(EmployerNames,
                                      create_constraint=False, native_enum=False)))
 
@@ -35,8 +45,37 @@ class Shift(db.Model):
     )
     jobs = db.relationship(
         'Job', backref=backref("shift", cascade="all, delete", passive_deletes=True))
+    # post-processing after the shift ends, in the order it runs
+    tasks = db.relationship(
+        'Task', backref='shift', cascade="all, delete-orphan", passive_deletes=True,
+        order_by='Task.id')
 
-    __table_args__ = (Index("index", "id", "start_time"),)
+    __table_args__ = (
+        # getActiveShift
+        Index("ix_shifts_user_id_active", "user_id", "active"),
+        # a user's shifts by time, for lists and stats
+        Index("ix_shifts_user_id_start_time", "user_id", "start_time"),
+    )
+
+    @property
+    def processing_status(self):
+        """Where the shift is in its post-processing, as a string.
+
+        ACTIVE while the shift is being tracked. Once it ends, QUEUED until a worker
+        picks it up, then MATCHING and EXTRACTING_JOBS, and finally DONE, or FAILED
+        if a task ran out of attempts.
+        """
+        from .task import TaskKind, TaskStatus
+        if self.active:
+            return 'ACTIVE'
+        if any(t.status == TaskStatus.FAILED for t in self.tasks):
+            return 'FAILED'
+        pending = [t for t in self.tasks if t.status != TaskStatus.DONE]
+        if not pending:
+            return 'DONE'
+        if len(pending) == len(self.tasks) and pending[0].status == TaskStatus.QUEUED:
+            return 'QUEUED'
+        return 'MATCHING' if pending[0].kind == TaskKind.MATCH_SHIFT else 'EXTRACTING_JOBS'
 
     def __repr__(self):
         return (
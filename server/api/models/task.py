@@ -0,0 +1,46 @@
+from . import db
+import enum
+from sqlalchemy import DateTime, ForeignKey, Index
+from sqlalchemy.sql import func  # for datetimes
+from sqlalchemy.dialects.postgresql import UUID
+
+from .shift import Shift
+
+
+class TaskKind(enum.Enum):
+    MATCH_SHIFT = "MATCH_SHIFT"
+    EXTRACT_JOBS = "EXTRACT_JOBS"
+
+
+class TaskStatus(enum.Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class Task(db.Model):
+    """A unit of background work on a shift, run by a worker. See api/worker.py"""
+    __tablename__ = "tasks"
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    kind = db.Column(db.Enum(TaskKind, create_constraint=False,
+                             native_enum=False), nullable=False)
+    shift_id = db.Column(UUID(as_uuid=True), ForeignKey(
+        Shift.id, ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.Enum(TaskStatus, create_constraint=False, native_enum=False),
+                       nullable=False, default=TaskStatus.QUEUED)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # queued tasks aren't claimed before this, so failed tasks can back off
+    run_after = db.Column(DateTime, default=func.now())
+    started_at = db.Column(DateTime, nullable=True)
+    finished_at = db.Column(DateTime, nullable=True)
+    # the last exception this task raised
+    error = db.Column(db.Text, nullable=True)
+    date_created = db.Column(DateTime, default=func.now())
+
+    __table_args__ = (Index("ix_tasks_status_id", "status", "id"),
+                      Index("ix_tasks_shift_id", "shift_id"))
+
+    def __repr__(self):
+        return f"Task {self.id} {self.kind.value} on shift {self.shift_id}: {self.status.value}"
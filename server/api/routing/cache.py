@@ -0,0 +1,319 @@
+"""
+Two-tier cache for OSRM responses.
+
+OSRM answers are deterministic for a given dataset, so we key responses on a
+canonical form of the request -- the service, its options, and the coordinate
+sequence quantized to COORD_PRECISION decimal places -- and keep them in:
+
+1. an in-process LRU (per uwsgi worker), and
+2. a SQLite database on disk, shared by every worker on the host.
+
+Both tiers evict by size and TTL. Everything is invalidated when the OSRM
+dataset version changes, either because OSRM_DATA_VERSION is changed or because
+OSRM starts reporting a different `data_version` in its responses. The on-disk
+tier remembers both, so a new worker adopts the version OSRM last reported
+instead of invalidating the tier all over again.
+
+The cache fails open: if the on-disk tier can't be used (it's locked, the disk is
+full, its directory is missing or read-only), requests go on with just the
+in-process tier, and the on-disk tier is tried again after DISK_RETRY_SECONDS.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+# 6 decimal places is ~0.1m, well under GPS noise.
+COORD_PRECISION = 6
+# seconds to go without the on-disk tier after it fails, e.g. when it's locked or full
+DISK_RETRY_SECONDS = 60
+
+
+def quantize(coordinates, precision=COORD_PRECISION):
+    """Rounds a list of {lat, lng} dicts to `precision` decimal places.
+
+    Returns a list of (lng, lat) tuples, the order OSRM expects them in.
+    """
+    return [(round(float(c['lng']), precision), round(float(c['lat']), precision))
+            for c in coordinates]
+
+
+def cache_key(service, coordinates, options, data_version=''):
+    """Canonical key for an OSRM request.
+
+    Args:
+        service (str): OSRM service, e.g. 'match' or 'route'
+        coordinates ([(lng, lat)]): quantized coordinates, as returned by `quantize`
+        options (dict): query parameters sent with the request
+        data_version (str): OSRM dataset version the response belongs to
+
+    Returns:
+        str: hex digest identifying the request
+    """
+    canonical = json.dumps([service, data_version, sorted(options.items()),
+                            coordinates], separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class LRUCache(object):
+    """Thread-safe in-process LRU with a TTL, in seconds."""
+
+    def __init__(self, max_entries=512, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, value = item
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache(object):
+    """Cache tier stored in a SQLite database shared between processes.
+
+    Connections are opened lazily per process and thread, so it's safe to create
+    before uwsgi forks its workers. Values are stored as zlib-compressed JSON.
+    """
+
+    # purge expired and excess rows every this many writes
+    PURGE_EVERY = 100
+
+    def __init__(self, path, max_entries=50000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._n_writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('''CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL)''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        now = time.time()
+        if self.ttl is not None and now - created_at > self.ttl:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            return None
+        conn.execute(
+            'UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        return json.loads(zlib.decompress(value).decode('utf-8'))
+
+    def put(self, key, value):
+        conn = self._conn()
+        now = time.time()
+        blob = zlib.compress(json.dumps(value).encode('utf-8'))
+        conn.execute('INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) '
+                     'VALUES (?, ?, ?, ?)', (key, blob, now, now))
+        self._n_writes += 1
+        if self._n_writes % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def purge(self):
+        """Removes expired rows, then the least recently used rows over `max_entries`."""
+        conn = self._conn()
+        if self.ttl is not None:
+            conn.execute('DELETE FROM responses WHERE created_at < ?',
+                         (time.time() - self.ttl,))
+        conn.execute('''DELETE FROM responses WHERE key IN (
+            SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)''',
+                     (self.max_entries,))
+
+    def get_meta(self, key):
+        row = self._conn().execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM responses')
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+class ResponseCache(object):
+    """In-process LRU in front of an optional shared SQLiteCache.
+
+    Args:
+        path (str): path to the SQLite database. If falsy, only the in-process tier is used.
+        memory_entries (int): max entries in the in-process tier
+        disk_entries (int): max entries in the on-disk tier
+        ttl (float): seconds before an entry expires, in both tiers. None to never expire.
+        data_version (str): configured OSRM dataset version. If it differs from the one
+            the on-disk tier was written with, the on-disk tier is cleared. Otherwise the
+            cache uses the version OSRM last reported, if the on-disk tier has one.
+    """
+
+    def __init__(self, path=None, memory_entries=512, disk_entries=50000, ttl=None,
+                 data_version=''):
+        self.memory = LRUCache(max_entries=memory_entries, ttl=ttl)
+        self.disk = SQLiteCache(path, max_entries=disk_entries,
+                                ttl=ttl) if path else None
+        self.configured_version = data_version or ''
+        self.data_version = self.configured_version
+        self._version_checked = False
+        # the on-disk tier isn't used again until then, after it fails
+        self._disk_retry_at = 0.
+        self.counters = {'memory_hits': 0, 'disk_hits': 0,
+                         'misses': 0, 'invalidations': 0, 'disk_errors': 0}
+
+    def _check_version(self):
+        # deferred so we don't touch the disk until the first request
+        if self._version_checked or self.disk is None:
+            return
+        if self.disk.get_meta('configured_version') != self.configured_version:
+            self.disk.clear()
+            self.disk.set_meta('configured_version', self.configured_version)
+            self.disk.set_meta('data_version', self.data_version)
+        else:
+            self.data_version = self.disk.get_meta('data_version') or self.data_version
+        self._version_checked = True
+
+    def _disk_failed(self, error):
+        """Stops using the on-disk tier for DISK_RETRY_SECONDS. The first failure is logged."""
+        self.counters['disk_errors'] += 1
+        if self.counters['disk_errors'] == 1:
+            logging.warning(f'OSRM cache {self.disk.path} failed, '
+                            f'using the in-process tier only: {error!r}')
+        self._disk_retry_at = time.monotonic() + DISK_RETRY_SECONDS
+
+    def _disk_available(self):
+        """Whether to use the on-disk tier, after checking its version"""
+        if self.disk is None or time.monotonic() < self._disk_retry_at:
+            return False
+        try:
+            self._check_version()
+        except (sqlite3.Error, OSError) as e:
+            self._disk_failed(e)
+            return False
+        return True
+
+    def key(self, service, coordinates, options):
+        self._disk_available()
+        return cache_key(service, coordinates, options, self.data_version)
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self.counters['memory_hits'] += 1
+            return value
+        if self._disk_available():
+            try:
+                value = self.disk.get(key)
+            except (sqlite3.Error, OSError) as e:
+                self._disk_failed(e)
+            if value is not None:
+                self.counters['disk_hits'] += 1
+                self.memory.put(key, value)
+                return value
+        self.counters['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """Stores a response. If OSRM reports a new `data_version`, everything cached
+        under the old one is dropped instead, and the response isn't stored -- its key
+        was computed for the old version.
+
+        Returns:
+            str: the key the value was stored under, or None if it wasn't stored.
+        """
+        disk_available = self._disk_available()
+        reported = value.get('data_version') if isinstance(value, dict) else None
+        if reported and reported != self.data_version:
+            self.invalidate(reported)
+            return None
+        self.memory.put(key, value)
+        if disk_available:
+            try:
+                self.disk.put(key, value)
+            except (sqlite3.Error, OSError) as e:
+                self._disk_failed(e)
+        return key
+
+    def invalidate(self, data_version=None):
+        """Clears both tiers, optionally moving to a new dataset version."""
+        if data_version is not None:
+            self.data_version = data_version
+        self.memory.clear()
+        if self.disk is not None:
+            try:
+                self.disk.clear()
+                self.disk.set_meta('configured_version', self.configured_version)
+                self.disk.set_meta('data_version', self.data_version)
+                self._version_checked = True
+            except (sqlite3.Error, OSError) as e:
+                # checked again, and cleared if it's stale, once it works
+                self._version_checked = False
+                self._disk_failed(e)
+        self.counters['invalidations'] += 1
+
+    def _disk_entries(self):
+        if self.disk is None:
+            return 0
+        try:
+            return len(self.disk)
+        except (sqlite3.Error, OSError):
+            return 0
+
+    def stats(self):
+        """Hit and miss counters for this process, plus current tier sizes."""
+        lookups = sum(self.counters[k]
+                      for k in ('memory_hits', 'disk_hits', 'misses'))
+        hits = self.counters['memory_hits'] + self.counters['disk_hits']
+        return dict(self.counters,
+                    hit_rate=hits / lookups if lookups else 0.,
+                    memory_entries=len(self.memory),
+                    disk_entries=self._disk_entries())
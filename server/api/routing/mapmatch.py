@@ -4,12 +4,16 @@ from api.models import Location as LocationModel
 from geoalchemy2.shape import to_shape
 from collections import namedtuple
 import logging
-from .utils import bounding_box, clean_trajectory, meters_to_miles
-from .osrmapi import get_match_distance, get_match_geometry, match, route
+from api.controllers.errors import DeadlineExceededError
+from .utils import bounding_box, clean_trajectory, meters_to_miles, miles_to_meters
+from .stops import detect_stops, segment_trips
+from .trace import append_trace, empty_trace, epoch_seconds, waypoint_meters, waypoint_vertices
+from .osrmapi import get_match_distance, get_match_geometry, match, route, match_async, route_async
 
 MatchResult = namedtuple(
     'MatchResult',
-    ['trajectory', 'geometry', 'distance', 'bbox']
+    ['trajectory', 'geometry', 'distance', 'bbox', 'trace'],
+    defaults=(None,)
 )
 MatchResult.__doc__ = '''
 A matched route result. 
@@ -18,6 +22,7 @@ trajectory - a matched trajectory as a TrajDataFrame
 geometry - the matched trajectory as a list of x,y coordinates [[x,y], ...]
 distance - the total distance of the matched trajectory, in miles
 bbox - bounding box of matched trajectory
+trace - which vertex of `geometry` each matched point was snapped to. See `api.routing.trace`
 '''
 
 GeometryResult = namedtuple(
@@ -31,45 +36,55 @@ result - a MatchResult namedtuple if successful, None otherwise
 message - Error message if unsuccessful, 'Success' otherwise
 '''
 
+Chunk = namedtuple(
+    'Chunk',
+    ['start', 'stop', 'anchor_index']
+)
+Chunk.__doc__ = '''
+A slice of a trajectory that is map-matched on its own.
+start, stop - positional indices of the slice, [start, stop)
+anchor_index - index within the slice of the last point shared with the previous chunk, or None
+'''
+
+# OSRM's default --max-matching-size is 100
+MATCH_MAX_CHUNK_SIZE = 100
+# points shared between consecutive chunks, for matching context
+MATCH_CHUNK_OVERLAP = 5
+# trajectories are split into separate segments at gaps longer than this
+MATCH_GAP_MINUTES = 10
+
 ############ Stops and trips
 
 def _get_trips_from_trajectory(traj_df, min_trip_dist_mi=1.,
                              minutes_for_stop=5,
                              no_data_for_minutes=60):
-    from skmob.preprocessing import detection
+    import numpy as np
     import pandas as pd
-    stop_df = detection.stops(traj_df,
-                              min_speed_kmh=20.,
-                              stop_radius_factor=0.75,
-                              minutes_for_a_stop=minutes_for_stop,
-                              spatial_radius_km=1.,
-                              no_data_for_minutes=no_data_for_minutes)
-
-    sdf = pd.concat([
-        pd.DataFrame(
-            traj_df.iloc[0][['lat', 'lng', 'datetime']].rename({'datetime': 'leaving_datetime'})).T,
-        stop_df,
-        pd.DataFrame(
-            traj_df.iloc[-1][['lat', 'lng', 'datetime']]).T]).reset_index(drop=True)
-
-
-    shifted_df = sdf.copy()
-    shifted_df.leaving_datetime = sdf.leaving_datetime.shift()
-    intervals = shifted_df[['datetime', 'leaving_datetime']].values
-
-    # extract trajectories within intervals
-    trajectories = [TrajDataFrame(
-        pd.concat([
-            # only include stop in beginning if it's not the first
-            # first stop has a leaving_datetime but not a arrival
-            pd.DataFrame(
-                sdf.iloc[n-1][['lat', 'lng', 'leaving_datetime']]).T.rename(columns={"leaving_datetime": "datetime"}) if n > 0 else None,
-            # intermediate trajectory
-            traj_df.set_index('datetime')[i[1]:i[0]].reset_index(),
-            # and the stop that ends this segment
-            pd.DataFrame(sdf.iloc[n][['lat', 'lng', 'datetime']]).T]).reset_index(drop=True))
-        for n, i in enumerate(intervals)
-                   if len(traj_df.set_index('datetime')[i[1]:i[0]]) > 1]
+    traj_df = traj_df.sort_values('datetime', kind='mergesort')
+    lat = traj_df.lat.values.astype(float)
+    lng = traj_df.lng.values.astype(float)
+    times = traj_df.datetime.values.astype('datetime64[ns]')
+
+    stops = detect_stops(lat, lng, times,
+                         stop_radius_km=1.,
+                         minutes_for_a_stop=minutes_for_stop,
+                         min_speed_kmh=20.,
+                         no_data_for_minutes=no_data_for_minutes)
+    endpoints, trips = segment_trips(lat, lng, times, stops)
+
+    # each trip starts where its origin was left, and ends where its destination was reached
+    trajectories = [TrajDataFrame(pd.DataFrame({
+        'lat': np.concatenate([[t.origin.lat], lat[t.start:t.stop], [t.destination.lat]]),
+        'lng': np.concatenate([[t.origin.lng], lng[t.start:t.stop], [t.destination.lng]]),
+        'datetime': np.concatenate([times[[t.origin.leaving]], times[t.start:t.stop],
+                                    times[[t.destination.arrival]]])}))
+        for t in trips]
+
+    sdf = pd.DataFrame({
+        'lat': [s.lat for s in endpoints],
+        'lng': [s.lng for s in endpoints],
+        'datetime': [times[s.arrival] if s.arrival is not None else pd.NaT for s in endpoints],
+        'leaving_datetime': [times[s.leaving] if s.leaving is not None else pd.NaT for s in endpoints]})
 
     return {'trajectories': trajectories, 'stops': TrajDataFrame(sdf)}
 
@@ -87,8 +102,8 @@ def get_trips_from_locations(locations,
 
     Parameters
     ----------
-    locations : list
-        list of Location objects to use
+    locations : list | TrajDataFrame
+        list of Location objects to use, or an unsimplified TrajDataFrame
     min_trip_dist_mi : float, optional
         Trips shorter than this distance will be merged, by default 1.
     minutes_for_stop : float, optional
@@ -102,7 +117,11 @@ def get_trips_from_locations(locations,
         list of 2-tuples of the form [(TrajDataFrame, StopDataFrame), ...]
     """
     logging.info("Extracting trips from {} locations".format(len(locations)))
-    traj_df = clean_trajectory(locations)
+    if isinstance(locations, TrajDataFrame):
+        traj_df = locations
+    else:
+        # stop detection needs every point, so don't simplify
+        traj_df = clean_trajectory(locations, simplify=False)
     return _get_trips_from_trajectory(traj_df)
 
 
@@ -128,23 +147,227 @@ def get_match_for_locations(locations):
     traj_df = clean_trajectory(locations)
     coords = traj_df[['lat', 'lng']].to_dict(orient='records')
     print("Sending {} coords to match api...".format(len(coords)))
-    res = match(coords).json()
+    res = match(coords)
     return res
 
 
-def get_match_for_trajectory(traj_df):
+def get_match_for_trajectory(traj_df, deadline=None):
     coords = traj_df[['lat', 'lng']].to_dict(orient='records')
-    res = match(coords).json()
+    res = match(coords, deadline)
     return res
 
 
-def get_route_for_trajectory(traj_df):
+def get_route_for_trajectory(traj_df, deadline=None):
     coords = traj_df[['lat', 'lng']].to_dict(orient='records')
-    res = route(coords).json()
+    res = route(coords, deadline)
     return res
 
 
-def get_matched_trajectory(trajectory, route_uncertain_segments=True, uncertain_threshold=.25):
+async def get_match_for_trajectory_async(traj_df, deadline=None):
+    coords = traj_df[['lat', 'lng']].to_dict(orient='records')
+    return await match_async(coords, deadline)
+
+
+async def get_route_for_trajectory_async(traj_df, deadline=None):
+    coords = traj_df[['lat', 'lng']].to_dict(orient='records')
+    return await route_async(coords, deadline)
+
+
+def split_trajectory(trajectory,
+                     max_chunk_size=MATCH_MAX_CHUNK_SIZE,
+                     overlap=MATCH_CHUNK_OVERLAP,
+                     gap_minutes=MATCH_GAP_MINUTES):
+    """
+    Splits a trajectory into chunks small enough to map-match on their own.
+
+    The trajectory is first split into segments wherever more than `gap_minutes`
+    pass between two points. Each segment is then cut into windows of at most
+    `max_chunk_size` points. Consecutive windows in a segment share `overlap`
+    points, so the matcher has some context at the start of each window.
+
+    Parameters
+    ----------
+    trajectory : TrajDataFrame
+        Trajectory to split, sorted by time
+    max_chunk_size : int, optional
+        Maximum number of points in a chunk, by default MATCH_MAX_CHUNK_SIZE
+    overlap : int, optional
+        Number of points each chunk shares with the one before it, by default MATCH_CHUNK_OVERLAP
+    gap_minutes : float, optional
+        Split into separate segments at gaps longer than this, by default MATCH_GAP_MINUTES
+
+    Returns
+    -------
+    list
+        A list of segments, each a list of Chunk namedtuples. Chunks that continue
+        a previous chunk have `anchor_index` set to the index (within the chunk) of
+        the last point they share with it; the first chunk in a segment has None.
+    """
+    import numpy as np
+    import pandas as pd
+    assert 0 < overlap < max_chunk_size
+    if len(trajectory) == 0:
+        return []
+    times = pd.to_datetime(trajectory['datetime']).values.astype('datetime64[s]').astype(np.int64)
+    gaps = np.flatnonzero(np.diff(times) > gap_minutes * 60) + 1
+    bounds = [0] + gaps.tolist() + [len(trajectory)]
+
+    segments = []
+    for seg_start, seg_stop in zip(bounds[:-1], bounds[1:]):
+        chunks = [Chunk(seg_start, min(seg_start + max_chunk_size, seg_stop), None)]
+        while chunks[-1].stop < seg_stop:
+            start = chunks[-1].stop - overlap
+            chunks.append(
+                Chunk(start, min(start + max_chunk_size, seg_stop), overlap - 1))
+        segments.append(chunks)
+    return segments
+
+
+def _find_anchor(m, anchor_index):
+    """The last tracepoint at or before `anchor_index` that OSRM kept. tidy=true may drop some."""
+    for tp in reversed((m.get('tracepoints') or [])[:anchor_index + 1]):
+        if tp is not None:
+            return tp
+    return None
+
+
+def _merge_bounding_boxes(a, b):
+    """Merges two [xmin, ymin, xmax, ymax] bounding boxes. Either may be None."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+def _append_geometry(geometry, piece):
+    """Appends `piece` to `geometry` in place, dropping its first point if it repeats our last.
+
+    Returns the index of the piece's first point in `geometry`.
+    """
+    offset = len(geometry)
+    if geometry and piece and geometry[-1] == piece[0]:
+        piece = piece[1:]
+        offset -= 1
+    geometry.extend(piece)
+    return offset
+
+
+async def _match_window(trajectory, anchor_index=None, route_uncertain_segments=True,
+                        uncertain_threshold=.25, deadline=None):
+    """
+    Map-matches a trajectory with a single OSRM call.
+
+    If `anchor_index` is given, the points up to and including it have already been
+    matched, and are only sent as context: everything OSRM matches up to that
+    tracepoint is dropped from the result.
+
+    Returns
+    -------
+    tuple
+        (geometry as [[x,y], ...], distance in meters, trace of the geometry).
+        See `api.routing.trace` for the trace.
+    """
+    import itertools
+    m = await get_match_for_trajectory_async(trajectory, deadline)
+    anchor = _find_anchor(m, anchor_index) if anchor_index is not None else None
+    times = epoch_seconds(trajectory['datetime'].values).tolist()
+    trace = empty_trace()
+    all_geometries = []
+    all_dists = []
+    last_match_end_point = None
+    if 'matchings' not in m or (anchor_index is not None and anchor is None):
+        r = await get_route_for_trajectory_async(
+            trajectory.iloc[[anchor_index or 0, -1]], deadline)
+        if 'routes' in r:
+            route_res = r['routes'][0]
+            all_geometries.append(route_res['geometry']['coordinates'])
+            all_dists.append(route_res['distance'])
+        trace['uncertain'].append([times[anchor_index or 0], times[-1]])
+    else:
+        matchings = m['matchings']
+        first_matching = anchor['matchings_index'] if anchor is not None else 0
+        # the input points each matching snapped, after the anchor
+        tracepoints = [[] for _ in matchings]
+        for i, tp in enumerate(m.get('tracepoints') or []):
+            if tp is not None and (anchor_index is None or i > anchor_index):
+                tracepoints[tp['matchings_index']].append((i, tp))
+        matchings = matchings[first_matching:]
+        tracepoints = tracepoints[first_matching:]
+        offset, meters, last_time = 0, 0., None
+        for n, (match, points) in enumerate(zip(matchings, tracepoints)):
+            coordinates = match['geometry']['coordinates']
+            distance = match['distance']
+            leg_meters = waypoint_meters(match)
+            waypoints = [(tp['waypoint_index'], tp['location']) for _, tp in points]
+            trim, trim_meters = 0, 0.
+            if anchor is not None and n == 0:
+                # legs[k] joins waypoints k and k+1, so legs from the anchor on are new
+                vertices = waypoint_vertices(
+                    match, [(anchor['waypoint_index'], anchor['location'])] + waypoints)
+                trim, vertices = vertices[0], vertices[1:]
+                coordinates = coordinates[trim:]
+                trim_meters = leg_meters[anchor['waypoint_index']]
+                distance = sum(leg['distance']
+                               for leg in match['legs'][anchor['waypoint_index']:])
+                last_match_end_point = anchor['location']
+                last_time = times[anchor_index]
+            else:
+                vertices = waypoint_vertices(match, waypoints)
+            if points and last_time is not None and n > 0:
+                # OSRM couldn't match the points between two matchings
+                trace['uncertain'].append([last_time, times[points[0][0]]])
+            # if low confience, just route between a start and end.
+            if match['confidence'] <= uncertain_threshold:
+                if points:
+                    trace['uncertain'].append(
+                        [last_time if last_time is not None else times[points[0][0]],
+                         times[points[-1][0]]])
+            else:
+                trace['times'].extend(times[i] for i, _ in points)
+                trace['indices'].extend(offset + v - trim for v in vertices)
+                trace['meters'].extend(meters + leg_meters[tp['waypoint_index']] - trim_meters
+                                       for _, tp in points)
+            if points:
+                last_time = times[points[-1][0]]
+            if match['confidence'] <= uncertain_threshold and route_uncertain_segments == True:
+                if len(m['matchings']) == 1 and anchor is None:
+                    # if length of matchings is 1 in total, just do a route on the trajectory
+                    r = await get_route_for_trajectory_async(trajectory.iloc[[0, -1]], deadline)
+                else:
+                    print("last match endpoint:",
+                          last_match_end_point, len(coordinates))
+                    if last_match_end_point is None:
+                        coords_to_route = coordinates
+                    else:
+                        coords_to_route = [last_match_end_point] + coordinates
+                    last_match_end_point = coords_to_route[-1]
+                    r = await route_async([{'lat': c[1], 'lng': c[0]} for c in [
+                        coords_to_route[0], coords_to_route[-1]]], deadline)
+                route_res = r['routes'][0]
+                all_geometries.append(route_res['geometry']['coordinates'])
+                all_dists.append(route_res['distance'])
+            else:
+                all_geometries.append(coordinates)
+                all_dists.append(distance)
+                last_match_end_point = coordinates[-1]
+            offset += len(all_geometries[-1])
+            meters += all_dists[-1]
+    return list(itertools.chain(*all_geometries)), sum(all_dists), trace
+
+
+async def _route_between(trajectory, i, j, deadline=None):
+    """Routes between points i and j of a trajectory. Returns (geometry, distance in meters, trace)"""
+    r = await get_route_for_trajectory_async(trajectory.iloc[[i, j]], deadline)
+    times = epoch_seconds(trajectory['datetime'].values[[i, j]]).tolist()
+    trace = dict(empty_trace(), uncertain=[times])
+    if 'routes' not in r:
+        return [], 0., trace
+    return r['routes'][0]['geometry']['coordinates'], r['routes'][0]['distance'], trace
+
+
+async def get_matched_trajectory_async(trajectory, route_uncertain_segments=True,
+                                       uncertain_threshold=.25, deadline=None):
     """
     Generates a "matched" version of a trajectory.
 
@@ -152,6 +375,11 @@ def get_matched_trajectory(trajectory, route_uncertain_segments=True, uncertain_
     are instead simply routed using shortest-distance routing 
     on OpenStreetMap using the first and last points of the trajectory.
 
+    Long trajectories are split into chunks with `split_trajectory`, which are
+    matched concurrently and stitched back together. Gaps in time between chunks
+    are filled by routing across them. Concurrency is bounded by the size of the
+    OSRM client's connection pool.
+
     Parameters
     ----------
     trajectory : TrajDataFrame
@@ -160,6 +388,8 @@ def get_matched_trajectory(trajectory, route_uncertain_segments=True, uncertain_
         If True, route segments that our map matcher is under `uncertain_threshold` certain about.
     uncertain_threshold : float
         Route segments where map-matching is under this uncertainty
+    deadline : Deadline, optional
+        Time budget shared by every OSRM call made for this trajectory
 
     Returns
     -------
@@ -170,11 +400,12 @@ def get_matched_trajectory(trajectory, route_uncertain_segments=True, uncertain_
         geometry: Full geometry as [[x,y], ...] of the matched trajectory
         distance: Total distance of the matched trajectory, in miles
         bbox: Bounding box of the matched trajectory
+        trace: Trace mapping the trajectory's points onto `geometry`
 
     Examples
     --------
     >>> tdf = TrajDataFrame(coordinates)
-    >>> match_result = get_matched_trajectory(tdf)
+    >>> match_result = await get_matched_trajectory_async(tdf)
 
     Notes
     -----
@@ -182,54 +413,177 @@ def get_matched_trajectory(trajectory, route_uncertain_segments=True, uncertain_
     In these cases, we match those parts that have over 50% confidence, and then
     route others.
     """
-    import itertools
+    import asyncio
     import numpy as np
     import pandas as pd
-    m = get_match_for_trajectory(trajectory)
+    segments = split_trajectory(trajectory)
+
+    # one task per chunk, and one per gap between segments, in trajectory order
+    tasks = []
+    for n, chunks in enumerate(segments):
+        if n > 0:
+            tasks.append(_route_between(
+                trajectory, segments[n - 1][-1].stop - 1, chunks[0].start, deadline))
+        for chunk in chunks:
+            if chunk.stop - chunk.start > 1:
+                tasks.append(_match_window(
+                    trajectory.iloc[chunk.start:chunk.stop], chunk.anchor_index,
+                    route_uncertain_segments, uncertain_threshold, deadline))
+    if len(tasks) > 1:
+        print("matching trajectory in {} chunks...".format(len(tasks)))
+    results = await asyncio.gather(*tasks)
+
     all_geometries = []
-    all_dists = []
-    last_match_end_point = None
-    if 'matchings' not in m:
-        r = get_route_for_trajectory(trajectory.iloc[[0, -1]])
-        route_res = r['routes'][0]
-        all_geometries.append(route_res['geometry']['coordinates'])
-        all_dists.append(route_res['distance'])
-    else:
-        for match in m['matchings']:
-            coordinates = match['geometry']['coordinates']
-            # if low confience, just route between a start and end.
-            if match['confidence'] <= uncertain_threshold and route_uncertain_segments == True:
-                if len(m['matchings']) == 1:
-                    # if length of matchings is 1 in total, just do a route on the trajectory
-                    r = get_route_for_trajectory(trajectory.iloc[[0, -1]])
-                else:
-                    print("last match endpoint:",
-                          last_match_end_point, len(coordinates))
-                    if last_match_end_point is None:
-                        coords_to_route = coordinates
-                    else:
-                        coords_to_route = [last_match_end_point] + coordinates
-                    last_match_end_point = coords_to_route[-1]
-                    r = route([{'lat': c[1], 'lng': c[0]} for c in [
-                              coords_to_route[0], coords_to_route[-1]]]).json()
-                route_res = r['routes'][0]
-                all_geometries.append(route_res['geometry']['coordinates'])
-                all_dists.append(route_res['distance'])
-            else:
-                all_geometries.append(coordinates)
-                all_dists.append(match['distance'])
-                last_match_end_point = coordinates[-1]
-    all_geometries = list(itertools.chain(*all_geometries))
+    trace = empty_trace()
+    meters = 0.
+    for geometry, distance, piece in results:
+        append_trace(trace, piece, _append_geometry(all_geometries, geometry), meters)
+        meters += distance
     locs = pd.DataFrame(all_geometries, columns=['lng', 'lat'])
     locs['datetime'] = np.arange(0, len(locs))
 
     return MatchResult(trajectory=TrajDataFrame(locs),
                        geometry=all_geometries,
-                       distance=meters_to_miles(sum(all_dists)),
-                       bbox=bounding_box(all_geometries))
+                       distance=meters_to_miles(meters),
+                       bbox=bounding_box(all_geometries) if all_geometries else None,
+                       trace=trace)
+
+
+def get_matched_trajectory(trajectory, route_uncertain_segments=True, uncertain_threshold=.25,
+                           deadline=None):
+    """Synchronous version of `get_matched_trajectory_async`"""
+    import asyncio
+    return asyncio.run(get_matched_trajectory_async(
+        trajectory, route_uncertain_segments, uncertain_threshold, deadline))
+
+
+def extend_matched_trajectory(trajectory, anchor_index, prefix_geometry=None,
+                              prefix_distance=0., prefix_bbox=None, prefix_trace=None,
+                              deadline=None):
+    """
+    Extends an already-matched trajectory with newly recorded points.
+
+    `trajectory` holds a small overlap window of points that were already matched
+    (up to and including `anchor_index`, the last confirmed tracepoint), followed
+    by the new tail. Only this window is sent to OSRM, so the cost of each call
+    depends on the size of the tail, not on the length of the whole trajectory.
+    The overlap gives the matcher enough context to snap the start of the tail
+    onto the same road as the end of the prefix; everything matched up to the
+    anchor is discarded, and the remainder is appended to the prefix.
+
+    Parameters
+    ----------
+    trajectory : TrajDataFrame
+        Overlap points followed by the new points to match, sorted by time
+    anchor_index : int
+        Positional index in `trajectory` of the last point that was already matched
+    prefix_geometry : list, optional
+        Geometry of the already-matched prefix as [[x,y], ...]
+    prefix_distance : float, optional
+        Distance of the already-matched prefix, in miles
+    prefix_bbox : list, optional
+        Bounding box of the already-matched prefix as [xmin, ymin, xmax, ymax]
+    prefix_trace : dict, optional
+        Trace of the already-matched prefix. See `api.routing.trace`
+    deadline : Deadline, optional
+        Time budget for the OSRM calls
+
+    Returns
+    -------
+    MatchResult
+        namedtuple where `trajectory` is the matched tail only, and `geometry`,
+        `distance`, `bbox` and `trace` describe the whole extended trajectory.
+
+    Notes
+    -----
+    Unlike `get_matched_trajectory`, low-confidence matchings are not re-routed here;
+    the full match run when a shift ends takes care of that. If OSRM can't match the
+    window at all, or drops every overlap point, we route from the anchor to the
+    last new point instead.
+    """
+    import asyncio
+    import numpy as np
+    import pandas as pd
+    tail_geometry, tail_dist, tail_trace = asyncio.run(_match_window(
+        trajectory, anchor_index, route_uncertain_segments=False, deadline=deadline))
+    geometry = list(prefix_geometry or [])
+    trace = append_trace(empty_trace(), prefix_trace)
+    append_trace(trace, tail_trace, _append_geometry(geometry, tail_geometry),
+                 miles_to_meters(prefix_distance))
+
+    locs = pd.DataFrame(tail_geometry, columns=['lng', 'lat'])
+    locs['datetime'] = np.arange(0, len(locs))
+    return MatchResult(trajectory=TrajDataFrame(locs),
+                       geometry=geometry,
+                       distance=prefix_distance + meters_to_miles(tail_dist),
+                       bbox=_merge_bounding_boxes(
+                           prefix_bbox,
+                           bounding_box(tail_geometry) if tail_geometry else None),
+                       trace=trace)
+
+
+def get_incremental_route_geometry(traj_df, anchor_index, prefix_geometry=None,
+                                   prefix_distance=0., prefix_bbox=None, prefix_trace=None,
+                                   deadline=None):
+    """
+    Computes an extended map-matched geometry. See `extend_matched_trajectory`.
+
+    Returns
+    -------
+    GeometryResult
+        As in `get_route_geometry`, with a MatchResult for the whole extended trajectory.
+    """
+    print("extending match with", len(traj_df) - anchor_index - 1, "locations...")
+    try:
+        res = extend_matched_trajectory(traj_df, anchor_index,
+                                        prefix_geometry=prefix_geometry,
+                                        prefix_distance=prefix_distance,
+                                        prefix_bbox=prefix_bbox,
+                                        prefix_trace=prefix_trace,
+                                        deadline=deadline)
+    except ConnectionError as e:
+        return GeometryResult(status='error', result=None, message='Connection Error')
+    if res.geometry == []:
+        logging.error("Failed to extend matched route")
+        return GeometryResult(status='error',
+                              result=None,
+                              message="Failed to extend matched route")
+    return GeometryResult(status='ok', result=res, message='Success')
+
+
+def get_route_geometry(locs_or_traj, deadline=None):
+    """Synchronous version of `get_route_geometry_async`"""
+    import asyncio
+    return asyncio.run(get_route_geometry_async(locs_or_traj, deadline))
+
+
+def get_route_geometries(trajectories, deadline=None):
+    """
+    Computes map-matched geometries for several trajectories at once.
+
+    All of the trajectories' OSRM calls are issued concurrently, sharing one deadline.
+
+    Parameters
+    ----------
+    trajectories : list
+        List of TrajDataFrames or lists of Location objects, as for `get_route_geometry`
+    deadline : Deadline, optional
+        Time budget shared by every OSRM call
+
+    Returns
+    -------
+    list
+        A GeometryResult for each trajectory, in the same order
+    """
+    import asyncio
+
+    async def gather():
+        return await asyncio.gather(*[get_route_geometry_async(t, deadline)
+                                      for t in trajectories])
+    return asyncio.run(gather())
 
 
-def get_route_geometry(locs_or_traj):
+async def get_route_geometry_async(locs_or_traj, deadline=None):
     """
     Computes a map-matched geometry for a list of locations or TrajDataFrame
 
@@ -237,6 +591,8 @@ def get_route_geometry(locs_or_traj):
     ----------
     locs_or_traj : list | TrajDataFrame
         Either a list of coordinates in the form of [[x,y], ...] or a TrajDataFrame to map-match
+    deadline : Deadline, optional
+        Time budget for the OSRM calls. If it runs out, we return an error result.
 
     Returns
     -------
@@ -253,10 +609,12 @@ def get_route_geometry(locs_or_traj):
     try:
         if (type(locs_or_traj) == trajectorydataframe.TrajDataFrame or
                 type(locs_or_traj) == pd.DataFrame):
-            res = get_matched_trajectory(locs_or_traj)
+            res = await get_matched_trajectory_async(locs_or_traj, deadline=deadline)
         else:  # it's a list of locations
             traj_df = clean_trajectory(locs_or_traj)
-            res = get_matched_trajectory(traj_df)
+            res = await get_matched_trajectory_async(traj_df, deadline=deadline)
+    except DeadlineExceededError as e:
+        return GeometryResult(status='error', result=None, message='Deadline Exceeded')
     except ConnectionError as e:
         return GeometryResult(status='error', result=None, message='Connection Error')
     if res.geometry == []:
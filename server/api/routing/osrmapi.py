@@ -1,49 +1,216 @@
 import requests
-from requests.exceptions import ConnectionError
-from flask import current_app
-from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
 import os
+import time
 import itertools
 
-# retry and backoff a 0.1, 0.2, ... 0.5 on retry
-s = requests.Session()
-retries = Retry(total=5,
-                backoff_factor=0.1,
-                status_forcelist=[ 500, 502, 503, 504 ])
-
-s.mount('http://', HTTPAdapter(max_retries=retries))
+from api.controllers.errors import DeadlineExceededError
+from .cache import ResponseCache, quantize
 
 OSRM_URI = os.environ['OSRM_URI']
 
-def route(coordinates):
-    coord_str = requests.utils.quote(
-        ';'.join([f'{c["lng"]},{c["lat"]}' for c in coordinates]))
-    print("Route API coordinate string: {}".format(coord_str))
-    # We don't include timestamps because they aren't really needed
-    payload = {
-        "geometries": "geojson",
-        "overview": "full",
-        "continue_straight": "true"}
-    MATCH_URI = f'{OSRM_URI}/route/v1/driving/{coord_str}'
-    return s.post(MATCH_URI, params=payload)
-
-def match(coordinates):
+# Responses are cached in-process and in a sqlite db shared by all workers.
+# Set OSRM_CACHE_PATH to an empty string to only cache in-process.
+# Bump OSRM_DATA_VERSION when the OSRM dataset is re-extracted.
+cache = ResponseCache(
+    path=os.environ.get('OSRM_CACHE_PATH', '/opt/data/cache/osrm.sqlite'),
+    memory_entries=int(os.environ.get('OSRM_CACHE_MEMORY_ENTRIES', 512)),
+    disk_entries=int(os.environ.get('OSRM_CACHE_DISK_ENTRIES', 50000)),
+    ttl=float(os.environ.get('OSRM_CACHE_TTL', 30 * 24 * 60 * 60)),
+    data_version=os.environ.get('OSRM_DATA_VERSION', ''))
+
+# OSRM response codes that only depend on the request and the dataset, so are safe to cache.
+CACHEABLE_CODES = ['Ok', 'NoMatch', 'NoRoute', 'NoSegment', 'TooBig']
+RETRY_STATUSES = [500, 502, 503, 504]
+
+
+class Deadline(object):
+    """A time budget for a group of OSRM calls, usually everything one mutation does.
+
+    Create one at the start of a mutation and pass it down; every call made with it
+    shares the same budget, including retries.
+
+    Args:
+        seconds (float): seconds from now until the deadline. None for no deadline.
+    """
+
+    def __init__(self, seconds=None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left before the deadline, or None if there is no deadline"""
+        if self.expires_at is None:
+            return None
+        return max(0., self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def timeout(self, limit):
+        """The timeout to use for one request: `limit`, or less if the deadline is sooner"""
+        remaining = self.remaining()
+        return limit if remaining is None else min(limit, remaining)
+
+
+class OSRMClient(object):
+    """Client for our OSRM api.
+
+    Shares one pooled, keep-alive requests.Session between threads, retries failed
+    requests with exponential backoff within a Deadline, and caches responses in
+    a ResponseCache. The `*_async` methods run requests on a bounded thread pool,
+    so many calls can be awaited together with asyncio.gather.
+
+    Args:
+        base_uri (str): OSRM server, e.g. http://osrm:5000
+        pool_size (int): max open connections, and max concurrent requests
+        max_retries (int): number of retries for connection errors and 5xx responses
+        backoff_factor (float): retries wait backoff_factor * 2 ** (retry - 1) seconds
+        request_timeout (float): max seconds for a single request
+        cache (ResponseCache): response cache, or None to disable caching
+    """
+
+    def __init__(self, base_uri, pool_size=8, max_retries=3, backoff_factor=0.1,
+                 request_timeout=30., cache=None):
+        self.base_uri = base_uri
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.request_timeout = request_timeout
+        self.cache = cache
+        # retries are handled in _post, so they can respect the deadline
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size,
+                                           thread_name_prefix='osrm')
+
+    def _post(self, url, payload, deadline):
+        deadline = deadline or Deadline()
+        for attempt in range(self.max_retries + 1):
+            if deadline.expired:
+                raise DeadlineExceededError(
+                    f'OSRM deadline exceeded after {attempt} attempts')
+            try:
+                res = self.session.post(url, params=payload,
+                                        timeout=deadline.timeout(self.request_timeout))
+                if res.status_code not in RETRY_STATUSES:
+                    return res.json()
+                error = ConnectionError(f'OSRM responded {res.status_code}')
+            except requests.exceptions.Timeout as e:
+                error = DeadlineExceededError(f'OSRM request timed out: {e}')
+            except requests.exceptions.ConnectionError as e:
+                error = ConnectionError(f'Could not connect to OSRM: {e}')
+            if attempt == self.max_retries:
+                raise error
+            backoff = self.backoff_factor * (2 ** attempt)
+            remaining = deadline.remaining()
+            if remaining is not None and remaining <= backoff:
+                raise DeadlineExceededError(
+                    f'OSRM deadline exceeded after {attempt + 1} attempts: {error}') from error
+            time.sleep(backoff)
+
+    def request(self, service, profile, coordinates, payload, deadline=None):
+        """POSTs a request to OSRM, going through the response cache.
+
+        Args:
+            service (str): OSRM service, e.g. 'match'
+            profile (str): OSRM profile, e.g. 'car'
+            coordinates ([{lat, lng}]): coordinates to send
+            payload (dict): query parameters
+            deadline (Deadline): time budget for this call, including retries
+
+        Returns:
+            dict: the parsed JSON response
+
+        Raises:
+            DeadlineExceededError: if the deadline passes before OSRM responds
+            ConnectionError: if OSRM can't be reached after retrying
+        """
+        coords = quantize(coordinates)
+        key = None
+        if self.cache is not None:
+            key = self.cache.key(service, coords, payload)
+            res = self.cache.get(key)
+            if res is not None:
+                return res
+        coord_str = requests.utils.quote(
+            ';'.join([f'{lng},{lat}' for lng, lat in coords]))
+        res = self._post(f'{self.base_uri}/{service}/v1/{profile}/{coord_str}',
+                         payload, deadline)
+        if key is not None and res.get('code') in CACHEABLE_CODES:
+            self.cache.put(key, res)
+        return res
+
+    def route(self, coordinates, deadline=None):
+        # We don't include timestamps because they aren't really needed
+        payload = {
+            "geometries": "geojson",
+            "overview": "full",
+            "continue_straight": "true"}
+        return self.request('route', 'driving', coordinates, payload, deadline)
+
+    def match(self, coordinates, deadline=None):
+        # We don't include timestamps because they aren't really needed
+        payload = {
+            "geometries": "geojson",
+            "gaps": "ignore",
+            "overview": "full",
+            "tidy": "true",
+            # per-segment distances, to map tracepoints onto the geometry
+            "annotations": "distance"}
+        return self.request('match', 'car', coordinates, payload, deadline)
+
+    async def _run(self, f, *args):
+        # blocking requests run on our own bounded pool, not the loop's default executor
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(f, *args))
+
+    async def route_async(self, coordinates, deadline=None):
+        return await self._run(self.route, coordinates, deadline)
+
+    async def match_async(self, coordinates, deadline=None):
+        return await self._run(self.match, coordinates, deadline)
+
+
+client = OSRMClient(
+    OSRM_URI,
+    pool_size=int(os.environ.get('OSRM_POOL_SIZE', 8)),
+    max_retries=int(os.environ.get('OSRM_MAX_RETRIES', 3)),
+    request_timeout=float(os.environ.get('OSRM_REQUEST_TIMEOUT', 30)),
+    cache=cache)
+
+
+def route(coordinates, deadline=None):
+    """Submits a route request to our osrm api
+
+    coordinates: a list of {lat, lng} dicts
+    deadline: optional Deadline for this call
+    returns: the parsed JSON response
+    """
+    return client.route(coordinates, deadline)
+
+def match(coordinates, deadline=None):
     """Submits map match request to our osrm api
 
     coordinates: a list of {lat, lng} dicts
+    deadline: optional Deadline for this call
+    returns: the parsed JSON response
     """
-    coord_str = requests.utils.quote(
-        ';'.join([f'{c["lng"]},{c["lat"]}' for c in coordinates]))
-    print("Match API coordinate string: {}".format(coord_str))
-    # We don't include timestamps because they aren't really needed
-    payload = {
-        "geometries": "geojson",
-        "gaps": "ignore",
-        "overview": "full",
-        "tidy": "true"}
-    MATCH_URI = f'{OSRM_URI}/match/v1/car/{coord_str}'
-    return s.post(MATCH_URI, params=payload)
+    return client.match(coordinates, deadline)
+
+
+async def route_async(coordinates, deadline=None):
+    """Awaitable version of `route`"""
+    return await client.route_async(coordinates, deadline)
+
+
+async def match_async(coordinates, deadline=None):
+    """Awaitable version of `match`"""
+    return await client.match_async(coordinates, deadline)
 
 
 def get_match_distance(res):
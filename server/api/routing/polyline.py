@@ -0,0 +1,58 @@
+"""
+Encoded polyline format, at 6 decimal places ("polyline6", as OSRM uses).
+
+See https://developers.google.com/maps/documentation/utilities/polylinealgorithm.
+Each coordinate is stored as the zigzag-encoded difference from the previous one,
+in base64-ish chunks of 5 bits, so a matched route takes a few bytes per point
+instead of a JSON pair of floats.
+
+The encoded string has (lat, lng) pairs, like every polyline decoder expects, but
+these functions take and return our geometries' [[lng, lat], ...] order.
+"""
+
+PRECISION = 6
+
+
+def _encode_value(value, out):
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode(coordinates, precision=PRECISION):
+    """Encodes a list of [lng, lat] coordinates as a polyline string"""
+    factor = 10 ** precision
+    out = []
+    prev_lat, prev_lng = 0, 0
+    for lng, lat in coordinates:
+        lat, lng = int(round(lat * factor)), int(round(lng * factor))
+        _encode_value(lat - prev_lat, out)
+        _encode_value(lng - prev_lng, out)
+        prev_lat, prev_lng = lat, lng
+    return ''.join(out)
+
+
+def decode(polyline, precision=PRECISION):
+    """Decodes a polyline string into a list of [lng, lat] coordinates"""
+    factor = float(10 ** precision)
+    coordinates = []
+    index, lat, lng = 0, 0, 0
+    length = len(polyline)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift, result = 0, 0
+            while True:
+                b = ord(polyline[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lng += deltas[1]
+        coordinates.append([lng / factor, lat / factor])
+    return coordinates
@@ -0,0 +1,185 @@
+"""
+Trajectory simplification before map matching.
+
+Every point we keep is sent to OSRM in the request URL, and OSRM's matching
+time grows with the number of points, so we drop points that don't add
+anything to the match. The stages run in order:
+
+1. speed: points reached from the previous point faster than `max_speed_kmh`
+   (or at the same time) are GPS errors.
+2. accuracy: points with a reported accuracy worse than `max_accuracy_m`.
+3. radius compression: of consecutive points within `compression_radius_km`
+   of each other, like a phone sitting still, only the first is kept.
+4. Douglas-Peucker: points within `tolerance_m` of the line between the points
+   around them, like along a straight road, are dropped.
+
+Stages 3 and 4 only drop points that are within `compression_radius_km` plus
+`tolerance_m` of the simplified path, so the path OSRM matches never moves
+further than that from the recorded one.
+"""
+from collections import OrderedDict
+import numpy as np
+
+from .stops import EARTH_RADIUS_KM, haversine_km, outside_radius_finder, _minutes
+
+
+def speed_filter(lat, lng, times, max_speed_kmh=500.):
+    """Drops points that are reached from the previous kept point faster than `max_speed_kmh`.
+
+    Like skmob's `filtering.filter`, a point with the same time as the previous
+    kept point is dropped too, and after a point is dropped the next one is
+    compared with the last point that was kept.
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask of the points to keep
+    """
+    keep = np.ones(len(lat), dtype=bool)
+    if len(lat) < 2:
+        return keep
+    minutes = _minutes(times)
+    while True:
+        idx = np.flatnonzero(keep)
+        prev, cur = idx[:-1], idx[1:]
+        dt = (minutes[cur] - minutes[prev]) / 60.
+        dr = haversine_km(lat[prev], lng[prev], lat[cur], lng[cur])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            too_fast = (dt <= 0) | (dr / dt > max_speed_kmh)
+        if not too_fast.any():
+            return keep
+        # only drop the first of consecutive violations: the ones after it are
+        # compared against an earlier point on the next pass
+        first = too_fast & ~np.concatenate([[False], too_fast[:-1]])
+        keep[cur[first]] = False
+
+
+def accuracy_filter(accuracy, max_accuracy_m=None):
+    """Drops points with a reported accuracy radius over `max_accuracy_m`. Points
+    without an accuracy are kept.
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask of the points to keep
+    """
+    accuracy = np.asarray(accuracy, dtype=float)
+    if max_accuracy_m is None:
+        return np.ones(len(accuracy), dtype=bool)
+    return ~(accuracy > max_accuracy_m)
+
+
+def radius_compression(lat, lng, radius_km=0.05):
+    """Keeps the first of each run of consecutive points within `radius_km` of it,
+    and the last point.
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask of the points to keep
+    """
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    first_outside = outside_radius_finder(lat, lng, radius_km)
+    anchor = 0
+    while anchor is not None:
+        keep[anchor] = True
+        anchor = first_outside(anchor) if anchor < n - 1 else None
+    keep[-1] = True
+    return keep
+
+
+def douglas_peucker(lat, lng, tolerance_m=10.):
+    """Douglas-Peucker line simplification, on coordinates projected to meters
+    around the trajectory's mean latitude.
+
+    Returns
+    -------
+    numpy.ndarray
+        boolean mask of the points to keep
+    """
+    n = len(lat)
+    keep = np.zeros(n, dtype=bool)
+    if n < 3:
+        keep[:] = True
+        return keep
+    meters_per_degree = EARTH_RADIUS_KM * 1000. * np.pi / 180.
+    y = np.asarray(lat) * meters_per_degree
+    x = np.asarray(lng) * meters_per_degree * np.cos(np.radians(np.mean(lat)))
+
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        length2 = dx * dx + dy * dy
+        # distance to the segment, not the line, so out and back trips aren't flattened
+        t = np.clip((px * dx + py * dy) / length2, 0., 1.) if length2 > 0 else 0.
+        dist = np.hypot(px - t * dx, py - t * dy)
+        i = int(dist.argmax())
+        if dist[i] > tolerance_m:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def simplify(lat, lng, times, accuracy=None, max_speed_kmh=500., max_accuracy_m=None,
+             compression_radius_km=0.05, tolerance_m=10.):
+    """Runs each simplification stage in turn on a trajectory sorted by time.
+
+    Any stage can be turned off by passing None for its parameter.
+
+    Parameters
+    ----------
+    lat, lng : numpy.ndarray
+        coordinates of the trajectory, in degrees
+    times : numpy.ndarray
+        timestamps of the trajectory, sorted ascending
+    accuracy : numpy.ndarray, optional
+        accuracy radius of each point in meters, NaN if unknown
+    max_speed_kmh : float, optional
+        speed filter threshold, by default 500.
+    max_accuracy_m : float, optional
+        accuracy filter threshold, by default None
+    compression_radius_km : float, optional
+        radius compression threshold, by default 0.05
+    tolerance_m : float, optional
+        Douglas-Peucker tolerance, by default 10.
+
+    Returns
+    -------
+    (numpy.ndarray, OrderedDict)
+        positional indices of the points to keep, and the number of points
+        each stage removed
+    """
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    times = np.asarray(times, dtype='datetime64[ns]')
+    idx = np.arange(len(lat))
+    removed = OrderedDict()
+
+    stages = [
+        ('speed', max_speed_kmh,
+         lambda i: speed_filter(lat[i], lng[i], times[i], max_speed_kmh)),
+        ('accuracy', None if accuracy is None else max_accuracy_m,
+         lambda i: accuracy_filter(np.asarray(accuracy, dtype=float)[i], max_accuracy_m)),
+        ('compression', compression_radius_km,
+         lambda i: radius_compression(lat[i], lng[i], compression_radius_km)),
+        ('douglas_peucker', tolerance_m,
+         lambda i: douglas_peucker(lat[i], lng[i], tolerance_m)),
+    ]
+    for name, param, stage in stages:
+        if param is None or len(idx) == 0:
+            removed[name] = 0
+            continue
+        kept = idx[stage(idx)]
+        removed[name] = len(idx) - len(kept)
+        idx = kept
+    return idx, removed
@@ -0,0 +1,256 @@
+"""
+Stop and trip detection on contiguous lat/lng/time arrays.
+
+This is the stop detection algorithm from skmob's `detection.stops` [RT2004],
+with the same parameters and results, rewritten so it doesn't walk the
+trajectory one point at a time:
+
+- distances between consecutive points are computed in one vectorized
+  haversine, and accumulated into a cumulative path length;
+- the straight-line distance from a stop's first point to any later point is
+  at most the path length between them, so every point until the path length
+  exceeds the stop radius is known to be inside it, and the first point that
+  leaves the radius can be found with a searchsorted plus one distance check;
+- stops and trips are returned as positional index ranges into the arrays,
+  instead of copies of the trajectory.
+
+.. [RT2004] Ramaswamy, H. & Toyama, K. (2004) Project Lachesis: parsing and
+   modeling location histories.
+"""
+from collections import namedtuple
+import numpy as np
+
+# same as skmob's gislib
+EARTH_RADIUS_KM = 6371.0
+# slack for floating point error when comparing path length to the stop radius
+_PATH_EPSILON_KM = 1e-9
+
+Stop = namedtuple(
+    'Stop',
+    ['lat', 'lng', 'arrival', 'leaving']
+)
+Stop.__doc__ = '''
+A place the trajectory stayed at.
+
+lat, lng - median location of the points in the stop
+arrival - index of the first point in the stop. None for the start of a trajectory
+leaving - index of the point the stop is estimated to end at. None for the end of a trajectory
+'''
+
+Trip = namedtuple(
+    'Trip',
+    ['start', 'stop', 'origin', 'destination']
+)
+Trip.__doc__ = '''
+The part of a trajectory between two stops.
+
+start, stop - positional indices of the trip's points, [start, stop)
+origin - the Stop the trip leaves from
+destination - the Stop the trip ends at
+'''
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km. Takes scalars or numpy arrays, in degrees."""
+    lat1, lng1, lat2, lng2 = (np.radians(x) for x in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2.) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2.) ** 2
+    return EARTH_RADIUS_KM * 2. * np.arctan2(np.sqrt(a), np.sqrt(1. - a))
+
+
+def _minutes(times):
+    return np.asarray(times, dtype='datetime64[ns]').astype(np.int64) / 6e10
+
+
+def _first_outside(lat, lng, anchor, start, end, radius_km, block=32):
+    """Index of the first point in [start, end] further than `radius_km` from `anchor`, or None"""
+    while start <= end:
+        stop = min(start + block, end + 1)
+        outside = haversine_km(lat[anchor], lng[anchor],
+                               lat[start:stop], lng[start:stop]) > radius_km
+        if outside.any():
+            return start + int(outside.argmax())
+        start = stop
+        block *= 2
+    return None
+
+
+def outside_radius_finder(lat, lng, radius_km, bound=None):
+    """Builds a function to find the first point that leaves a radius around another point.
+
+    Every point before the path length from an anchor exceeds `radius_km` is
+    known to be within the radius, so the search starts there. Usually that
+    point is also the first one outside, which is checked for every point at
+    once, up front.
+
+    Parameters
+    ----------
+    lat, lng : numpy.ndarray
+        coordinates of the trajectory, in degrees
+    radius_km : float
+        radius around each anchor point
+    bound : numpy.ndarray, optional
+        for each point, the last index to search up to. By default the end
+        of the trajectory.
+
+    Returns
+    -------
+    function
+        takes an anchor index, and returns the index of the first later point
+        up to its bound that is further than `radius_km` from it, or None
+    """
+    n = len(lat)
+    if bound is None:
+        bound = np.full(n, n - 1)
+    path = np.concatenate([[0.], np.cumsum(
+        haversine_km(lat[:-1], lng[:-1], lat[1:], lng[1:]))])
+    candidate = np.searchsorted(path, path + radius_km - _PATH_EPSILON_KM, 'right')
+    candidate = np.maximum(candidate, np.arange(n) + 1)
+    in_bounds = candidate <= bound
+    safe = np.where(in_bounds, candidate, n - 1)
+    exact = in_bounds & (haversine_km(lat, lng, lat[safe], lng[safe]) > radius_km)
+    exact = np.where(exact, candidate, -1).tolist()
+    candidate, bound = candidate.tolist(), bound.tolist()
+
+    def first_outside(anchor):
+        if exact[anchor] >= 0:
+            return exact[anchor]
+        return _first_outside(lat, lng, anchor, candidate[anchor], bound[anchor], radius_km)
+    return first_outside
+
+
+def _leaving_index(lat, lng, minutes, anchor, end, min_speed_kmh, after_gap):
+    """Estimates when a stop starting at `anchor` was left, given that `end` is outside it.
+
+    Walks back from `end` while the average speed since arriving is at least
+    `min_speed_kmh`; the stop ends at the point after the last slow one.
+
+    Returns:
+        (int, int): index of the leaving point, and the number of points that
+            belong to the stop, starting at `anchor`
+    """
+    if min_speed_kmh is None:
+        return end, end - anchor
+    dt = minutes[anchor + 1:end + 1] - minutes[anchor]
+    dr = haversine_km(lat[anchor], lng[anchor],
+                      lat[anchor + 1:end + 1], lng[anchor + 1:end + 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speeds = np.where(dt == 0, 0., dr / dt * 60.)
+    if after_gap:
+        # skmob also counts the anchor itself, at speed 0, after a gap
+        speeds = np.concatenate([[0.], speeds])
+    # speeds[-j] for j = 1 .. len(speeds) - 1
+    slow = speeds[:0:-1] < min_speed_kmh
+    if slow.any():
+        j = int(slow.argmax()) + 1
+    else:
+        j = max(len(speeds) - 1, 1)
+    if j == 1:
+        return end, end - anchor
+    return end - j + 1, end - anchor - j
+
+
+def detect_stops(lat, lng, times, stop_radius_km=1., minutes_for_a_stop=5.,
+                 min_speed_kmh=20., no_data_for_minutes=60.):
+    """Finds stops in a trajectory sorted by time.
+
+    A stop is a stay of more than `minutes_for_a_stop` minutes within
+    `stop_radius_km` of its first point. Gives the same stops as
+    skmob's `detection.stops` with `spatial_radius_km=stop_radius_km`.
+
+    Parameters
+    ----------
+    lat, lng : numpy.ndarray
+        coordinates of the trajectory, in degrees
+    times : numpy.ndarray
+        timestamps of the trajectory, sorted ascending
+    stop_radius_km : float, optional
+        radius of a stop, by default 1.
+    minutes_for_a_stop : float, optional
+        minimum duration of a stop, by default 5.
+    min_speed_kmh : float, optional
+        speed used to estimate when a stop was left. If None, a stop is left
+        at the first point outside of it. By default 20.
+    no_data_for_minutes : float, optional
+        gaps in the data longer than this are never part of a stop, by default 60.
+
+    Returns
+    -------
+    list
+        list of Stop namedtuples, in order
+    """
+    lat = np.asarray(lat, dtype=float)
+    lng = np.asarray(lng, dtype=float)
+    minutes = _minutes(times)
+    n = len(lat)
+    if n < 2:
+        return []
+    last = n - 1
+
+    # a gap before point k resets the stop to start at k
+    gap_before = np.flatnonzero(np.diff(minutes) > no_data_for_minutes) + 1
+    next_gap = np.append(gap_before, n)[np.searchsorted(gap_before, np.arange(n), 'right')]
+
+    first_outside = outside_radius_finder(
+        lat, lng, stop_radius_km, np.minimum(next_gap - 1, last))
+    next_gap = next_gap.tolist()
+    minute_list = minutes.tolist()
+    stops = []
+    anchor, after_gap = 0, False
+    while anchor < last:
+        end = first_outside(anchor)
+        if end is None:
+            if next_gap[anchor] <= last:
+                # no data for a while: start over after the gap
+                anchor, after_gap = next_gap[anchor], True
+                continue
+            end = last
+        is_last = end == last
+
+        if minute_list[end] - minute_list[anchor] > minutes_for_a_stop or is_last:
+            leaving, n_points = _leaving_index(lat, lng, minutes, anchor, end,
+                                               min_speed_kmh, after_gap)
+            if n_points > 0 and minute_list[leaving] - minute_list[anchor] > minutes_for_a_stop:
+                stops.append(Stop(
+                    float(np.median(lat[anchor:anchor + n_points])),
+                    float(np.median(lng[anchor:anchor + n_points])),
+                    anchor, leaving))
+        anchor, after_gap = end, False
+    return stops
+
+
+def segment_trips(lat, lng, times, stops):
+    """Splits a trajectory sorted by time into trips between stops.
+
+    The start and the end of the trajectory are treated as stops too. A trip
+    covers every point from when its origin was left until its destination
+    was arrived at, inclusive, and is skipped if that's fewer than two points.
+
+    Parameters
+    ----------
+    lat, lng : numpy.ndarray
+        coordinates of the trajectory, in degrees
+    times : numpy.ndarray
+        timestamps of the trajectory, sorted ascending
+    stops : list
+        Stops in the trajectory, as returned by `detect_stops`
+
+    Returns
+    -------
+    (list, list)
+        the Stops including the start and end of the trajectory, and the Trips
+        between them
+    """
+    times = np.asarray(times, dtype='datetime64[ns]')
+    if len(times) == 0:
+        return [], []
+    endpoints = [Stop(float(lat[0]), float(lng[0]), None, 0)] + list(stops) + \
+        [Stop(float(lat[-1]), float(lng[-1]), len(times) - 1, None)]
+
+    trips = []
+    for origin, destination in zip(endpoints[:-1], endpoints[1:]):
+        start = int(np.searchsorted(times, times[origin.leaving], 'left'))
+        stop = int(np.searchsorted(times, times[destination.arrival], 'right'))
+        if stop - start > 1:
+            trips.append(Trip(start, stop, origin, destination))
+    return endpoints, trips
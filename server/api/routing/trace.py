@@ -0,0 +1,140 @@
+"""
+The mapping between a trajectory's points and its map-matched geometry.
+
+When a trajectory is matched, we keep a "trace": for every point OSRM matched
+with enough confidence, its time, the index of its vertex in the matched
+geometry, and the matched distance from the start of the geometry to it. Any
+part of the trajectory, like a job within a shift, can then be read off the
+match by slicing it between two times, instead of matching it again.
+
+Parts of the trajectory that weren't matched confidently (low-confidence
+matchings, breaks between matchings, and gaps between segments that were
+routed across) are kept as `uncertain` time ranges, and slices that overlap
+them aren't trusted.
+
+A trace is a plain dict, so it can be stored as JSON:
+
+    {'times': [seconds since the epoch, ...],
+     'indices': [vertex index in the geometry, ...],
+     'meters': [matched distance from the start of the geometry, ...],
+     'uncertain': [[start time, end time], ...]}
+"""
+import numpy as np
+
+
+def empty_trace():
+    return {'times': [], 'indices': [], 'meters': [], 'uncertain': []}
+
+
+def epoch_seconds(times):
+    """Converts a datetime, or an array of them, to seconds since the epoch"""
+    return np.asarray(times, dtype='datetime64[ns]').astype(np.int64) / 1e9
+
+
+def waypoint_vertices(matching, waypoints):
+    """
+    Finds the vertices of a matching's geometry that its waypoints were snapped to.
+
+    Each leg's distance annotation has one entry per segment of the geometry,
+    so the vertex of waypoint k is the number of segments in the legs before
+    it. If the matching has no annotations, or they don't add up to its
+    geometry, falls back to the nearest vertex to each waypoint's location,
+    never going backwards.
+
+    Parameters
+    ----------
+    matching : dict
+        an OSRM matching, with geojson geometry
+    waypoints : list
+        (waypoint_index, [x, y] location) of each waypoint to find, in order
+
+    Returns
+    -------
+    list
+        index in the matching's geometry of each waypoint
+    """
+    coordinates = matching['geometry']['coordinates']
+    try:
+        segments = [len(leg['annotation']['distance']) for leg in matching['legs']]
+    except (KeyError, TypeError):
+        segments = None
+    if segments is not None and sum(segments) == len(coordinates) - 1:
+        vertices = np.concatenate([[0], np.cumsum(segments)]).astype(int)
+        return [int(vertices[w]) for w, _ in waypoints]
+
+    coords = np.asarray(coordinates, dtype=float)
+    found, start = [], 0
+    for _, location in waypoints:
+        start += int(((coords[start:] - np.asarray(location, dtype=float)) ** 2)
+                     .sum(axis=1).argmin())
+        found.append(start)
+    return found
+
+
+def waypoint_meters(matching):
+    """Matched distance from the start of a matching to each of its waypoints, in meters"""
+    distances = [leg['distance'] for leg in matching['legs']]
+    return np.concatenate([[0.], np.cumsum(distances)]).tolist()
+
+
+def append_trace(trace, piece, index_offset=0, meters_offset=0.):
+    """
+    Appends `piece`, the trace of a geometry appended to `trace`'s, in place.
+
+    Parameters
+    ----------
+    trace : dict
+        trace to extend
+    piece : dict
+        trace to append, with indices and meters relative to its own geometry
+    index_offset : int, optional
+        index of the first vertex of the piece's geometry in the combined one
+    meters_offset : float, optional
+        matched distance to the start of the piece's geometry, in meters
+    """
+    if not piece:
+        return trace
+    trace['times'].extend(float(t) for t in piece['times'])
+    trace['indices'].extend(int(i) + index_offset for i in piece['indices'])
+    trace['meters'].extend(float(m) + meters_offset for m in piece['meters'])
+    trace['uncertain'].extend([float(t0), float(t1)] for t0, t1 in piece['uncertain'])
+    return trace
+
+
+def slice_trace(trace, geometry, start_time, end_time):
+    """
+    Reads the part of a matched geometry between two times off its trace.
+
+    The vertex index and distance at `start_time` and `end_time` are
+    interpolated in time between the points of the trace around them.
+
+    Parameters
+    ----------
+    trace : dict
+        trace of `geometry`
+    geometry : list
+        matched geometry as [[x,y], ...]
+    start_time, end_time : datetime
+        times to slice between
+
+    Returns
+    -------
+    tuple
+        (geometry as [[x,y], ...], distance in meters), or None if the trace
+        doesn't cover the whole time range, or part of it is uncertain
+    """
+    if not trace or not geometry or len(trace['times']) < 2:
+        return None
+    times = np.asarray(trace['times'], dtype=float)
+    start, end = float(epoch_seconds(start_time)), float(epoch_seconds(end_time))
+    if start < times[0] or end > times[-1] or end <= start:
+        return None
+    if any(t0 < end and t1 > start for t0, t1 in trace['uncertain']):
+        return None
+
+    first, last = np.interp([start, end], times, np.asarray(trace['indices'], dtype=float))
+    meters = np.interp([start, end], times, np.asarray(trace['meters'], dtype=float))
+    sliced = geometry[int(np.floor(first)):int(np.ceil(last)) + 1]
+    if len(sliced) < 2:
+        return None
+    return sliced, float(meters[1] - meters[0])
@@ -1,7 +1,15 @@
 
+from config import get_environment_config
+
+c = get_environment_config()
+
+
 def meters_to_miles(x):
     return x * 0.0006213712
 
+def miles_to_meters(x):
+    return x / 0.0006213712
+
 def _get_trajectory_from_location_objects(locations):
     from geoalchemy2.shape import to_shape
     import numpy as np
@@ -23,7 +31,7 @@ def _get_trajectory_from_location_objects(locations):
     for l in locations:
         try:
             coords = to_shape(l.geom)
-            records.append([coords.y, coords.x, pd.to_datetime(l.timestamp)])
+            records.append([coords.y, coords.x, pd.to_datetime(l.timestamp), l.accuracy])
         except Exception as e:
             print("Problem translating location into shape. Location:",
                   l, ". Exception:", e)
@@ -31,20 +39,100 @@ def _get_trajectory_from_location_objects(locations):
     traj = np.array(sorted(records, key=lambda r: r[2]))
     print("trajectory of length: ", len(traj))
     data = pd.DataFrame(np.vstack((traj.T)).T)
-    data.columns = ['lat', 'lng', 'timestamp']
+    data.columns = ['lat', 'lng', 'timestamp', 'accuracy']
     return data
 
 
-def clean_trajectory(locs):
+def load_location_arrays(shift_ids, start_time=None, end_time=None):
+    """
+    Loads the coordinates and timestamps of a shift's locations as numpy arrays, without
+    building Location objects.
+
+    Runs a single SELECT of ST_Y(geom), ST_X(geom) and timestamp, sorted by timestamp.
+    Locations of shifts that have been archived are read from their archives.
+
+    Parameters
+    ----------
+    shift_ids : UUID | list
+        A shift id, or a list of shift ids to load locations from
+    start_time : datetime, optional
+        Only include locations recorded at or after this time
+    end_time : datetime, optional
+        Only include locations recorded at or before this time
+
+    Returns
+    -------
+    dict
+        A dict of arrays with keys 'lat', 'lng', 'accuracy' (floats, NaN if unknown)
+        and 'timestamp' (datetime64)
+    """
+    import numpy as np
+    import pandas as pd
+    from sqlalchemy import select, func
+    from api.models import db, Location, read_archived_locations
+
+    if not isinstance(shift_ids, (list, tuple, set)):
+        shift_ids = [shift_ids]
+    query = (select(func.ST_Y(Location.geom), func.ST_X(Location.geom), Location.timestamp,
+                    Location.accuracy)
+             .where(Location.shift_id.in_(list(shift_ids)),
+                    Location.geom.isnot(None)))
+    # psycopg2 can't adapt numpy or pandas timestamps
+    if start_time is not None:
+        start_time = pd.Timestamp(start_time).to_pydatetime()
+        query = query.where(Location.timestamp >= start_time)
+    if end_time is not None:
+        end_time = pd.Timestamp(end_time).to_pydatetime()
+        query = query.where(Location.timestamp <= end_time)
+    rows = db.session.execute(query.order_by(Location.timestamp)).fetchall()
+    archived = [(l['lat'], l['lng'], l['timestamp'], l['accuracy'])
+                for locations in read_archived_locations(shift_ids).values()
+                for l in locations
+                if l['lat'] is not None and
+                (start_time is None or l['timestamp'] >= start_time) and
+                (end_time is None or l['timestamp'] <= end_time)]
+    if archived:
+        rows = sorted(list(rows) + archived, key=lambda r: r[2])
+
+    lat, lng, timestamp, accuracy = zip(*rows) if rows else ((), (), (), ())
+    return {'lat': np.array(lat, dtype=float),
+            'lng': np.array(lng, dtype=float),
+            'timestamp': np.array(timestamp, dtype='datetime64[ns]'),
+            'accuracy': np.array(accuracy, dtype=float)}
+
+
+def load_locations(shift_ids, start_time=None, end_time=None):
+    """
+    Loads a shift's locations into a DataFrame with lat, lng, timestamp and accuracy columns,
+    sorted by timestamp. Takes the same arguments as `load_location_arrays`.
+    """
+    import pandas as pd
+    return pd.DataFrame(load_location_arrays(shift_ids, start_time, end_time))
+
+
+def load_trajectory(shift_ids, start_time=None, end_time=None, simplify=True):
+    """
+    Loads a shift's locations into a cleaned TrajDataFrame, ready for matching. Takes the
+    same arguments as `load_location_arrays`, and `simplify` as for `clean_trajectory`.
+    """
+    return clean_trajectory(load_locations(shift_ids, start_time, end_time), simplify)
+
+
+def clean_trajectory(locs, simplify=True):
     """
     Cleans and filters a list of Location objects, and processes into a TrajDataFrame
 
-    It filters out points that have a max speed of over 500kmh, and compresses trajectory data within a radius of 0.05km.
+    If `simplify` is True, it runs the trajectory through `simplify_trajectory` to drop
+    points that are noise or redundant for map matching. Use simplify=False when every
+    recorded point is needed, like for stop detection.
 
     Parameters
     ----------
-    locs : list
-        Locations to clean, filter, and transform into TrajDataFrame
+    locs : list | DataFrame
+        Locations to clean, filter, and transform into TrajDataFrame. Either Location
+        objects, or a DataFrame with lat, lng and timestamp columns from `load_locations`
+    simplify : bool, optional
+        Whether to simplify the trajectory for map matching, by default True
 
     Returns
     -------
@@ -52,19 +140,50 @@ def clean_trajectory(locs):
         Cleaned and filtered trajectory dataframe
     """    
 
+    import pandas as pd
     from skmob import TrajDataFrame
-    from skmob.preprocessing import compression, filtering, detection
-    data = _get_trajectory_from_location_objects(locs)
+    if isinstance(locs, pd.DataFrame):
+        data = locs
+    else:
+        data = _get_trajectory_from_location_objects(locs)
 
-    # filter and compress our location dataset
     tdf = TrajDataFrame(data, datetime='timestamp')
-    ftdf = filtering.filter(tdf, max_speed_kmh=500.)
-    print("filtered {} locs from trajectory of length {}".format(
-        len(tdf) - len(ftdf), len(tdf)))
-    print("compressed trajectory is length {}".format(len(tdf)))
+    if simplify:
+        tdf = simplify_trajectory(tdf)
     return tdf
 
 
+def simplify_trajectory(tdf, **options):
+    """
+    Simplifies a TrajDataFrame for map matching, with the stages in api.routing.simplify.
+
+    Stage parameters default to the MATCH_* settings in config.py, and can be overridden
+    with keyword arguments, e.g. `tolerance_m=None` to skip Douglas-Peucker. Every point
+    removed by compression or Douglas-Peucker is within MATCH_COMPRESSION_RADIUS_KM plus
+    MATCH_SIMPLIFY_TOLERANCE_M of the simplified path.
+
+    Parameters
+    ----------
+    tdf : TrajDataFrame
+        Trajectory to simplify, sorted by datetime. May have an accuracy column, in meters.
+
+    Returns
+    -------
+    TrajDataFrame
+        The kept rows of the trajectory
+    """
+    from .simplify import simplify
+    options = dict(dict(max_speed_kmh=c.MATCH_MAX_SPEED_KMH,
+                        max_accuracy_m=c.MATCH_MAX_ACCURACY_M,
+                        compression_radius_km=c.MATCH_COMPRESSION_RADIUS_KM,
+                        tolerance_m=c.MATCH_SIMPLIFY_TOLERANCE_M), **options)
+    accuracy = tdf['accuracy'].values if 'accuracy' in tdf.columns else None
+    keep, removed = simplify(tdf.lat.values, tdf.lng.values, tdf.datetime.values,
+                             accuracy, **options)
+    print("simplified trajectory of length {} to {}. removed: {}".format(
+        len(tdf), len(keep), ', '.join(f'{k} {v}' for k, v in removed.items())))
+    return tdf.iloc[keep].reset_index(drop=True)
+
 
 def bounding_box(points):
     """
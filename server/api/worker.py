@@ -0,0 +1,144 @@
+"""
+A durable work queue for shift post-processing, backed by the `tasks` table.
+
+Ending a shift queues a MATCH_SHIFT task and an EXTRACT_JOBS task and returns
+straight away. Workers, started with `python run.py worker`, claim tasks with
+`SELECT ... FOR UPDATE SKIP LOCKED`, so any number of them can share the
+database without running a task twice. A task isn't claimed while an earlier
+task for the same shift is still queued or running, so jobs are always
+extracted after their shift has been matched.
+
+A task that raises is retried after a backoff, up to TASK_MAX_ATTEMPTS times.
+A task whose worker died while running it is claimed again once it has been
+running for TASK_LEASE_SECONDS.
+"""
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import aliased
+
+from api.models import db, Task, TaskKind, TaskStatus, rehydrate_shift_locations, use_statement_timeout
+from api.models.pool import statement_timeout_kind
+from api.routing.osrmapi import Deadline
+from config import get_environment_config
+
+c = get_environment_config()
+
+
+def _match_shift(shift, deadline):
+    from api.graphql.mutation import updateShiftMileageAndGeometry
+    rehydrate_shift_locations(shift.id)
+    updateShiftMileageAndGeometry(shift, None, deadline)
+
+
+def _extract_jobs(shift, deadline):
+    from api.graphql.mutation import createJobsFromLocations
+    rehydrate_shift_locations(shift.id)
+    createJobsFromLocations(shift, None, deadline)
+
+
+HANDLERS = {
+    TaskKind.MATCH_SHIFT: _match_shift,
+    TaskKind.EXTRACT_JOBS: _extract_jobs,
+}
+
+
+def enqueue_shift_processing(shift):
+    """Queues matching a shift and extracting its jobs. The caller commits."""
+    for kind in (TaskKind.MATCH_SHIFT, TaskKind.EXTRACT_JOBS):
+        db.session.add(Task(kind=kind, shift_id=shift.id, status=TaskStatus.QUEUED,
+                            attempts=0, run_after=datetime.now()))
+
+
+def claim_task():
+    """Claims the next runnable task for this worker, or returns None if there isn't one.
+
+    Returns:
+        Task: the claimed task, committed as RUNNING
+    """
+    now = datetime.now()
+    earlier = aliased(Task)
+    blocked = (db.session.query(earlier.id)
+               .filter(earlier.shift_id == Task.shift_id,
+                       earlier.id < Task.id,
+                       earlier.status.in_([TaskStatus.QUEUED, TaskStatus.RUNNING]))
+               .exists())
+    lease_expired = now - timedelta(seconds=c.TASK_LEASE_SECONDS)
+    task = (Task.query
+            .filter(or_(and_(Task.status == TaskStatus.QUEUED, Task.run_after <= now),
+                        and_(Task.status == TaskStatus.RUNNING, Task.started_at < lease_expired)))
+            .filter(~blocked)
+            .order_by(Task.id)
+            .with_for_update(skip_locked=True)
+            .first())
+    if task is None:
+        db.session.rollback()
+        return None
+    task.status = TaskStatus.RUNNING
+    task.attempts += 1
+    task.started_at = now
+    db.session.commit()
+    return task
+
+
+def run_task(task):
+    """Runs a claimed task, and records whether it succeeded.
+
+    Returns:
+        bool: True if the task succeeded
+    """
+    current_app.logger.info(f'running {task}, attempt {task.attempts}')
+    task_id = task.id
+    try:
+        HANDLERS[task.kind](task.shift, Deadline(c.TASK_OSRM_DEADLINE))
+        task.status = TaskStatus.DONE
+        task.error = None
+        task.finished_at = datetime.now()
+        db.session.commit()
+        return True
+    except Exception as e:
+        current_app.logger.exception(f'task {task_id} failed')
+        db.session.rollback()
+        task = Task.query.get(task_id)
+        task.error = repr(e)
+        if task.attempts >= c.TASK_MAX_ATTEMPTS:
+            task.status = TaskStatus.FAILED
+            task.finished_at = datetime.now()
+        else:
+            task.status = TaskStatus.QUEUED
+            task.run_after = datetime.now() + timedelta(
+                seconds=c.TASK_RETRY_BACKOFF_SECONDS * 2 ** (task.attempts - 1))
+        db.session.commit()
+        return False
+
+
+def work(burst=False, poll_seconds=None):
+    """Claims and runs tasks until there are none left, or forever.
+
+    Args:
+        burst (bool, optional): return once there are no runnable tasks, instead of
+            waiting for more. Defaults to False.
+        poll_seconds (float, optional): seconds to wait between looking for tasks when
+            there are none. Defaults to TASK_POLL_SECONDS.
+
+    Returns:
+        int: the number of tasks run, if `burst` is True
+    """
+    poll_seconds = c.TASK_POLL_SECONDS if poll_seconds is None else poll_seconds
+    n_run = 0
+    # tasks get the worker's statement timeout, even if they're run eagerly in a request
+    previous_timeout = statement_timeout_kind()
+    use_statement_timeout('worker')
+    try:
+        while True:
+            task = claim_task()
+            if task is None:
+                if burst:
+                    return n_run
+                time.sleep(poll_seconds)
+                continue
+            run_task(task)
+            n_run += 1
+    finally:
+        use_statement_timeout(previous_timeout)
@@ -15,6 +15,71 @@ class Config(object):
     MIN_SHIFT_MILEAGE = 1
     MIN_SHIFT_DURATION = 5*60
     TOKEN_LIFETIME = 31
+    # number of already-matched locations re-sent to OSRM with each incremental match
+    INCREMENTAL_MATCH_OVERLAP = 5
+    # seconds each mutation may spend waiting on OSRM, including retries
+    OSRM_DEADLINE = 20
+    OSRM_LOCATION_UPDATE_DEADLINE = 5
+    # trajectory simplification before map matching, see api/routing/simplify.py.
+    # set any of these to None to skip that stage.
+    MATCH_MAX_SPEED_KMH = 500.
+    MATCH_MAX_ACCURACY_M = 100.
+    MATCH_COMPRESSION_RADIUS_KM = 0.05
+    MATCH_SIMPLIFY_TOLERANCE_M = 10.
+    # background processing of ended shifts, see api/worker.py
+    # run queued tasks inside the request that queued them, instead of in a worker
+    TASK_QUEUE_EAGER = False
+    # seconds an idle worker waits before looking for tasks again
+    TASK_POLL_SECONDS = 2
+    TASK_MAX_ATTEMPTS = 3
+    # a failed task is retried after this many seconds, doubling with each attempt
+    TASK_RETRY_BACKOFF_SECONDS = 30
+    # a task still running after this many seconds is assumed to have lost its worker
+    TASK_LEASE_SECONDS = 10*60
+    # seconds each task may spend waiting on OSRM, including retries
+    TASK_OSRM_DEADLINE = 120
+    # locations are partitioned by month. Partitions are created this many months ahead
+    # by `python run.py create_location_partitions`
+    LOCATION_PARTITION_MONTHS_AHEAD = 2
+    # days after a matched shift ends before `python run.py archive_locations` moves its
+    # locations to a compressed archive. See api/models/location_archive.py
+    LOCATION_ARCHIVE_AFTER_DAYS = 14
+    # login_required caches, see api/controllers/auth/cache.py
+    # seconds a verified token is trusted without decoding it again
+    AUTH_TOKEN_CACHE_SECONDS = 60
+    AUTH_TOKEN_CACHE_SIZE = 10000
+    # seconds a user is known to exist without checking. A deleted user can still
+    # authenticate to other processes for this long.
+    AUTH_USER_CACHE_SECONDS = 5*60
+    AUTH_USER_CACHE_SIZE = 10000
+    # database connections, see api/models/pool.py
+    # connections each process keeps open, and how many more it may open when they're all
+    # in use. Size these against uwsgi processes * threads and Postgres' max_connections.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    # seconds to wait for a connection before giving up
+    DB_POOL_TIMEOUT = 30
+    # seconds before a connection is replaced, so it's never closed under us by a proxy
+    DB_POOL_RECYCLE = 30*60
+    # check a connection is alive with a cheap query when it's checked out
+    DB_POOL_PRE_PING = True
+    # connect through PgBouncer in transaction pooling mode, which pools for us
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '').lower() in ('1', 'true')
+    # checkouts that wait longer than this many seconds are logged
+    DB_POOL_SLOW_CHECKOUT_SECONDS = 1.
+    # bearer token that /metrics/db_pool requires. Unset, the endpoint is disabled.
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # milliseconds each statement may run, by the kind of work it's part of. Statements
+    # outside of these (migrations, manage.py commands) don't time out.
+    DB_STATEMENT_TIMEOUTS = {
+        'query': 10*1000,
+        'mutation': 30*1000,
+        # any other request
+        'request': 10*1000,
+        'worker': 5*60*1000,
+        # each fetch from an export's cursors, see api/exports.py
+        'export': 60*1000,
+    }
 
 class DevelopmentConfig(Config):
     ENV = "DEVELOPMENT"
@@ -34,6 +99,9 @@ class TestingConfig(Config):
     DATABASE_NAME = "gigbox-testing"
     TESTING_TO_NUMBER = "+19082298992"
     DEBUG = False
+    # tests expect jobs as soon as a shift ends
+    TASK_QUEUE_EAGER = True
+    METRICS_TOKEN = "testing-metrics-token"
     SQLALCHEMY_DATABASE_URI = "postgresql://" + os.environ["POSTGRES_USER"] + ":"  \
                               + os.environ["POSTGRES_PASSWORD"] + "@" \
                               + os.environ["DB_HOST"] + ":" \
@@ -0,0 +1,74 @@
+"""store snapped geometries as polylines
+
+Revision ID: 3f6d2a8c51e0
+Revises: 8c1e4f2a9b07
+Create Date: 2026-10-18 11:02:13.508311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from api.routing import polyline
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6d2a8c51e0'
+down_revision = '8c1e4f2a9b07'
+branch_labels = None
+depends_on = None
+
+TABLES = ['shifts', 'jobs']
+BATCH_SIZE = 500
+JSON_COLUMNS = ['snapped_bbox', 'snapped_geometry']
+
+
+def _convert(table, select_sql, convert):
+    """Runs `convert` on every row from `select_sql`, and writes the results back in batches.
+
+    `convert` returns a dict of the columns to set, plus the row's `row_id`.
+    """
+    bind = op.get_bind()
+    rows = bind.execution_options(stream_results=True).execute(sa.text(select_sql))
+    batch = []
+    for row in rows:
+        batch.append(convert(row))
+        if len(batch) >= BATCH_SIZE:
+            _update(bind, table, batch)
+            batch = []
+    if batch:
+        _update(bind, table, batch)
+
+
+def _update(bind, table, batch):
+    columns = [k for k in batch[0] if k != 'row_id']
+    stmt = sa.text('UPDATE {} SET {} WHERE id = :row_id'.format(
+        table, ', '.join(f'{c} = :{c}' for c in columns)))
+    stmt = stmt.bindparams(*[sa.bindparam(c, type_=postgresql.JSONB)
+                             for c in columns if c in JSON_COLUMNS])
+    bind.execute(stmt, batch)
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('snapped_polyline', sa.Text(), nullable=True))
+        op.add_column(table, sa.Column('snapped_bbox', postgresql.JSONB(), nullable=True))
+        _convert(table,
+                 f"SELECT id, snapped_geometry FROM {table} "
+                 f"WHERE snapped_geometry IS NOT NULL AND snapped_geometry != 'null'::jsonb",
+                 lambda row: {'row_id': row[0],
+                              'snapped_polyline': polyline.encode(row[1].get('geometries') or []),
+                              'snapped_bbox': row[1].get('bounding_box')})
+        op.drop_column(table, 'snapped_geometry')
+
+
+def downgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('snapped_geometry', postgresql.JSONB(), nullable=True))
+        _convert(table,
+                 f"SELECT id, snapped_polyline, snapped_bbox FROM {table} "
+                 f"WHERE snapped_polyline IS NOT NULL",
+                 lambda row: {'row_id': row[0],
+                              'snapped_geometry': {'geometries': polyline.decode(row[1]),
+                                                   'bounding_box': row[2]}})
+        op.drop_column(table, 'snapped_bbox')
+        op.drop_column(table, 'snapped_polyline')
@@ -0,0 +1,44 @@
+"""deduplicate locations, and add location_batches
+
+Revision ID: 4d8b0e6a3c92
+Revises: 9a4f6b2d8e17
+Create Date: 2026-10-18 15:48:33.201457
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8b0e6a3c92'
+down_revision = '9a4f6b2d8e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keep one location for each time in a shift, and recount
+    op.execute('''
+        DELETE FROM locations a USING locations b
+        WHERE a.shift_id = b.shift_id AND a.timestamp = b.timestamp AND a.ctid > b.ctid
+    ''')
+    op.execute('''
+        UPDATE shifts SET location_count = l.n
+        FROM (SELECT shift_id, count(*) AS n FROM locations GROUP BY shift_id) AS l
+        WHERE shifts.id = l.shift_id
+    ''')
+    op.create_unique_constraint('uq_locations_shift_id_timestamp', 'locations',
+                                ['shift_id', 'timestamp'])
+    op.create_table('location_batches',
+    sa.Column('shift_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('batch_id', sa.String(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['shift_id'], ['shifts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('shift_id', 'batch_id')
+    )
+
+
+def downgrade():
+    op.drop_table('location_batches')
+    op.drop_constraint('uq_locations_shift_id_timestamp', 'locations', type_='unique')
@@ -0,0 +1,24 @@
+"""add matched_until to shifts
+
+Revision ID: 8c1e4f2a9b07
+Revises: 0eb7cba04194
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1e4f2a9b07'
+down_revision = '0eb7cba04194'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shifts', sa.Column('matched_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('shifts', 'matched_until')
@@ -0,0 +1,33 @@
+"""add location counters to shifts
+
+Revision ID: 9a4f6b2d8e17
+Revises: e5a83c1f7d26
+Create Date: 2026-10-18 15:05:09.842316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a4f6b2d8e17'
+down_revision = 'e5a83c1f7d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shifts', sa.Column('location_count', sa.Integer(),
+                                      server_default='0', nullable=False))
+    op.add_column('shifts', sa.Column('last_location_at', sa.DateTime(), nullable=True))
+    op.execute('''
+        UPDATE shifts SET location_count = l.n, last_location_at = l.last
+        FROM (SELECT shift_id, count(*) AS n, max(timestamp) AS last
+              FROM locations GROUP BY shift_id) AS l
+        WHERE shifts.id = l.shift_id
+    ''')
+
+
+def downgrade():
+    op.drop_column('shifts', 'last_location_at')
+    op.drop_column('shifts', 'location_count')
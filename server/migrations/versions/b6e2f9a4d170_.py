@@ -0,0 +1,106 @@
+"""partition locations by month, and add location_archives
+
+Revision ID: b6e2f9a4d170
+Revises: f8b2d4c6e913
+Create Date: 2026-10-18 19:12:47.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import date
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2f9a4d170'
+down_revision = 'f8b2d4c6e913'
+branch_labels = None
+depends_on = None
+
+# months after this one to create partitions for, as LOCATION_PARTITION_MONTHS_AHEAD
+MONTHS_AHEAD = 2
+
+
+def _add_months(month, n):
+    months = month.year * 12 + month.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def upgrade():
+    # the old table keeps its data until it's copied, under other names
+    op.execute('ALTER TABLE locations RENAME TO locations_unpartitioned')
+    op.execute('ALTER TABLE locations_unpartitioned '
+               'RENAME CONSTRAINT locations_pkey TO locations_unpartitioned_pkey')
+    op.execute('ALTER TABLE locations_unpartitioned RENAME CONSTRAINT '
+               'uq_locations_shift_id_timestamp TO uq_locations_unpartitioned_shift_id_timestamp')
+    op.execute('ALTER INDEX IF EXISTS idx_locations_geom RENAME TO idx_locations_unpartitioned_geom')
+
+    # the partition key has to be in every unique constraint, so it's in the primary key
+    op.execute('''
+        CREATE TABLE locations (
+            id uuid NOT NULL,
+            geom geometry(POINT, -1),
+            accuracy double precision,
+            timestamp timestamp without time zone NOT NULL,
+            shift_id uuid REFERENCES shifts (id) ON DELETE CASCADE,
+            CONSTRAINT locations_pkey PRIMARY KEY (id, timestamp),
+            CONSTRAINT uq_locations_shift_id_timestamp UNIQUE (shift_id, timestamp)
+        ) PARTITION BY RANGE (timestamp)''')
+    op.execute('CREATE INDEX idx_locations_geom ON locations USING gist (geom)')
+    op.execute('CREATE TABLE locations_default PARTITION OF locations DEFAULT')
+
+    first, = op.get_bind().execute(sa.text(
+        "SELECT date_trunc('month', min(timestamp)) FROM locations_unpartitioned")).first()
+    month = first.date() if first is not None else date.today().replace(day=1)
+    last = _add_months(date.today().replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        op.execute(f"CREATE TABLE locations_{month.year}_{month.month:02d} "
+                   f"PARTITION OF locations FOR VALUES FROM ('{month}') "
+                   f"TO ('{_add_months(month, 1)}')")
+        month = _add_months(month, 1)
+
+    op.execute('''INSERT INTO locations (id, geom, accuracy, timestamp, shift_id)
+                  SELECT id, geom, accuracy, timestamp, shift_id FROM locations_unpartitioned''')
+    op.execute('DROP TABLE locations_unpartitioned')
+    op.execute('ANALYZE locations')
+
+    op.create_table('location_archives',
+    sa.Column('shift_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('n_locations', sa.Integer(), nullable=False),
+    sa.Column('first_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('last_timestamp', sa.DateTime(), nullable=True),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['shift_id'], ['shifts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('shift_id')
+    )
+
+
+def downgrade():
+    n_archived, = op.get_bind().execute(sa.text('SELECT count(*) FROM location_archives')).first()
+    if n_archived:
+        raise RuntimeError(f'{n_archived} shifts have archived locations. Move them back with '
+                           'api.models.rehydrate_shift_locations before downgrading.')
+    op.drop_table('location_archives')
+
+    op.execute('ALTER TABLE locations RENAME TO locations_partitioned')
+    op.execute('ALTER TABLE locations_partitioned '
+               'RENAME CONSTRAINT locations_pkey TO locations_partitioned_pkey')
+    op.execute('ALTER TABLE locations_partitioned RENAME CONSTRAINT '
+               'uq_locations_shift_id_timestamp TO uq_locations_partitioned_shift_id_timestamp')
+    op.execute('ALTER INDEX idx_locations_geom RENAME TO idx_locations_partitioned_geom')
+    op.execute('''
+        CREATE TABLE locations (
+            id uuid NOT NULL,
+            geom geometry(POINT, -1),
+            accuracy double precision,
+            timestamp timestamp without time zone NOT NULL,
+            shift_id uuid REFERENCES shifts (id) ON DELETE CASCADE,
+            CONSTRAINT locations_pkey PRIMARY KEY (id),
+            CONSTRAINT uq_locations_shift_id_timestamp UNIQUE (shift_id, timestamp)
+        )''')
+    op.execute('CREATE INDEX idx_locations_geom ON locations USING gist (geom)')
+    op.execute('''INSERT INTO locations (id, geom, accuracy, timestamp, shift_id)
+                  SELECT id, geom, accuracy, timestamp, shift_id FROM locations_partitioned''')
+    # drops every partition along with it
+    op.execute('DROP TABLE locations_partitioned')
@@ -0,0 +1,26 @@
+"""add snapped_trace to shifts
+
+Revision ID: b71d4e9c2a53
+Revises: 3f6d2a8c51e0
+Create Date: 2026-10-18 13:40:27.604119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71d4e9c2a53'
+down_revision = '3f6d2a8c51e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shifts', sa.Column('snapped_trace', postgresql.JSONB(
+        astext_type=sa.Text()), nullable=True))
+
+
+def downgrade():
+    op.drop_column('shifts', 'snapped_trace')
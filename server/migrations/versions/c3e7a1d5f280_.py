@@ -0,0 +1,69 @@
+"""add user_daily_stats rollup
+
+Revision ID: c3e7a1d5f280
+Revises: 4d8b0e6a3c92
+Create Date: 2026-10-18 17:02:41.530118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e7a1d5f280'
+down_revision = '4d8b0e6a3c92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user_daily_stats',
+    sa.Column('user_id', sa.String(), nullable=False),
+    sa.Column('local_date', sa.Date(), nullable=False),
+    sa.Column('employer', sa.String(), nullable=False),
+    sa.Column('pay', sa.Float(), nullable=False),
+    sa.Column('tip', sa.Float(), nullable=False),
+    sa.Column('mileage', sa.Float(), nullable=False),
+    sa.Column('job_seconds', sa.Float(), nullable=False),
+    sa.Column('n_jobs', sa.Integer(), nullable=False),
+    sa.Column('n_paid_jobs', sa.Integer(), nullable=False),
+    sa.Column('n_tipped_jobs', sa.Integer(), nullable=False),
+    sa.Column('shift_seconds', sa.Float(), nullable=False),
+    sa.Column('n_shifts', sa.Integer(), nullable=False),
+    sa.Column('date_modified', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'local_date', 'employer')
+    )
+    # same sums as api.models.daily_stats.rebuild_daily_stats
+    op.execute('''
+        INSERT INTO user_daily_stats (user_id, local_date, employer, pay, tip, mileage,
+            job_seconds, n_jobs, n_paid_jobs, n_tipped_jobs, shift_seconds, n_shifts,
+            date_modified)
+        SELECT user_id, local_date, employer, sum(pay), sum(tip), sum(mileage),
+            sum(job_seconds), sum(n_jobs), sum(n_paid_jobs), sum(n_tipped_jobs),
+            sum(shift_seconds), sum(n_shifts), now()
+        FROM (
+            SELECT user_id, start_time::date AS local_date,
+                coalesce(employer::varchar, '') AS employer,
+                coalesce(total_pay, 0) AS pay, coalesce(tip, 0) AS tip,
+                coalesce(mileage, 0) AS mileage,
+                coalesce(mod(mod(floor(extract(epoch FROM end_time - start_time))::bigint,
+                                 86400) + 86400, 86400)::float, 0) AS job_seconds,
+                1 AS n_jobs,
+                CASE WHEN coalesce(total_pay, 0) != 0 THEN 1 ELSE 0 END AS n_paid_jobs,
+                CASE WHEN coalesce(tip, 0) != 0 THEN 1 ELSE 0 END AS n_tipped_jobs,
+                0::float AS shift_seconds, 0 AS n_shifts
+            FROM jobs WHERE start_time IS NOT NULL AND user_id IS NOT NULL
+            UNION ALL
+            SELECT user_id, start_time::date, '', 0, 0, 0, 0, 0, 0, 0,
+                coalesce(mod(mod(floor(extract(epoch FROM end_time - start_time))::bigint,
+                                 86400) + 86400, 86400)::float, 0),
+                1
+            FROM shifts WHERE start_time IS NOT NULL AND user_id IS NOT NULL
+        ) AS records
+        GROUP BY user_id, local_date, employer
+    ''')
+
+
+def downgrade():
+    op.drop_table('user_daily_stats')
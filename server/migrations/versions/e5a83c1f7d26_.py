@@ -0,0 +1,42 @@
+"""add tasks queue
+
+Revision ID: e5a83c1f7d26
+Revises: b71d4e9c2a53
+Create Date: 2026-10-18 14:22:51.370862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a83c1f7d26'
+down_revision = 'b71d4e9c2a53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tasks',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('kind', sa.Enum('MATCH_SHIFT', 'EXTRACT_JOBS', name='taskkind', native_enum=False, create_constraint=False), nullable=False),
+    sa.Column('shift_id', postgresql.UUID(as_uuid=True), nullable=False),
+    sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'DONE', 'FAILED', name='taskstatus', native_enum=False, create_constraint=False), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('date_created', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['shift_id'], ['shifts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_tasks_status_id', 'tasks', ['status', 'id'], unique=False)
+    op.create_index('ix_tasks_shift_id', 'tasks', ['shift_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_tasks_shift_id', table_name='tasks')
+    op.drop_index('ix_tasks_status_id', table_name='tasks')
+    op.drop_table('tasks')
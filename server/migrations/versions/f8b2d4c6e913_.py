@@ -0,0 +1,42 @@
+"""index the hot query predicates
+
+Revision ID: f8b2d4c6e913
+Revises: c3e7a1d5f280
+Create Date: 2026-10-18 18:26:05.917342
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8b2d4c6e913'
+down_revision = 'c3e7a1d5f280'
+branch_labels = None
+depends_on = None
+
+# name, table, columns (or USING clause). locations(shift_id, timestamp) is already
+# indexed by uq_locations_shift_id_timestamp.
+INDEXES = [
+    ('ix_shifts_user_id_active', 'shifts', '(user_id, active)'),
+    ('ix_shifts_user_id_start_time', 'shifts', '(user_id, start_time)'),
+    ('ix_jobs_user_id_start_time_end_time', 'jobs', '(user_id, start_time, end_time)'),
+    ('ix_jobs_shift_id_start_time_end_time', 'jobs', '(shift_id, start_time, end_time)'),
+    # dropped by 5bf4b1daafed, but geoalchemy2 expects it
+    ('idx_locations_geom', 'locations', 'USING gist (geom)'),
+]
+
+
+def upgrade():
+    # CONCURRENTLY doesn't lock out writes while the indexes build, but can't run
+    # in a transaction
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS "index"')
+        for name, table, columns in INDEXES:
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns}')
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, _, _ in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+        op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS "index" ON shifts (id, start_time)')
@@ -19,5 +19,52 @@ manager.add_command('db', MigrateCommand)
 manager.add_command('runserver', Server(
     host='0.0.0.0', port=5000, use_debugger=True))
 
+
+@manager.option('--burst', dest='burst', action='store_true', default=False,
+                help='exit once there are no tasks left to run')
+def worker(burst=False):
+    """Runs queued shift post-processing tasks. See api/worker.py"""
+    from api.worker import work
+    cprint("Starting worker...", 'green')
+    n_run = work(burst=burst)
+    cprint("Ran {} tasks.".format(n_run), 'green')
+
+
+@manager.option('--user', dest='user_id', default=None,
+                help='only rebuild the stats of this user')
+def rebuild_daily_stats(user_id=None):
+    """Rebuilds the user_daily_stats rollup from jobs and shifts. See api/models/daily_stats.py"""
+    from api.models import daily_stats
+    cprint("Rebuilding daily stats...", 'green')
+    n_rows = daily_stats.rebuild_daily_stats(user_id)
+    db.session.commit()
+    cprint("Wrote {} rows.".format(n_rows), 'green')
+
+
+@manager.option('--months-ahead', dest='months_ahead', type=int, default=None,
+                help='months after this one to create partitions for')
+def create_location_partitions(months_ahead=None):
+    """Creates upcoming monthly partitions of the locations table. See api/models/location.py"""
+    from api.models import location
+    months_ahead = (app.config['LOCATION_PARTITION_MONTHS_AHEAD']
+                    if months_ahead is None else months_ahead)
+    created = location.create_location_partitions(months_ahead)
+    db.session.commit()
+    cprint("Created partitions: {}".format(', '.join(created) or 'none'), 'green')
+
+
+@manager.option('--after-days', dest='after_days', type=float, default=None,
+                help='days since a shift ended before its locations are archived')
+@manager.option('--limit', dest='limit', type=int, default=None,
+                help='most shifts to archive')
+def archive_locations(after_days=None, limit=None):
+    """Archives the locations of cold shifts. See api/models/location_archive.py"""
+    from api.models import location_archive
+    after_days = (app.config['LOCATION_ARCHIVE_AFTER_DAYS']
+                  if after_days is None else after_days)
+    n_shifts, n_locations = location_archive.archive_cold_shifts(after_days, limit)
+    cprint("Archived {} locations from {} shifts.".format(n_locations, n_shifts), 'green')
+
+
 if __name__ == '__main__':
     manager.run()
@@ -8,12 +8,11 @@ import datetime
 from flask import current_app
 import jwt
 
-from .utils import ApiTestCase
+from .utils import ApiTestCase, count_queries
 from api import create_app, db
 from api.controllers.errors import custom_errors
 from api.controllers.auth.utils import create_jwt, decode_jwt, get_otp
 from api.models import User
-from api.models import engine as models_conn
 from unittest import mock
 
 
@@ -70,6 +69,42 @@ class TokenTestCase(ApiTestCase):
         self.assertIn(custom_errors['ExpiredTokenError']
                       ['message'], str(res.data))
 
+    def add_user(self, user_id):
+        with self.app.app_context():
+            db.session.add(User(user_id))
+            db.session.commit()
+            return create_jwt(user_id)
+
+    def test_authentication_is_cached(self):
+        """tests that once a token and its user are verified, requests with it don't query the database
+        """
+        token = self.add_user('cached-user')
+        res = self.client.get('/api/v1/auth/heartbeat',
+                                headers={'authorization': token})
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            with count_queries() as statements:
+                res = self.client.get('/api/v1/auth/heartbeat',
+                                        headers={'authorization': token})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(statements, [])
+
+    def test_400_after_unenrolling(self):
+        """tests that a deleted user's token stops working straight away, even though it was cached
+        """
+        token = self.add_user('unenrolling-user')
+        res = self.client.get('/api/v1/auth/heartbeat',
+                                headers={'authorization': token})
+        self.assertEqual(res.status_code, 200)
+        res = self.client.post('/graphql', json={'query': 'mutation { unenrollAndDelete { ok } }'},
+                                 headers={'authorization': token})
+        self.assertTrue(res.get_json()['data']['unenrollAndDelete']['ok'])
+        res = self.client.get('/api/v1/auth/heartbeat',
+                                headers={'authorization': token})
+        self.assertEqual(res.status_code, 400)
+        self.assertIn(custom_errors['InvalidTokenError']
+                      ['message'], str(res.data))
+
 
 class OTPTestCase(ApiTestCase):
 
@@ -0,0 +1,86 @@
+# test_exports.py
+# exporting jobs as a zip that's built while it's downloaded. See api/exports.py
+import csv
+import io
+import zipfile
+from datetime import datetime, timedelta
+from flask import request
+from graphql_relay import to_global_id
+
+from api import exports
+from api.models import db, Shift as ShiftModel, Job as JobModel, Screenshot as ScreenshotModel
+from api.controllers.auth.utils import decode_jwt
+from .utils import app, client, gqlClient, new_user_token, token
+
+EXPORT_MUTATION = '''mutation export($ids: [ID]!) {
+    exportJobs(ids: $ids) { ok fileUrl }
+}'''
+
+
+def add_jobs(user_id, n_jobs):
+    start = datetime.now() - timedelta(days=1)
+    shift = ShiftModel(user_id=user_id, active=False, start_time=start,
+                       end_time=start + timedelta(hours=2))
+    db.session.add(shift)
+    db.session.flush()
+    jobs = []
+    for n in range(n_jobs):
+        job = JobModel(shift.id, user_id, start_location={'lat': 42.3, 'lng': -71.1},
+                       end_location={'lat': 42.4, 'lng': -71.0})
+        job.start_time = start + timedelta(minutes=10 * n)
+        job.end_time = job.start_time + timedelta(minutes=5)
+        job.total_pay = 5. + n
+        db.session.add(job)
+        jobs.append(job)
+    db.session.commit()
+    return jobs
+
+
+def test_export_streams_jobs_and_screenshots(app, client, gqlClient, token, new_user_token,
+                                            tmp_path, monkeypatch):
+    monkeypatch.setattr(exports, 'EXPORTS_DIR', str(tmp_path / 'exports'))
+    monkeypatch.setattr(exports, 'IMAGES_DIR', str(tmp_path / 'images'))
+    # small chunks, so the zip is sent in many
+    monkeypatch.setattr(exports, 'CHUNK_SIZE', 1024)
+    (tmp_path / 'images').mkdir()
+    image = bytes(range(256)) * 40
+    (tmp_path / 'images' / 'screenshot.png').write_bytes(image)
+
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        jobs = add_jobs(user_id, 25)
+        db.session.add(ScreenshotModel(job_id=jobs[0].id, shift_id=jobs[0].shift_id,
+                                       user_id=user_id,
+                                       img_filename='/opt/data/images/screenshot.png'))
+        db.session.commit()
+        # someone else's job isn't exported, even if it's asked for
+        others = add_jobs(decode_jwt(token)['payload'], 1)
+        ids = [to_global_id('JobNode', j.id) for j in jobs + others]
+        job_ids = [str(j.id) for j in jobs]
+
+        request.headers = {'authorization': new_user_token}
+        res = gqlClient.execute(EXPORT_MUTATION, variables={'ids': ids}, context_value=request)
+        assert 'errors' not in res, res
+        url = res['data']['exportJobs']['fileUrl']
+
+    res = client.get(url)
+    assert res.status_code == 200
+    assert res.mimetype == 'application/zip'
+    # sent in chunks, as it's built
+    assert 'Content-Length' not in res.headers
+    chunks = [chunk for chunk in res.response if chunk]
+    res.close()
+    assert len(chunks) > 1
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    rows = list(csv.DictReader(io.TextIOWrapper(archive.open('jobs.csv'), encoding='utf-8')))
+    assert sorted(r['id'] for r in rows) == sorted(job_ids)
+    assert 'user_id' not in rows[0]
+    assert archive.read(f'{job_ids[0]}/screenshot.png') == image
+
+    # links are only good for one download
+    assert client.get(url).status_code == 404
+
+
+def test_export_links_must_be_tokens(app, client):
+    assert client.get('/exports/..%2Fimages%2Fscreenshot.zip').status_code == 404
+    assert client.get('/exports/not-a-token.zip').status_code == 404
@@ -0,0 +1,28 @@
+# test_geometry.py
+# tests in-process conversion of geometry column values, used by our graphql scalars.
+from geoalchemy2.shape import from_shape, to_shape
+from shapely import geometry
+
+from api.models import Geometry_GeoJSON, Geometry_WKT
+from api.models.geometry import to_wkt
+
+
+def test_points_serialize_like_postgis():
+    point = from_shape(geometry.Point(-71.1, 42.3))
+    assert Geometry_WKT.serialize(point) == 'POINT(-71.1 42.3)'
+    assert to_wkt(from_shape(geometry.Point(-71, 0.00001))) == 'POINT(-71 0.00001)'
+
+
+def test_wkt_round_trips():
+    parsed = Geometry_WKT.parse_value('POINT(-71.0589 42.3601)')
+    assert to_shape(parsed).equals(geometry.Point(-71.0589, 42.3601))
+    assert Geometry_WKT.serialize(parsed) == 'POINT(-71.0589 42.3601)'
+    line = Geometry_WKT.parse_value('LINESTRING(0 0, 1 1)')
+    assert Geometry_WKT.serialize(line) == 'LINESTRING(0 0, 1 1)'
+
+
+def test_geojson_round_trips():
+    point = from_shape(geometry.Point(-71.1, 42.3))
+    assert Geometry_GeoJSON.serialize(point) == {'type': 'Point', 'coordinates': (-71.1, 42.3)}
+    parsed = Geometry_GeoJSON.parse_value('{"type": "Point", "coordinates": [-71.1, 42.3]}')
+    assert to_shape(parsed).equals(geometry.Point(-71.1, 42.3))
@@ -0,0 +1,74 @@
+# test_indexes.py
+# seeds a large dataset and checks that our hot queries use an index, not a sequential scan.
+# Everything is seeded in a transaction that's rolled back afterwards.
+from sqlalchemy import text
+
+from api.models import db
+from .utils import app, client, token
+
+N_USERS = 200
+N_SHIFTS = 10000
+JOBS_PER_SHIFT = 5
+LOCATIONS_PER_SHIFT = 20
+N_LOCATION_SHIFTS = 10000
+
+SEED = [
+    f'''INSERT INTO users (id) SELECT 'explain-' || n FROM generate_series(1, {N_USERS}) n''',
+    f'''INSERT INTO shifts (id, user_id, start_time, end_time, active, location_count)
+        SELECT md5('shift' || n)::uuid, 'explain-' || (n % {N_USERS} + 1),
+               timestamp '2021-01-01' + n * interval '3 hours',
+               timestamp '2021-01-01' + n * interval '3 hours' + interval '2 hours',
+               n % {N_USERS * 10} = 0, 0
+        FROM generate_series(1, {N_SHIFTS}) n''',
+    f'''INSERT INTO jobs (id, user_id, shift_id, start_time, end_time, total_pay)
+        SELECT md5('job' || n)::uuid, 'explain-' || ((n / {JOBS_PER_SHIFT} + 1) % {N_USERS} + 1),
+               md5('shift' || (n / {JOBS_PER_SHIFT} + 1))::uuid,
+               timestamp '2021-01-01' + (n / {JOBS_PER_SHIFT} + 1) * interval '3 hours'
+                   + (n % {JOBS_PER_SHIFT}) * interval '20 minutes',
+               timestamp '2021-01-01' + (n / {JOBS_PER_SHIFT} + 1) * interval '3 hours'
+                   + (n % {JOBS_PER_SHIFT}) * interval '20 minutes' + interval '15 minutes',
+               10
+        FROM generate_series(0, {N_SHIFTS * JOBS_PER_SHIFT - 1}) n''',
+    f'''INSERT INTO locations (id, shift_id, timestamp, accuracy)
+        SELECT md5('location' || n)::uuid, md5('shift' || (n / {LOCATIONS_PER_SHIFT} + 1))::uuid,
+               timestamp '2021-01-01' + n * interval '30 seconds', 5
+        FROM generate_series(0, {N_LOCATION_SHIFTS * LOCATIONS_PER_SHIFT - 1}) n''',
+    'ANALYZE users, shifts, jobs, locations',
+]
+
+SHIFT_ID = "md5('shift' || 4242)::uuid"
+
+# (description, table that mustn't be scanned, query)
+HOT_QUERIES = [
+    ("a shift's locations", 'locations',
+     f"SELECT * FROM locations WHERE shift_id = {SHIFT_ID} ORDER BY timestamp"),
+    ("a shift's locations after a time", 'locations',
+     f"SELECT * FROM locations WHERE shift_id = {SHIFT_ID} AND timestamp > '2021-02-01'"),
+    ("a user's jobs in a range (stats, allJobs)", 'jobs',
+     "SELECT * FROM jobs WHERE user_id = 'explain-42' "
+     "AND start_time > '2021-02-01' AND end_time <= '2021-03-01'"),
+    ("jobs overlapping a trip (ExtractJobsFromShift)", 'jobs',
+     f"SELECT * FROM jobs WHERE shift_id = {SHIFT_ID} "
+     "AND start_time <= '2022-06-01 01:00' AND end_time >= '2022-06-01 00:30'"),
+    ("a user's active shift (getActiveShift)", 'shifts',
+     "SELECT * FROM shifts WHERE user_id = 'explain-42' AND active = true"),
+    ("a user's shifts by time (allShifts)", 'shifts',
+     "SELECT * FROM shifts WHERE user_id = 'explain-42' ORDER BY start_time DESC LIMIT 20"),
+]
+
+
+def test_hot_queries_use_indexes(app, token):
+    with app.app_context():
+        with db.engine.connect() as conn:
+            trans = conn.begin()
+            try:
+                for statement in SEED:
+                    conn.execute(text(statement))
+                scans = {}
+                for description, table, query in HOT_QUERIES:
+                    plan = '\n'.join(r[0] for r in conn.execute(text('EXPLAIN ' + query)))
+                    if f'Seq Scan on {table}' in plan:
+                        scans[description] = plan
+            finally:
+                trans.rollback()
+    assert not scans, scans
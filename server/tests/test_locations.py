@@ -0,0 +1,113 @@
+# test_locations.py
+# the monthly partitions of the locations table, and archiving cold shifts' locations.
+from datetime import datetime, timedelta
+from flask import request
+from graphql_relay import to_global_id
+from sqlalchemy import text
+
+from api.models import (db, Shift as ShiftModel, Location as LocationModel, LocationArchive,
+                        archive_cold_shifts, create_location_partitions,
+                        rehydrate_shift_locations)
+from api.models.location import insert_location_rows, insert_locations, partition_name
+from api.routing.utils import load_locations
+from api.controllers.auth.utils import decode_jwt
+from .utils import app, client, gqlClient, new_user_token, token
+
+
+def add_cold_shift(user_id, n_locations=30, days_ago=30):
+    start = datetime.now().replace(microsecond=123456) - timedelta(days=days_ago)
+    shift = ShiftModel(user_id=user_id, active=False, start_time=start,
+                       end_time=start + timedelta(hours=1),
+                       matched_until=start + timedelta(minutes=n_locations))
+    db.session.add(shift)
+    db.session.flush()
+    insert_locations(shift.id, [{'timestamp': start + timedelta(minutes=m),
+                                 'lat': 42.3 + m / 1000, 'lng': -71.1, 'accuracy': 5.}
+                                for m in range(n_locations)])
+    db.session.commit()
+    return shift
+
+
+def n_rows(shift_id):
+    return LocationModel.query.filter_by(shift_id=shift_id).count()
+
+
+def test_cold_shift_locations_are_archived_and_rehydrated(app, new_user_token, gqlClient):
+    with app.test_request_context():
+        shift = add_cold_shift(decode_jwt(new_user_token)['payload'])
+        before = load_locations(shift.id)
+
+        n_shifts, n_locations = archive_cold_shifts(after_days=14)
+        assert n_shifts >= 1 and n_locations >= 30
+        assert n_rows(shift.id) == 0
+        assert LocationArchive.query.get(shift.id).n_locations == 30
+
+        # still readable, without being moved back
+        assert load_locations(shift.id).equals(before)
+        request.headers = {'authorization': new_user_token}
+        res = gqlClient.execute('''query shift($id: ID!) {
+            node(id: $id) { ... on ShiftNode { locations { timestamp } } } }''',
+            variables={'id': to_global_id('ShiftNode', shift.id)}, context_value=request)
+        assert 'errors' not in res, res
+        assert len(res['data']['node']['locations']) == 30
+
+        # processing the shift again moves them back
+        assert rehydrate_shift_locations(shift.id) == 30
+        db.session.commit()
+        assert n_rows(shift.id) == 30
+        assert LocationArchive.query.get(shift.id) is None
+        assert load_locations(shift.id).equals(before)
+        assert ShiftModel.query.get(shift.id).location_count == 30
+
+
+def test_locations_without_a_point_are_archived_too(app, new_user_token):
+    with app.test_request_context():
+        shift = add_cold_shift(decode_jwt(new_user_token)['payload'])
+        insert_location_rows(shift.id, [{'timestamp': shift.start_time + timedelta(seconds=30),
+                                         'lng': None, 'lat': None}])
+        db.session.commit()
+
+        archive_cold_shifts(after_days=14)
+        assert n_rows(shift.id) == 0
+        assert LocationArchive.query.get(shift.id).n_locations == 31
+        # but they're still not read as points
+        assert len(load_locations(shift.id)) == 30
+
+        assert rehydrate_shift_locations(shift.id) == 31
+        db.session.commit()
+        assert LocationModel.query.filter_by(shift_id=shift.id, geom=None).count() == 1
+
+
+def test_retried_uploads_count_duplicates(app, new_user_token):
+    with app.test_request_context():
+        shift = add_cold_shift(decode_jwt(new_user_token)['payload'], n_locations=3, days_ago=1)
+        result = insert_locations(shift.id, [{'timestamp': shift.start_time + timedelta(minutes=m),
+                                              'lat': 42.3, 'lng': -71.1, 'accuracy': 5.}
+                                             for m in range(2, 5)])
+        db.session.commit()
+        assert (result.new, result.duplicates, result.location_count) == (2, 1, 5)
+
+
+def test_recent_shifts_are_not_archived(app, new_user_token):
+    with app.test_request_context():
+        shift = add_cold_shift(decode_jwt(new_user_token)['payload'], days_ago=1)
+        archive_cold_shifts(after_days=14)
+        assert n_rows(shift.id) == 30
+
+
+def test_partitions_take_rows_from_the_default_partition(app, new_user_token):
+    with app.test_request_context():
+        # a month that no partition covers yet, so its rows are in the default partition
+        shift = add_cold_shift(decode_jwt(new_user_token)['payload'], days_ago=365 * 30)
+        month = shift.start_time.date().replace(day=1)
+        try:
+            created = create_location_partitions(months_ahead=0)
+            assert partition_name(month) in created
+            in_partition = db.session.execute(text(
+                f'SELECT count(*) FROM {partition_name(month)} WHERE shift_id = :id'),
+                {'id': shift.id}).scalar()
+            assert in_partition == 30
+            assert n_rows(shift.id) == 30
+        finally:
+            # partitions are created in the transaction, so this drops them again
+            db.session.rollback()
@@ -0,0 +1,241 @@
+# test_mapmatch.py
+# tests trajectory processing in api.routing.mapmatch that doesn't need OSRM.
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+
+from api.routing.mapmatch import split_trajectory
+from api.routing.stops import detect_stops, haversine_km, segment_trips
+from api.routing.simplify import douglas_peucker, simplify, speed_filter
+from api.routing import polyline
+from api.routing.trace import append_trace, empty_trace, epoch_seconds, slice_trace, waypoint_vertices
+from .utils import locs, exodus_locs
+
+
+def make_trajectory(seconds):
+    start = datetime(2021, 6, 26, 17, 0, 0)
+    return pd.DataFrame({
+        'lat': [42.3 + n * 1e-4 for n in range(len(seconds))],
+        'lng': [-71.1 for _ in seconds],
+        'datetime': [start + timedelta(seconds=s) for s in seconds]})
+
+
+def test_short_trajectory_is_one_chunk():
+    segments = split_trajectory(make_trajectory(range(0, 500, 10)))
+    assert len(segments) == 1
+    assert len(segments[0]) == 1
+    assert segments[0][0] == (0, 50, None)
+
+
+def test_long_trajectory_is_split_into_overlapping_chunks():
+    segments = split_trajectory(make_trajectory(range(0, 2500, 10)),
+                                max_chunk_size=100, overlap=5)
+    chunks = segments[0]
+    assert len(segments) == 1
+    assert [(c.start, c.stop) for c in chunks] == [
+        (0, 100), (95, 195), (190, 250)]
+    assert [c.anchor_index for c in chunks] == [None, 4, 4]
+    assert all(c.stop - c.start <= 100 for c in chunks)
+
+
+def test_trajectory_is_split_at_time_gaps():
+    seconds = list(range(0, 300, 10)) + list(range(3600, 3900, 10))
+    segments = split_trajectory(make_trajectory(seconds), gap_minutes=10)
+    assert len(segments) == 2
+    assert segments[0][0] == (0, 30, None)
+    assert segments[1][0] == (30, 60, None)
+
+
+def get_trips(df):
+    lat, lng, times = df.lat.values, df.lng.values, df.time.values
+    stops = detect_stops(lat, lng, times)
+    return segment_trips(lat, lng, times, stops)
+
+
+def test_haversine_matches_known_distance():
+    # Boston to New York
+    assert abs(haversine_km(42.3601, -71.0589, 40.7128, -74.0060) - 306.1) < 0.5
+
+
+def test_finds_two_trips_in_example_shift(locs):
+    endpoints, trips = get_trips(locs)
+    assert len(endpoints) == 3
+    assert len(trips) == 2
+    # trips are contiguous, non-empty index ranges between consecutive stops
+    for trip, (origin, destination) in zip(trips, zip(endpoints, endpoints[1:])):
+        assert trip.origin == origin and trip.destination == destination
+        assert trip.stop - trip.start > 1
+    assert trips[0].stop <= trips[1].start + 1
+
+
+def test_finds_two_trips_in_exodus_trip(exodus_locs):
+    endpoints, trips = get_trips(exodus_locs)
+    stop = endpoints[1]
+    assert len(trips) == 2
+    assert exodus_locs.time[stop.leaving] - exodus_locs.time[stop.arrival] > timedelta(minutes=5)
+    assert trips[0].stop == stop.arrival + 1
+
+
+def test_gaps_in_data_are_not_stops():
+    # stationary for an hour, with a two hour gap in the middle
+    seconds = list(range(0, 1800, 60)) + list(range(9000, 10800, 60))
+    df = make_trajectory(seconds).assign(lat=42.3)
+    stops = detect_stops(df.lat.values, df.lng.values, df.datetime.values,
+                         no_data_for_minutes=60)
+    assert [(s.arrival, s.leaving) for s in stops] == [(30, 59)]
+    stops = detect_stops(df.lat.values, df.lng.values, df.datetime.values,
+                         no_data_for_minutes=600)
+    assert [(s.arrival, s.leaving) for s in stops] == [(0, 59)]
+
+
+def assert_stops_match_skmob(df):
+    # detect_stops is a rewrite of skmob's, so they should agree on real trajectories,
+    # with the parameters _get_trips_from_trajectory used to pass skmob
+    from skmob import TrajDataFrame
+    from skmob.preprocessing import detection
+    df = df.sort_values('time', kind='mergesort').reset_index(drop=True)
+    lat, lng = df.lat.values.astype(float), df.lng.values.astype(float)
+    times = df.time.values.astype('datetime64[ns]')
+    params = {'minutes_for_a_stop': 5., 'min_speed_kmh': 20., 'no_data_for_minutes': 60.}
+    ours = detect_stops(lat, lng, times, stop_radius_km=1., **params)
+    theirs = detection.stops(
+        TrajDataFrame(df.rename(columns={'time': 'datetime'})[['lat', 'lng', 'datetime']]),
+        spatial_radius_km=1., stop_radius_factor=0.75, leaving_time=True, **params)
+    assert len(ours) == len(theirs) > 0
+    assert [times[s.arrival] for s in ours] == list(theirs.datetime.values)
+    assert [times[s.leaving] for s in ours] == list(theirs.leaving_datetime.values)
+    assert np.allclose([s.lat for s in ours], theirs.lat.values)
+    assert np.allclose([s.lng for s in ours], theirs.lng.values)
+
+
+def test_stops_match_skmob_in_example_shift(locs):
+    assert_stops_match_skmob(locs)
+
+
+def test_stops_match_skmob_in_exodus_trip(exodus_locs):
+    assert_stops_match_skmob(exodus_locs)
+
+
+def distance_to_path_m(lat, lng, path_lat, path_lng):
+    # distance from each point to the nearest segment of a path, projected to meters
+    scale = 111195.
+    cos = np.cos(np.radians(np.mean(path_lat)))
+    x, y = lng * scale * cos, lat * scale
+    px, py = path_lng * scale * cos, path_lat * scale
+    ax, ay, dx, dy = px[:-1], py[:-1], np.diff(px), np.diff(py)
+    length2 = np.where(dx * dx + dy * dy > 0, dx * dx + dy * dy, 1.)
+    t = np.clip(((x[:, None] - ax) * dx + (y[:, None] - ay) * dy) / length2, 0., 1.)
+    return np.hypot(x[:, None] - ax - t * dx, y[:, None] - ay - t * dy).min(axis=1)
+
+
+def test_speed_filter_drops_spikes():
+    df = make_trajectory(range(0, 100, 10))
+    df.loc[4, 'lat'] = 43.3
+    keep = speed_filter(df.lat.values, df.lng.values, df.datetime.values)
+    assert list(np.flatnonzero(~keep)) == [4]
+
+
+def test_douglas_peucker_stays_within_tolerance(exodus_locs):
+    lat, lng = exodus_locs.lat.values, exodus_locs.lng.values
+    keep = douglas_peucker(lat, lng, tolerance_m=10.)
+    assert keep[0] and keep[-1]
+    assert keep.sum() < len(keep) / 2
+    assert distance_to_path_m(lat, lng, lat[keep], lng[keep]).max() <= 10.5
+
+
+def test_simplify_reports_what_each_stage_removed(locs):
+    lat, lng, times = locs.lat.values, locs.lng.values, locs.time.values
+    accuracy = np.full(len(locs), 5.)
+    accuracy[100:110] = 500.
+    keep, removed = simplify(lat, lng, times, accuracy, max_accuracy_m=100.,
+                             compression_radius_km=0.05, tolerance_m=10.)
+    assert list(removed) == ['speed', 'accuracy', 'compression', 'douglas_peucker']
+    assert removed['accuracy'] > 0
+    assert sum(removed.values()) == len(locs) - len(keep)
+    assert (np.diff(keep) > 0).all()
+
+    # every point left after filtering is close to the simplified path
+    filtered, _ = simplify(lat, lng, times, accuracy, max_accuracy_m=100.,
+                           compression_radius_km=None, tolerance_m=None)
+    assert distance_to_path_m(lat[filtered], lng[filtered],
+                              lat[keep], lng[keep]).max() <= 60.5
+
+
+def test_simplify_keeps_path_length(exodus_locs):
+    lat, lng, times = exodus_locs.lat.values, exodus_locs.lng.values, exodus_locs.time.values
+    keep, _ = simplify(lat, lng, times)
+
+    def length(i):
+        return haversine_km(lat[i][:-1], lng[i][:-1], lat[i][1:], lng[i][1:]).sum()
+    assert len(keep) < len(lat) / 2
+    assert abs(length(keep) - length(np.arange(len(lat)))) / length(np.arange(len(lat))) < 0.01
+
+
+def test_polyline_matches_reference_encoding():
+    # the example from Google's polyline algorithm docs, at 5 decimal places
+    coords = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert polyline.encode(coords, precision=5) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    assert polyline.decode('_p~iF~ps|U_ulLnnqC_mqNvxq`@', precision=5) == coords
+
+
+def test_polyline_round_trips_geometry(exodus_locs):
+    coords = [[round(lng, 6), round(lat, 6)]
+              for lat, lng in zip(exodus_locs.lat, exodus_locs.lng)]
+    encoded = polyline.encode(coords)
+    assert np.allclose(polyline.decode(encoded), coords, rtol=0, atol=1e-9)
+    assert polyline.encode([]) == '' and polyline.decode('') == []
+
+
+def make_trace(start, seconds, indices, meters, uncertain=()):
+    times = [epoch_seconds(start + timedelta(seconds=s)) for s in seconds]
+    return {'times': times, 'indices': indices, 'meters': meters,
+            'uncertain': [[times[a], times[b]] for a, b in uncertain]}
+
+
+def test_waypoints_are_found_from_leg_annotations():
+    matching = {'geometry': {'coordinates': [[0, 0], [1, 0], [2, 0], [2, 1], [2, 2]]},
+                'legs': [{'distance': 2., 'annotation': {'distance': [1., 1.]}},
+                         {'distance': 2., 'annotation': {'distance': [1., 1.]}}]}
+    assert waypoint_vertices(matching, [(0, [0, 0]), (1, [2, 0]), (2, [2, 2])]) == [0, 2, 4]
+    # without annotations, the nearest vertex that doesn't go backwards
+    del matching['legs'][0]['annotation']
+    assert waypoint_vertices(matching, [(1, [2.1, 0.1]), (2, [2, 1.9])]) == [2, 4]
+
+
+def test_trace_is_sliced_between_times():
+    start = datetime(2021, 6, 26, 17, 0, 0)
+    geometry = [[x, 0] for x in range(11)]
+    trace = make_trace(start, [0, 60, 120], [0, 4, 10], [0., 400., 1000.])
+
+    sliced, meters = slice_trace(trace, geometry,
+                                 start + timedelta(seconds=60), start + timedelta(seconds=120))
+    assert sliced == geometry[4:]
+    assert meters == 600.
+    # times between points are interpolated
+    sliced, meters = slice_trace(trace, geometry,
+                                 start + timedelta(seconds=30), start + timedelta(seconds=90))
+    assert sliced == geometry[2:8]
+    assert meters == 500.
+
+
+def test_trace_is_not_sliced_outside_its_match():
+    start = datetime(2021, 6, 26, 17, 0, 0)
+    geometry = [[x, 0] for x in range(11)]
+    trace = make_trace(start, [0, 60, 120, 180], [0, 4, 8, 10], [0., 400., 800., 1000.],
+                       uncertain=[(2, 3)])
+    # past the end of the match
+    assert slice_trace(trace, geometry, start, start + timedelta(seconds=240)) is None
+    # overlaps a part that wasn't matched confidently
+    assert slice_trace(trace, geometry, start, start + timedelta(seconds=150)) is None
+    assert slice_trace(trace, geometry, start, start + timedelta(seconds=120)) is not None
+    assert slice_trace(None, geometry, start, start + timedelta(seconds=60)) is None
+
+
+def test_traces_are_appended_with_offsets():
+    start = datetime(2021, 6, 26, 17, 0, 0)
+    trace = append_trace(empty_trace(), make_trace(start, [0, 60], [0, 4], [0., 400.]))
+    append_trace(trace, make_trace(start, [120, 180], [0, 3], [0., 300.], uncertain=[(0, 1)]),
+                 index_offset=4, meters_offset=400.)
+    assert trace['indices'] == [0, 4, 4, 7]
+    assert trace['meters'] == [0., 400., 400., 700.]
+    assert trace['uncertain'] == [[trace['times'][2], trace['times'][3]]]
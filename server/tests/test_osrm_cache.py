@@ -0,0 +1,113 @@
+# test_osrm_cache.py
+# tests the OSRM response cache in api.routing.cache. These don't need OSRM or the database.
+import time
+
+from api.routing.cache import LRUCache, ResponseCache, cache_key, quantize
+
+
+def test_quantized_keys_ignore_sub_precision_noise():
+    a = quantize([{'lat': 42.305414685979, 'lng': -71.112727353142}])
+    b = quantize([{'lat': 42.305414686001, 'lng': -71.112727352998}])
+    options = {'overview': 'full', 'geometries': 'geojson'}
+    assert cache_key('match', a, options) == cache_key('match', b, options)
+    # options order doesn't matter, but their values and the service do
+    assert cache_key('match', a, options) == cache_key(
+        'match', a, dict(reversed(list(options.items()))))
+    assert cache_key('match', a, options) != cache_key('route', a, options)
+    assert cache_key('match', a, options) != cache_key(
+        'match', a, dict(options, overview='simplified'))
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(max_entries=2)
+    lru.put('a', 1)
+    lru.put('b', 2)
+    assert lru.get('a') == 1
+    lru.put('c', 3)
+    assert lru.get('b') is None
+    assert lru.get('a') == 1
+    assert lru.get('c') == 3
+
+
+def test_lru_expires_entries():
+    lru = LRUCache(max_entries=2, ttl=0.01)
+    lru.put('a', 1)
+    time.sleep(0.02)
+    assert lru.get('a') is None
+
+
+def test_disk_tier_is_shared_between_caches(tmp_path):
+    path = str(tmp_path / 'osrm.sqlite')
+    res = {'code': 'Ok', 'matchings': [{'distance': 10.}]}
+    first = ResponseCache(path=path)
+    key = first.key('match', [(-71.1, 42.3)], {})
+    first.put(key, res)
+
+    # a second worker only sees the disk tier
+    second = ResponseCache(path=path)
+    assert second.get(key) == res
+    assert second.get(key) == res
+    assert second.counters['disk_hits'] == 1
+    assert second.counters['memory_hits'] == 1
+    assert second.get('missing') is None
+    assert second.stats()['misses'] == 1
+
+
+def test_disk_tier_evicts_over_max_entries(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / 'osrm.sqlite'),
+                          memory_entries=1, disk_entries=3)
+    for n in range(10):
+        cache.put(str(n), {'code': 'Ok', 'n': n})
+    cache.disk.purge()
+    assert len(cache.disk) == 3
+    assert cache.get('9') == {'code': 'Ok', 'n': 9}
+    assert cache.get('0') is None
+
+
+def test_changed_data_version_invalidates(tmp_path):
+    path = str(tmp_path / 'osrm.sqlite')
+    old = ResponseCache(path=path, data_version='2021-06')
+    old.put('a', {'code': 'Ok'})
+
+    new = ResponseCache(path=path, data_version='2021-07')
+    assert new.get('a') is None
+
+    # OSRM reporting a new version in a response also drops everything
+    new.put('b', {'code': 'Ok'})
+    new.put('c', {'code': 'Ok', 'data_version': '2021-08'})
+    assert new.get('b') is None
+    assert new.data_version == '2021-08'
+    assert new.counters['invalidations'] == 1
+
+
+def test_new_workers_adopt_the_reported_data_version(tmp_path):
+    path = str(tmp_path / 'osrm.sqlite')
+    coordinates = [(-71.1, 42.3)]
+    first = ResponseCache(path=path, data_version='us-latest')
+    # OSRM reports its own version, which replaces the configured one once
+    first.put(first.key('match', coordinates, {}), {'code': 'Ok', 'data_version': '20210701'})
+    res = {'code': 'Ok', 'data_version': '20210701'}
+    key = first.key('match', coordinates, {})
+    assert first.put(key, res) == key
+
+    # another worker, configured the same, keeps the disk tier
+    second = ResponseCache(path=path, data_version='us-latest')
+    assert second.key('match', coordinates, {}) == key
+    assert second.get(key) == res
+    assert second.put(key, res) == key
+    assert second.data_version == '20210701'
+    assert second.counters['invalidations'] == 0
+    assert len(second.disk) == 1
+
+
+def test_unusable_disk_tier_falls_back_to_memory(tmp_path):
+    # the cache's directory can't be created, as its parent is a file
+    (tmp_path / 'data').write_text('')
+    cache = ResponseCache(path=str(tmp_path / 'data' / 'cache' / 'osrm.sqlite'))
+    res = {'code': 'Ok'}
+    key = cache.key('match', [(-71.1, 42.3)], {})
+    assert cache.put(key, res) == key
+    assert cache.get(key) == res
+    assert cache.get('missing') is None
+    assert cache.counters['disk_errors'] == 1
+    assert cache.stats()['disk_entries'] == 0
@@ -0,0 +1,129 @@
+# test_osrm_client.py
+# tests the OSRM client's retries, deadlines and pool in api.routing.osrmapi, against a
+# stubbed session, so they don't need OSRM.
+import asyncio
+import threading
+import time
+import pytest
+import requests
+
+from api.controllers.errors import DeadlineExceededError
+from api.routing.cache import ResponseCache
+from api.routing.osrmapi import Deadline, OSRMClient
+
+COORDINATES = [{'lat': 42.3, 'lng': -71.1}, {'lat': 42.31, 'lng': -71.11}]
+
+
+class StubResponse(object):
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.body = body if body is not None else {'code': 'Ok', 'matchings': []}
+
+    def json(self):
+        return self.body
+
+
+class StubSession(object):
+    """Stands in for requests.Session: each post waits `delay` seconds, then returns or
+    raises the next of `results`, repeating the last one"""
+
+    def __init__(self, results, delay=0.):
+        self.results = list(results)
+        self.delay = delay
+        self.timeouts = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def post(self, url, params=None, timeout=None):
+        with self._lock:
+            self.timeouts.append(timeout)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        try:
+            time.sleep(self.delay)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def stub_client(results, delay=0., **kwargs):
+    kwargs.setdefault('backoff_factor', 0.01)
+    client = OSRMClient('http://osrm.test', **kwargs)
+    client.session = StubSession(results, delay)
+    return client
+
+
+def test_deadline_limits_request_timeouts():
+    assert Deadline().remaining() is None
+    assert Deadline().timeout(30.) == 30.
+    deadline = Deadline(1.)
+    assert 0 < deadline.timeout(30.) <= 1.
+    assert deadline.timeout(0.5) == 0.5
+    assert Deadline(0.).expired
+
+
+def test_retries_server_errors_then_succeeds():
+    client = stub_client([StubResponse(503), StubResponse(502), StubResponse()])
+    assert client.match(COORDINATES)['code'] == 'Ok'
+    assert len(client.session.timeouts) == 3
+
+
+def test_retries_stop_at_the_deadline():
+    client = stub_client([requests.exceptions.ConnectionError('refused')],
+                         max_retries=100, backoff_factor=0.05)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceededError):
+        client.match(COORDINATES, Deadline(0.3))
+    assert time.monotonic() - start < 0.3
+    assert 1 < len(client.session.timeouts) < 101
+    # no request is given longer than what's left of the deadline
+    assert all(t <= 0.3 for t in client.session.timeouts)
+
+
+def test_expired_deadline_makes_no_request():
+    client = stub_client([StubResponse()])
+    with pytest.raises(DeadlineExceededError):
+        client.match(COORDINATES, Deadline(0.))
+    assert client.session.timeouts == []
+
+
+def test_requests_errors_are_not_raised():
+    client = stub_client([requests.exceptions.ReadTimeout('slow')], max_retries=1)
+    with pytest.raises(DeadlineExceededError) as e:
+        client.match(COORDINATES)
+    assert not isinstance(e.value, requests.exceptions.RequestException)
+
+    client = stub_client([requests.exceptions.ConnectionError('refused')], max_retries=1)
+    with pytest.raises(ConnectionError) as e:
+        client.match(COORDINATES)
+    assert not isinstance(e.value, requests.exceptions.RequestException)
+    assert len(client.session.timeouts) == 2
+
+
+def test_async_requests_are_bounded_by_the_pool():
+    client = stub_client([StubResponse()], delay=0.05, pool_size=2)
+    adapter = OSRMClient('http://osrm.test', pool_size=2).session.get_adapter('http://osrm.test')
+    # a full pool blocks for a connection instead of opening more
+    assert adapter._pool_block and adapter._pool_maxsize == 2
+
+    async def match_all():
+        return await asyncio.gather(*[client.match_async(COORDINATES) for _ in range(8)])
+
+    results = asyncio.run(match_all())
+    assert [r['code'] for r in results] == ['Ok'] * 8
+    assert client.session.max_in_flight == 2
+
+
+def test_matches_without_a_usable_cache(tmp_path):
+    (tmp_path / 'data').write_text('')
+    cache = ResponseCache(path=str(tmp_path / 'data' / 'cache' / 'osrm.sqlite'))
+    client = stub_client([StubResponse()], cache=cache)
+    assert client.match(COORDINATES)['code'] == 'Ok'
+    # still cached in-process
+    assert client.match(COORDINATES)['code'] == 'Ok'
+    assert len(client.session.timeouts) == 1
+    assert cache.counters['disk_errors'] >= 1
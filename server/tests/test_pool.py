@@ -0,0 +1,33 @@
+# test_pool.py
+# the database engine's pool metrics and statement timeouts. See api/models/pool.py
+from sqlalchemy import text
+
+from api.models import db, use_statement_timeout
+from .utils import app, client, token
+
+
+def test_pool_metrics(app, client, token):
+    # only for whoever has the metrics token, not for users
+    assert client.get('/metrics/db_pool').status_code == 401
+    assert client.get('/metrics/db_pool', headers={'authorization': token}).status_code == 401
+    res = client.get('/metrics/db_pool',
+                     headers={'authorization': f"Bearer {app.config['METRICS_TOKEN']}"})
+    assert res.status_code == 200
+    metrics = res.get_json()
+    assert metrics['pool'] == 'InstrumentedQueuePool'
+    assert metrics['size'] == app.config['DB_POOL_SIZE']
+    assert metrics['max_overflow'] == app.config['DB_MAX_OVERFLOW']
+    # the token fixture logged in
+    assert metrics['checkouts'] >= 1
+    assert 0 <= metrics['utilization'] <= 1
+    assert metrics['max_wait_seconds'] >= metrics['mean_wait_seconds'] >= 0
+
+
+def test_statement_timeout_by_kind_of_work(app):
+    with app.test_request_context():
+        for kind, timeout in [(None, '0'), ('query', '10s'), ('mutation', '30s'),
+                              ('worker', '5min'), (None, '0')]:
+            use_statement_timeout(kind)
+            assert db.session.execute(text('SHOW statement_timeout')).scalar() == timeout
+            # it only lasts for the transaction
+            db.session.rollback()
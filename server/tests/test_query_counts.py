@@ -0,0 +1,197 @@
+# test_query_counts.py
+# counts the SQL statements our graphql queries make, so that relationships stay batched
+# and the cost of a query doesn't grow with the number of rows it returns.
+from datetime import datetime, timedelta
+from flask import request
+
+from api.models import db, Shift as ShiftModel, Job as JobModel
+from api.models.location import insert_locations
+from api.controllers.auth.utils import decode_jwt
+from .utils import app, client, count_queries, gqlClient, new_user_token, token
+
+SHIFTS_QUERY = '''{
+    allShifts {
+        edges { node {
+            id
+            locations { timestamp }
+            screenshots { id }
+            jobs { edges { node { id mileage startLocation screenshots { id } } } }
+        } }
+    }
+}'''
+
+USER_QUERY = '''{
+    getUserInfo {
+        shifts { edges { node { id jobs { edges { node { id } } } } } }
+    }
+}'''
+
+
+def add_shifts(user_id, n_shifts, n_jobs=2, n_locations=5):
+    start = datetime.now() - timedelta(days=1)
+    for n in range(n_shifts):
+        shift_start = start + timedelta(hours=n)
+        shift = ShiftModel(user_id=user_id, active=False, start_time=shift_start,
+                           end_time=shift_start + timedelta(minutes=50))
+        db.session.add(shift)
+        db.session.flush()
+        for _ in range(n_jobs):
+            db.session.add(JobModel(shift.id, user_id,
+                                    start_location={'lat': 42.3, 'lng': -71.1},
+                                    end_location={'lat': 42.4, 'lng': -71.0}))
+        insert_locations(shift.id, [{'timestamp': shift_start + timedelta(minutes=m),
+                                     'lat': 42.3, 'lng': -71.1, 'accuracy': 5}
+                                    for m in range(n_locations)])
+    db.session.commit()
+
+
+def run_query(gqlClient, token, query):
+    request.headers = {'authorization': token}
+    with count_queries() as statements:
+        res = gqlClient.execute(query, context_value=request)
+    assert 'errors' not in res, res
+    return res['data'], statements
+
+
+def test_all_shifts_query_count_does_not_grow_with_shifts(app, new_user_token, gqlClient):
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        add_shifts(user_id, 2)
+        data, few = run_query(gqlClient, new_user_token, SHIFTS_QUERY)
+        assert len(data['allShifts']['edges']) == 2
+
+        add_shifts(user_id, 6)
+        data, many = run_query(gqlClient, new_user_token, SHIFTS_QUERY)
+        shifts = [e['node'] for e in data['allShifts']['edges']]
+        assert len(shifts) == 8
+        assert all(len(s['jobs']['edges']) == 2 and len(s['locations']) == 5 for s in shifts)
+        assert len(many) == len(few)
+        # auth, the page of shifts, then one per relationship
+        assert len(many) <= 8
+
+
+def test_user_shifts_query_count_does_not_grow_with_shifts(app, new_user_token, gqlClient):
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        add_shifts(user_id, 2)
+        _, few = run_query(gqlClient, new_user_token, USER_QUERY)
+        add_shifts(user_id, 6)
+        data, many = run_query(gqlClient, new_user_token, USER_QUERY)
+        assert len(data['getUserInfo']['shifts']['edges']) == 8
+        assert len(many) == len(few)
+
+
+def shift_selects(statements):
+    return [s for s in statements if 'FROM shifts' in s and 'count(' not in s]
+
+
+def test_shift_list_only_loads_selected_columns(app, new_user_token, gqlClient):
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        add_shifts(user_id, 2)
+        _, statements = run_query(
+            gqlClient, new_user_token, '{ allShifts { edges { node { id startTime totalPay } } } }')
+        selects = shift_selects(statements)
+        assert len(selects) == 1
+        assert 'start_time' in selects[0]
+        assert 'snapped_polyline' not in selects[0]
+        assert 'snapped_trace' not in selects[0]
+        assert 'road_snapped_miles' not in selects[0]
+
+        _, statements = run_query(
+            gqlClient, new_user_token, '{ allShifts { edges { node { id snappedGeometry } } } }')
+        selects = shift_selects(statements)
+        assert 'snapped_polyline' in selects[0] and 'snapped_bbox' in selects[0]
+        assert 'snapped_trace' not in selects[0]
+
+
+def test_shift_status_loads_tasks_in_one_query(app, new_user_token, gqlClient):
+    query = '{ allShifts { edges { node { id status } } } }'
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        add_shifts(user_id, 2)
+        _, few = run_query(gqlClient, new_user_token, query)
+        add_shifts(user_id, 6)
+        data, many = run_query(gqlClient, new_user_token, query)
+        assert {e['node']['status'] for e in data['allShifts']['edges']} == {'DONE'}
+        assert len(many) == len(few)
+        assert len([s for s in many if 'FROM tasks' in s]) == 1
+
+
+JOBS_PAGE_QUERY = '''query jobs($after: String) {
+    allJobs(sort: START_TIME_DESC, first: 3, after: $after) {
+        pageInfo { endCursor hasNextPage }
+        edges { node { id startTime } }
+    }
+}'''
+
+
+def test_all_jobs_pages_by_keyset(app, new_user_token, gqlClient):
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        add_shifts(user_id, 4, n_locations=0)
+        request.headers = {'authorization': new_user_token}
+        ids, pages, after = [], [], None
+        while True:
+            with count_queries() as statements:
+                res = gqlClient.execute(JOBS_PAGE_QUERY, context_value=request,
+                                        variables={'after': after})
+            assert 'errors' not in res, res
+            page = res['data']['allJobs']
+            ids += [e['node']['id'] for e in page['edges']]
+            pages.append(statements)
+            after = page['pageInfo']['endCursor']
+            if not page['pageInfo']['hasNextPage']:
+                break
+
+        # every job once, newest first, in pages that cost the same and aren't counted
+        assert len(ids) == len(set(ids)) == 8
+        assert len(pages) == 3
+        assert len(set(len(p) for p in pages)) == 1
+        assert not any('count(' in s.lower() for p in pages for s in p)
+        assert not any('offset' in s.lower() for p in pages for s in p)
+
+
+def test_all_jobs_total_count_is_counted_if_selected(app, new_user_token, gqlClient):
+    with app.test_request_context():
+        add_shifts(decode_jwt(new_user_token)['payload'], 3, n_locations=0)
+        data, statements = run_query(gqlClient, new_user_token,
+                                     '{ allJobs(first: 2) { totalCount edges { node { id } } } }')
+        assert data['allJobs']['totalCount'] == 6
+        assert len(data['allJobs']['edges']) == 2
+        assert any('count(' in s.lower() for s in statements)
+
+
+def test_jobs_without_a_start_time_are_paged_last(app, new_user_token, gqlClient):
+    query = '''query jobs($after: String) {
+        allJobs(sort: %s, first: 2, after: $after) {
+            pageInfo { endCursor hasNextPage }
+            edges { node { id startTime } }
+        }
+    }'''
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        add_shifts(user_id, 3, n_locations=0)
+        unstarted = [id for id, in db.session.query(JobModel.id)
+                     .filter_by(user_id=user_id).limit(3)]
+        JobModel.query.filter(JobModel.id.in_(unstarted)).update(
+            {'start_time': None}, synchronize_session=False)
+        db.session.commit()
+
+        request.headers = {'authorization': new_user_token}
+        for sort in ('START_TIME_ASC', 'START_TIME_DESC'):
+            nodes, after = [], None
+            while True:
+                res = gqlClient.execute(query % sort, context_value=request,
+                                        variables={'after': after})
+                assert 'errors' not in res, res
+                page = res['data']['allJobs']
+                nodes += [e['node'] for e in page['edges']]
+                after = page['pageInfo']['endCursor']
+                if not page['pageInfo']['hasNextPage']:
+                    break
+            assert len({n['id'] for n in nodes}) == len(nodes) == 6
+            # sorted as if they started at the end of time
+            started = [n['startTime'] is not None for n in nodes]
+            assert started == ([True] * 3 + [False] * 3 if sort == 'START_TIME_ASC'
+                               else [False] * 3 + [True] * 3)
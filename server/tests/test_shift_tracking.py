@@ -15,7 +15,6 @@ from api import create_app, db
 from api.controllers.errors import custom_errors
 from api.controllers.auth.utils import create_jwt, decode_jwt, get_otp
 from api.models import User
-from api.models import engine as models_conn
 from flask_sqlalchemy import SQLAlchemy
 
 
@@ -107,6 +106,110 @@ def test_adding_locations_to_shift_is_ok_and_returns_geometry(app, token, locs,
         assert res['data']['addLocationsToShift']['ok']
 
 
+def test_adding_locations_updates_shift_counters(app, token, locs, active_shift, gqlClient):
+    from graphql_relay.node.node import from_global_id
+    from api.models import Shift
+    from api.routing.utils import load_location_arrays
+    with app.test_request_context():
+        half = len(locs) // 2
+        _ = add_locations_to_shift(token, locs.iloc[:half], active_shift, gqlClient)
+        res = add_locations_to_shift(token, locs.iloc[half:], active_shift, gqlClient,
+                                     start_n_mins_after_shift=60)
+        assert res['data']['addLocationsToShift']['ok']
+
+        shift_id = from_global_id(active_shift['id'])[1]
+        shift = Shift.query.get(shift_id)
+        arrays = load_location_arrays(shift_id)
+        assert shift.location_count == len(locs) == len(arrays['timestamp'])
+        assert shift.last_location_at == arrays['timestamp'][-1]
+
+
+def test_retried_location_uploads_are_not_duplicated(app, token, locs, active_shift, gqlClient):
+    from graphql_relay.node.node import from_global_id
+    from api.models import Shift
+    query = '''mutation AddLocations($ShiftId: ID!, $Locations: [LocationInput]!, $BatchId: String) {
+        addLocationsToShift(shiftId: $ShiftId, locations: $Locations, batchId: $BatchId) {
+            ok
+            newCount
+            duplicateCount
+        }
+    }'''
+    start = pd.to_datetime(active_shift['startTime'])
+    locations = [{'lat': l.lat, 'lng': l.lng, 'accuracy': 5,
+                  'timestamp': (start + timedelta(minutes=n)).timestamp() * 1000}
+                 for n, l in enumerate(locs.iloc[:20].itertuples())]
+    with app.test_request_context():
+        request.headers = {'authorization': token}
+
+        def upload(locations, batch_id=None):
+            res = gqlClient.execute(query, context_value=request, variables={
+                'ShiftId': active_shift['id'], 'Locations': locations, 'BatchId': batch_id})
+            return res['data']['addLocationsToShift']
+
+        res = upload(locations[:10], batch_id='batch-1')
+        assert (res['newCount'], res['duplicateCount']) == (10, 0)
+        # the same batch again is skipped as a whole
+        res = upload(locations[:10], batch_id='batch-1')
+        assert res['ok'] and (res['newCount'], res['duplicateCount']) == (0, 10)
+        # without a batch id, points already in the shift are skipped one by one
+        res = upload(locations[5:])
+        assert (res['newCount'], res['duplicateCount']) == (10, 5)
+
+        shift = Shift.query.get(from_global_id(active_shift['id'])[1])
+        assert shift.location_count == 20
+
+
+def test_loads_shift_locations_as_sorted_arrays(app, token, locs, active_shift, gqlClient):
+    from graphql_relay.node.node import from_global_id
+    from api.routing.utils import load_location_arrays
+    with app.test_request_context():
+        _ = add_locations_to_shift(token, locs, active_shift, gqlClient)
+        shift_id = from_global_id(active_shift['id'])[1]
+        arrays = load_location_arrays(shift_id)
+        assert len(arrays['lat']) == len(locs)
+        assert (arrays['timestamp'][1:] >= arrays['timestamp'][:-1]).all()
+        assert set(arrays['lat'].round(6)) == set(locs.lat.round(6))
+
+        # time ranges are inclusive
+        start, end = arrays['timestamp'][10], arrays['timestamp'][20]
+        ranged = load_location_arrays(shift_id, start, end)
+        assert ranged['timestamp'][0] == start and ranged['timestamp'][-1] == end
+
+
+def test_ending_a_shift_queues_its_processing(app, token, locs, active_shift, gqlClient, monkeypatch):
+    from graphql_relay.node.node import from_global_id
+    from config import TestingConfig
+    from api import worker
+    from api.models import Job, Shift, Task, TaskKind, TaskStatus
+    monkeypatch.setattr(TestingConfig, 'TASK_QUEUE_EAGER', False)
+    with app.test_request_context():
+        _ = add_locations_to_shift(token, locs, active_shift, gqlClient)
+        res = end_shift(token, active_shift, gqlClient)
+        assert res['data']['endShift']['shift']['status'] == 'QUEUED'
+        assert res['data']['endShift']['shift']['jobs']['edges'] == []
+
+        shift = Shift.query.get(from_global_id(active_shift['id'])[1])
+        task = worker.claim_task()
+        assert task.kind == TaskKind.MATCH_SHIFT
+        assert shift.processing_status == 'MATCHING'
+        # jobs aren't extracted until the shift has been matched
+        assert worker.claim_task() is None
+
+        assert worker.run_task(task)
+        assert shift.processing_status == 'EXTRACTING_JOBS'
+        assert worker.work(burst=True) == 1
+        assert shift.processing_status == 'DONE'
+        assert len(shift.jobs) == 2
+
+        # running extraction again, as when a task is retried after its jobs were
+        # committed, doesn't add them twice
+        db.session.add(Task(kind=TaskKind.EXTRACT_JOBS, shift_id=shift.id,
+                            status=TaskStatus.QUEUED, attempts=0, run_after=datetime.now()))
+        db.session.commit()
+        assert worker.work(burst=True) == 1
+        assert Job.query.filter_by(shift_id=shift.id).count() == 2
+
+
 def test_extracts_two_jobs_from_example_shift(app, token, locs, active_shift, gqlClient):
     import numpy as np
     with app.test_request_context():
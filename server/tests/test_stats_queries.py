@@ -5,13 +5,12 @@ import jwt
 import pandas as pd
 from datetime import datetime, timedelta
 from flask import current_app, request
-from .utils import ApiTestCase, add_locations_to_shift, add_pay_to_job, add_tip_to_job, app, client, end_shift, gqlClient, token, locs, exodus_locs, active_shift
+from .utils import ApiTestCase, add_locations_to_shift, add_pay_to_job, add_tip_to_job, app, client, count_queries, end_shift, gqlClient, new_user_token, token, locs, exodus_locs, active_shift
 
 from api import create_app, db
 from api.controllers.errors import custom_errors
 from api.controllers.auth.utils import create_jwt, decode_jwt, get_otp
-from api.models import User
-from api.models import engine as models_conn
+from api.models import EmployerNames, User, Shift as ShiftModel, Job as JobModel, UserDailyStats, rebuild_daily_stats
 from flask_sqlalchemy import SQLAlchemy
 
 
@@ -51,3 +50,208 @@ def test_net_pay_from_just_added_jobs(app, token, locs, exodus_locs, active_shif
         res = gqlClient.execute(query, context_value=request)
         print("res:", res)
         assert res['data']['getNetPay']['pay'] == sum(filter(None, pays))
+
+
+def add_day_of_work(user_id, day):
+    """adds a two-hour shift with two paid jobs at noon on `day`"""
+    noon = datetime(day.year, day.month, day.day, 12)
+    shift = ShiftModel(user_id=user_id, active=False,
+                       start_time=noon, end_time=noon + timedelta(hours=2))
+    db.session.add(shift)
+    db.session.flush()
+    for start, minutes, pay, tip, miles in [(10, 30, 10.12, 5.20, 3.0),
+                                            (60, 25, 7.50, 3.00, 2.5)]:
+        job = JobModel(shift.id, user_id)
+        job.start_time = noon + timedelta(minutes=start)
+        job.end_time = job.start_time + timedelta(minutes=minutes)
+        job.total_pay, job.tip, job.mileage = pay, tip, miles
+        db.session.add(job)
+    db.session.commit()
+
+
+def test_daily_stats_are_summed_by_day(app, new_user_token, gqlClient):
+    query = """query getDailyStats($start: DateTime, $end: DateTime) {
+        getDailyStats(startDate: $start, endDate: $end) {
+            nDays
+            data { date basePay tip expenses mileage activeTime clockedInTime hourlyPay hourlyPayActive }
+        }
+    }
+    """
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        worked = datetime.now().date() - timedelta(days=3)
+        add_day_of_work(user_id, worked)
+        start = datetime(worked.year, worked.month, worked.day) - timedelta(days=1)
+
+        request.headers = {'authorization': new_user_token}
+        with count_queries() as statements:
+            res = gqlClient.execute(query, context_value=request, variables={
+                'start': start.isoformat(), 'end': (start + timedelta(days=2)).isoformat()})
+        stats = res['data']['getDailyStats']
+        assert stats['nDays'] == 3
+        before, day, after = stats['data']
+        assert before['basePay'] == 0 and after['basePay'] == 0
+        assert day['basePay'] == pytest.approx(17.62)
+        assert day['tip'] == pytest.approx(8.2)
+        assert day['mileage'] == pytest.approx(5.5)
+        assert day['expenses'] == pytest.approx(5.5 * 0.56)
+        assert day['activeTime'] == pytest.approx(55 / 60)
+        assert day['clockedInTime'] == pytest.approx(2)
+        assert day['hourlyPay'] == pytest.approx((17.62 + 8.2 - 5.5 * 0.56) / 2)
+        n_statements = len(statements)
+
+        # a longer range is still a single query
+        with count_queries() as statements:
+            res = gqlClient.execute(query, context_value=request, variables={
+                'start': (start - timedelta(days=60)).isoformat(),
+                'end': (start + timedelta(days=2)).isoformat()})
+        assert res['data']['getDailyStats']['nDays'] == 63
+        assert len(statements) == n_statements
+
+
+def test_working_time_is_summed_by_day(app, new_user_token, gqlClient):
+    query = """query getWorkingTime($start: DateTime) {
+        getWorkingTime(startDate: $start) {
+            clockedInTime
+            jobTime
+            shiftHoursDaily { date hrs }
+            jobHoursDaily { date hrs }
+        }
+    }
+    """
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        worked = datetime.now().date() - timedelta(days=3)
+        add_day_of_work(user_id, worked)
+        add_day_of_work(user_id, worked + timedelta(days=1))
+
+        request.headers = {'authorization': new_user_token}
+        res = gqlClient.execute(query, context_value=request, variables={
+            'start': (datetime.now() - timedelta(days=5)).isoformat()})
+        working = res['data']['getWorkingTime']
+        assert working['clockedInTime'] == pytest.approx(4)
+        assert working['jobTime'] == pytest.approx(110 / 60)
+        assert [d['hrs'] for d in working['shiftHoursDaily']] == pytest.approx([2, 2])
+        assert [d['hrs'] for d in working['jobHoursDaily']] == pytest.approx([55 / 60, 55 / 60])
+
+
+def daily_stats(user_id):
+    rows = (UserDailyStats.query.filter_by(user_id=user_id)
+            .order_by(UserDailyStats.local_date, UserDailyStats.employer))
+    return [(r.local_date, r.employer, round(r.pay, 2), round(r.tip, 2), r.mileage,
+             r.job_seconds, r.n_jobs, r.shift_seconds, r.n_shifts) for r in rows]
+
+
+def test_daily_stats_rollup_follows_changes(app, new_user_token):
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        worked = datetime.now().date() - timedelta(days=3)
+        add_day_of_work(user_id, worked)
+        assert daily_stats(user_id) == [(worked, '', 17.62, 8.2, 5.5, 55 * 60, 2, 2 * 3600, 1)]
+
+        jobs = JobModel.query.filter_by(user_id=user_id).order_by(JobModel.start_time).all()
+        jobs[0].total_pay = 20.
+        db.session.commit()
+        assert daily_stats(user_id)[0][2] == 27.5
+
+        # a day's rows for employers it no longer has are dropped
+        jobs[0].employer = EmployerNames.DOORDASH
+        db.session.commit()
+        assert [r[1] for r in daily_stats(user_id)] == ['', 'DOORDASH']
+        jobs[0].employer = None
+        db.session.commit()
+        assert [r[1] for r in daily_stats(user_id)] == ['']
+
+        # tracking a shift's locations doesn't refresh the rollup
+        shift = ShiftModel.query.filter_by(user_id=user_id).one()
+        shift.location_count += 5
+        shift.last_location_at = datetime.now()
+        with count_queries() as statements:
+            db.session.commit()
+        assert not [s for s in statements if 'user_daily_stats' in s]
+
+        # moving a job to another day refreshes both days
+        jobs[1].start_time -= timedelta(days=1)
+        jobs[1].end_time -= timedelta(days=1)
+        db.session.commit()
+        before, day = daily_stats(user_id)
+        assert before[0] == worked - timedelta(days=1) and before[2] == 7.5
+        assert day[2] == 20.
+
+        # rebuilding from scratch gives the same rows
+        kept = daily_stats(user_id)
+        rebuild_daily_stats(user_id)
+        db.session.commit()
+        assert daily_stats(user_id) == kept
+
+        db.session.delete(ShiftModel.query.filter_by(user_id=user_id).one())
+        db.session.commit()
+        assert sum(r[-1] for r in daily_stats(user_id)) == 0
+
+
+def test_weekly_summary_series(app, new_user_token, gqlClient):
+    import pendulum
+    query = """query getWeeklySummary($weeks: Int) {
+        getWeeklySummary(weeks: $weeks) {
+            weekStart numJobs numShifts totalPay meanPay meanTips
+            series { weekStart numJobs numShifts totalPay totalTips meanPay miles }
+        }
+    }
+    """
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        this_week = pendulum.now().start_of('week').date()
+        add_day_of_work(user_id, this_week)
+        add_day_of_work(user_id, this_week - timedelta(weeks=2))
+        add_day_of_work(user_id, this_week - timedelta(weeks=2, days=-1))
+
+        request.headers = {'authorization': new_user_token}
+        with count_queries() as statements:
+            res = gqlClient.execute(query, context_value=request, variables={'weeks': 3})
+        summary = res['data']['getWeeklySummary']
+        assert summary['weekStart'] == this_week.isoformat()
+        assert summary['numJobs'] == 2 and summary['numShifts'] == 1
+        assert summary['totalPay'] == pytest.approx(17.62)
+        assert summary['meanPay'] == pytest.approx(17.62 / 2)
+        assert summary['meanTips'] == pytest.approx(8.2 / 2)
+
+        two_ago, last, this = summary['series']
+        assert two_ago['weekStart'] == (this_week - timedelta(weeks=2)).isoformat()
+        assert two_ago['numJobs'] == 4 and two_ago['numShifts'] == 2
+        assert two_ago['miles'] == pytest.approx(11)
+        assert last['numJobs'] == 0 and last['totalPay'] == 0 and last['meanPay'] == 0
+        assert this['totalPay'] == summary['totalPay']
+        # the whole series is one query, after authentication
+        assert len([s for s in statements if 'user_daily_stats' in s]) == 1
+
+
+def test_dashboard_stats_share_one_query(app, new_user_token, gqlClient):
+    from flask import g
+    query = """query dashboard($start: DateTime, $end: DateTime, $weekStart: DateTime) {
+        getNetPay(startDate: $weekStart, endDate: $end) { pay tip mileageDeduction }
+        getWorkingTime(startDate: $weekStart, endDate: $end) { clockedInTime jobTime }
+        getDailyStats(startDate: $start, endDate: $end) { nDays data { basePay } }
+        getWeeklySummary { totalPay }
+    }
+    """
+    with app.test_request_context():
+        user_id = decode_jwt(new_user_token)['payload']
+        worked = datetime.now().date() - timedelta(days=1)
+        add_day_of_work(user_id, worked)
+        start = datetime(worked.year, worked.month, worked.day) - timedelta(days=10)
+
+        request.headers = {'authorization': new_user_token}
+        with count_queries() as statements:
+            res = gqlClient.execute(query, context_value=request, variables={
+                'start': start.isoformat(),
+                'weekStart': (start + timedelta(days=5)).isoformat(),
+                'end': datetime.now().isoformat()})
+        assert 'errors' not in res, res
+        assert res['data']['getNetPay']['pay'] == pytest.approx(17.62)
+        assert res['data']['getWorkingTime']['clockedInTime'] == pytest.approx(2)
+        assert sum(d['basePay'] for d in res['data']['getDailyStats']['data']) == pytest.approx(17.62)
+
+        # the first resolver loads every range in the operation, the rest slice it
+        assert len([s for s in statements if 'user_daily_stats' in s]) == 1
+        assert g._daily_stats_cache.misses == 1
+        assert g._daily_stats_cache.hits == 3
@@ -4,12 +4,15 @@ import pytest
 
 from flask import current_app, request
 import pandas as pd
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from sqlalchemy import event
 from graphene.test import Client
 from api import create_app, db
 from api.schema import schema
 from api.controllers.auth.utils import create_jwt
 from api.controllers.auth.utils import create_jwt, decode_jwt, get_otp
+from api.controllers.auth.cache import clear_auth_caches, known_users
 
 
 class ApiTestCase(unittest.TestCase):
@@ -20,12 +23,27 @@ class ApiTestCase(unittest.TestCase):
         self.client = self.app.test_client()
         self.gqlClient = Client(schema)
 
+        clear_auth_caches()
         with self.app.app_context():
             db.session.close()
             db.drop_all()
             db.create_all()
 
 
+@contextmanager
+def count_queries():
+    """Collects the SQL statements run while it's open, in a list"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
 @pytest.fixture
 def app():
     return create_app()
@@ -53,6 +71,21 @@ def token(app, client):
         return obj['token']
 
 
+@pytest.fixture
+def new_user_token(app, token):
+    """returns a valid token for a new user with no shifts or jobs, for tests that
+    count or sum a user's records"""
+    from uuid import uuid4
+    from api.models import User
+    with app.app_context():
+        user_id = str(uuid4())
+        db.session.add(User(user_id))
+        db.session.commit()
+        # as if they'd been authenticated before, so counted queries don't include it
+        known_users.set(user_id, True)
+        return create_jwt(user_id)
+
+
 @pytest.fixture
 def active_shift(app, token, gqlClient):
     """returns the currently active shift if it exists"""
@@ -161,6 +194,7 @@ def end_shift(token, active_shift, gqlClient):
                 endTime
                 startTime
                 roadSnappedMiles
+                status
                 jobs {
                     edges {
                         node {